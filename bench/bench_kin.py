@@ -0,0 +1,320 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+""" Micro-benchmarks of the kinematics and joint coupling hot paths.
+
+Each benchmark reports its throughput, as the number of processed items (poses,
+angles,...) per second, and the memory allocated while running it. The allocations are
+traced by ``tracemalloc`` when the interpreter provides it (Python 3). Otherwise (Python 2),
+they are estimated from the growth of the process maximum resident set size and of the
+number of objects tracked by the garbage collector, which gives coarser figures : the peak
+only accounts for the memory beyond the previous maximum, and the leaked objects count
+ignores the non-container ones (numbers, strings, numpy arrays).
+
+The throughputs of the vectorized functions are also reported relative to the ones of
+loops calling their scalar counterparts (e.g. ``ik_batch`` versus ``ik_loop``).
+
+Results can be saved as a baseline, and later runs checked against it, a run being
+considered as failed if one of the throughputs drops by more than a given tolerance::
+
+    $ python bench/bench_kin.py --save-baseline
+    ... (modifications) ...
+    $ python bench/bench_kin.py --check
+
+Baselines depend on the machine they have been produced on, and are thus not
+supposed to be shared.
+"""
+
+from __future__ import print_function
+
+import argparse
+import gc
+import json
+import os
+import sys
+import timeit
+
+import numpy as np
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+from pybot.youpi2.kin import Kinematics
+from pybot.youpi2.model import YoupiArm
+
+__author__ = 'Eric Pascual'
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+DEFAULT_TOLERANCE = 0.2
+BATCH_SIZE = 1000
+
+
+def _benchmarks():
+    """ Returns the benchmarks, as a list of tuples (name, function, items processed per call). """
+    kin = Kinematics()
+    rng = np.random.RandomState(0)
+
+    lo, hi = Kinematics.joint_limits()
+    poses = rng.uniform(lo, hi, (BATCH_SIZE, 4))
+    goals = kin.dk_batch(poses)
+    goals[:, 1] = -goals[:, 1]      # dk and ik Y axis are opposite
+    pitches = poses[:, 1] + poses[:, 2] + poses[:, 3] - 90
+    goal = tuple(goals[0]) + (pitches[0],)
+    pose = poses[0].tolist()
+    pose_list = poses.tolist()
+    # the scalar loop is run on the goals ik solves, so that it does not measure its error path
+    solved = kin.ik_batch(goals[:, 0], goals[:, 1], goals[:, 2], pitches)[1] == Kinematics.IK_OK
+    goal_list = goals[solved].tolist()
+    pitch_list = pitches[solved].tolist()
+
+    full_poses = rng.uniform(-90, 90, (BATCH_SIZE, YoupiArm.MOTORS_COUNT))
+    angles = dict(enumerate(full_poses[0]))
+    angles_list = [dict(enumerate(a)) for a in full_poses.tolist()]
+    global_angles = full_poses[0].tolist()
+    global_angles_list = full_poses.tolist()
+
+    motor_poses = YoupiArm.joint_to_motor_batch(full_poses)
+
+    settings = YoupiArm.settings[YoupiArm.MOTOR_SHOULDER]
+    degrees = full_poses[:, 0].tolist()
+
+    def ik():
+        kin.ik(*goal)
+
+    def ik_batch():
+        kin.ik_batch(goals[:, 0], goals[:, 1], goals[:, 2], pitches)
+
+    def ik_loop():
+        for (x, y, z), p in zip(goal_list, pitch_list):
+            kin.ik(x, y, z, p)
+
+    def dk():
+        kin.dk(pose)
+
+    def dk_batch():
+        kin.dk_batch(poses)
+
+    def dk_loop():
+        for p in pose_list:
+            kin.dk(p)
+
+    def joint_to_motor():
+        YoupiArm.joint_to_motor(dict(angles))
+
+    def joint_to_motor_loop():
+        for a in angles_list:
+            YoupiArm.joint_to_motor(dict(a))
+
+    def motor_to_joint():
+        YoupiArm.motor_to_joint(dict(angles))
+
+    def motor_to_joint_loop():
+        for a in angles_list:
+            YoupiArm.motor_to_joint(dict(a))
+
+    def joint_to_motor_batch():
+        YoupiArm.joint_to_motor_batch(full_poses)
+
+    def motor_to_joint_batch():
+        YoupiArm.motor_to_joint_batch(motor_poses)
+
+    def global_to_local():
+        YoupiArm.global_to_local(global_angles)
+
+    def global_to_local_loop():
+        for a in global_angles_list:
+            YoupiArm.global_to_local(a)
+
+    def degrees_to_steps():
+        settings.degrees_to_steps(degrees[0])
+
+    def degrees_to_steps_loop():
+        for d in degrees:
+            settings.degrees_to_steps(d)
+
+    return [
+        ('ik', ik, 1),
+        ('ik_batch', ik_batch, BATCH_SIZE),
+        ('ik_loop', ik_loop, len(goal_list)),
+        ('dk', dk, 1),
+        ('dk_loop', dk_loop, BATCH_SIZE),
+        ('dk_batch', dk_batch, BATCH_SIZE),
+        ('joint_to_motor', joint_to_motor, 1),
+        ('joint_to_motor_loop', joint_to_motor_loop, BATCH_SIZE),
+        ('motor_to_joint', motor_to_joint, 1),
+        ('motor_to_joint_loop', motor_to_joint_loop, BATCH_SIZE),
+        ('joint_to_motor_batch', joint_to_motor_batch, BATCH_SIZE),
+        ('motor_to_joint_batch', motor_to_joint_batch, BATCH_SIZE),
+        ('global_to_local', global_to_local, 1),
+        ('global_to_local_loop', global_to_local_loop, BATCH_SIZE),
+        ('degrees_to_steps', degrees_to_steps, 1),
+        ('degrees_to_steps_loop', degrees_to_steps_loop, BATCH_SIZE),
+    ]
+
+
+def _allocations(func, number):
+    """ Returns the peak memory (bytes) allocated by a call of the function, and the number of
+    memory blocks still allocated after it (the average over ``number`` calls), estimated by
+    :py:func:`_estimated_allocations` if ``tracemalloc`` is not available.
+    """
+    if tracemalloc is None:
+        return _estimated_allocations(func, number)
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        func()      # warm-up, so that caches and lazy initializations are not accounted
+        tracemalloc.clear_traces()
+        before = sum(s.count for s in tracemalloc.take_snapshot().statistics('filename'))
+        base, _ = tracemalloc.get_traced_memory()
+        for _ in range(number):
+            func()
+        _, peak = tracemalloc.get_traced_memory()
+        after = sum(s.count for s in tracemalloc.take_snapshot().statistics('filename'))
+    finally:
+        tracemalloc.stop()
+    return max(peak - base, 0), (after - before) / float(number)
+
+
+def _max_rss():
+    """ Returns the maximum resident set size (bytes) of the process, or None if not available. """
+    if resource is None:
+        return None
+    # the value is given in kilobytes, except on macOS
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == 'darwin' else 1024)
+
+
+def _estimated_allocations(func, number):
+    """ Fallback of :py:func:`_allocations` for interpreters without ``tracemalloc``.
+
+    The peak is estimated by the growth of the maximum resident set size, and the blocks by
+    the growth of the number of objects tracked by the garbage collector.
+    """
+    func()      # warm-up, so that caches and lazy initializations are not accounted
+    gc.collect()
+    before = len(gc.get_objects())
+    rss = _max_rss()
+    for _ in range(number):
+        func()
+    peak = None if rss is None else max(_max_rss() - rss, 0)
+    gc.collect()
+    after = len(gc.get_objects())
+    return peak, (after - before) / float(number)
+
+
+def run(min_time=0.2, repeat=5, selection=None):
+    """ Runs the benchmarks.
+
+    :param float min_time: the minimal duration of a timing run (s)
+    :param int repeat: the number of timing runs, the best one being retained
+    :param selection: optional list of the names of the benchmarks to be run
+    :return: the results, keyed by benchmark name
+    :rtype: dict
+    """
+    results = {}
+    for name, func, items in _benchmarks():
+        if selection and name not in selection:
+            continue
+
+        timer = timeit.Timer(func)
+        number = 1
+        while timer.timeit(number) < min_time:
+            number *= 2
+        best = min(timer.repeat(repeat, number)) / number
+
+        peak, blocks = _allocations(func, min(number, 100))
+        results[name] = {
+            'items_per_sec': items / best,
+            'calls_per_sec': 1 / best,
+            'peak_bytes': peak,
+            'leaked_blocks': blocks,
+        }
+    return results
+
+
+def check(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    """ Compares results with a baseline.
+
+    :return: the list of (name, current, reference) throughputs of the regressed benchmarks
+    :rtype: list
+    """
+    regressions = []
+    for name, result in sorted(results.items()):
+        try:
+            reference = baseline[name]['items_per_sec']
+        except KeyError:
+            continue
+        if result['items_per_sec'] < reference * (1 - tolerance):
+            regressions.append((name, result['items_per_sec'], reference))
+    return regressions
+
+
+def report(results, baseline=None):
+    if tracemalloc is None:
+        print('(no tracemalloc: allocations estimated from the max RSS and the GC tracked objects)')
+    print('%-24s %14s %14s %12s %10s %8s' % ('benchmark', 'items/s', 'calls/s', 'peak alloc', 'leaked', 'ratio'))
+    for name, r in sorted(results.items()):
+        ratio = ''
+        if baseline and name in baseline:
+            ratio = '%.2f' % (r['items_per_sec'] / baseline[name]['items_per_sec'])
+        print('%-24s %14.0f %14.0f %12s %10s %8s' % (
+            name, r['items_per_sec'], r['calls_per_sec'],
+            'n/a' if r['peak_bytes'] is None else '%dB' % r['peak_bytes'],
+            'n/a' if r['leaked_blocks'] is None else '%.1f' % r['leaked_blocks'],
+            ratio
+        ))
+
+    # speedup of the vectorized versions over the loops calling the scalar ones
+    for name, r in sorted(results.items()):
+        if name.endswith('_batch') and name[:-6] + '_loop' in results:
+            loop = name[:-6] + '_loop'
+            print('%s / %s: %.0fx' % (name, loop, r['items_per_sec'] / results[loop]['items_per_sec']))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Kinematics micro-benchmarks')
+    parser.add_argument('-b', '--baseline', default=DEFAULT_BASELINE, help='baseline file path')
+    parser.add_argument('--save-baseline', action='store_true', help='save the results as the new baseline')
+    parser.add_argument('--check', action='store_true', help='fail if slower than the baseline')
+    parser.add_argument('-t', '--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help='accepted throughput drop, as a fraction of the baseline')
+    parser.add_argument('--min-time', type=float, default=0.2, help='minimal duration of a timing run (s)')
+    parser.add_argument('--repeat', type=int, default=5, help='number of timing runs')
+    parser.add_argument('benchmarks', nargs='*', help='names of the benchmarks to run (default: all)')
+    args = parser.parse_args(argv)
+
+    results = run(args.min_time, args.repeat, args.benchmarks)
+
+    baseline = None
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as fp:
+            baseline = json.load(fp)
+    elif args.check:
+        print('baseline not found (%s)' % args.baseline, file=sys.stderr)
+        return 2
+
+    report(results, baseline)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as fp:
+            json.dump(results, fp, indent=4, sort_keys=True)
+        print('baseline saved to %s' % args.baseline)
+
+    if args.check:
+        regressions = check(results, baseline, args.tolerance)
+        for name, current, reference in regressions:
+            print('REGRESSION %s: %.0f items/s (baseline %.0f)' % (name, current, reference), file=sys.stderr)
+        return 1 if regressions else 0
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -13,7 +13,7 @@ setup(
     license='',
     author='Eric Pascual',
     author_email='eric@pobot.org',
-    install_requires=['pybot-core', 'pybot-dspin', 'pybot-lcd-fuse>=0.20.1'],
+    install_requires=['pybot-core', 'pybot-dspin', 'pybot-lcd-fuse>=0.20.1', 'numpy'],
     download_url='https://github.com/Pobot/PyBot',
     description='Youpi2 arm shared library',
     entry_points={
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+
+""" Calibration of the kinematic model parameters.
+
+The nominal dimensions of the arm (see :py:class:`pybot.youpi2.kin.Kinematics`) and the
+offsets of the joint optical indexes (see :py:attr:`pybot.youpi2.model.YoupiArm.index_offsets`)
+can be fitted on a set of samples, each one being made of the joint positions reported by the
+arm and the corresponding gripper end position, measured by an external mean.
+
+The fit is done by a Gauss-Newton least squares minimization of the position errors, the
+direct kinematics being evaluated for all the samples at once.
+
+The fitted model is stored as a JSON file, which can be loaded by
+:py:meth:`pybot.youpi2.kin.Kinematics.apply_calibration` and
+:py:meth:`pybot.youpi2.model.YoupiArm.apply_calibration`. Its content is a dictionary with
+the following items :
+
+* ``kinematics`` : the dimensions of the arm, keyed by the name of the
+  :py:class:`pybot.youpi2.kin.Kinematics` attributes
+* ``index_offsets`` : the index offsets, keyed by the joint names
+* ``rms_error``, ``max_error`` and ``samples`` : information about the fit quality
+"""
+
+import json
+import os
+
+import numpy as np
+
+__author__ = 'Eric Pascual'
+
+#: default location of the calibration file
+DEFAULT_PATH = '/etc/youpi2/calibration.json'
+
+#: the fitted dimensions of the arm
+KINEMATIC_PARAMETERS = ('L_SEGMENT', 'L_GRIPPER', 'Z_SHOULDER', 'X_OFFSET_FROM_ROTATION_AXIS')
+#: the joints which index offsets are fitted (the hand rotation has no effect on the position)
+FITTED_JOINTS = ('base', 'shoulder', 'elbow', 'wrist')
+
+
+def load_calibration(path=DEFAULT_PATH):
+    """ Loads a calibration file.
+
+    :param str path: the path of the file
+    :return: the calibration data
+    :rtype: dict
+    :raise IOError: if the file cannot be read
+    :raise ValueError: if the file content is invalid
+    """
+    with open(path) as fp:
+        data = json.load(fp)
+    if not isinstance(data, dict) or not set(data).intersection(('kinematics', 'index_offsets')):
+        raise ValueError('invalid calibration file (%s)' % path)
+    return data
+
+
+def default_calibration():
+    """ Returns the path of the default calibration file if it exists, None otherwise.
+
+    Used to apply the calibration at startup when none is explicitly provided.
+    """
+    return DEFAULT_PATH if os.path.exists(DEFAULT_PATH) else None
+
+
+def save_calibration(data, path=DEFAULT_PATH):
+    """ Saves calibration data, as returned by :py:func:`fit`.
+
+    :param dict data: the calibration data
+    :param str path: the path of the file
+    """
+    dir_path = os.path.dirname(path)
+    if dir_path and not os.path.isdir(dir_path):
+        os.makedirs(dir_path)
+    with open(path, 'w') as fp:
+        json.dump(data, fp, indent=4, sort_keys=True)
+
+
+def fit(poses, positions, kin=None, index_offsets=None, max_iterations=50, tolerance=1e-6):
+    """ Fits the kinematic model parameters on a set of samples.
+
+    The positions must be expressed in the frame used by
+    :py:meth:`pybot.youpi2.kin.Kinematics.dk`.
+
+    :param poses: the (N, 4+) array of the joint positions reported by the arm for each sample
+    :param positions: the (N, 3) array of the corresponding measured gripper end positions
+    :param kin: the kinematics model providing the initial values of the dimensions (default:
+                the nominal ones)
+    :param dict index_offsets: the index offsets used when the samples have been recorded, keyed
+                               by motor id (default: the nominal ones)
+    :param int max_iterations: the maximum number of iterations
+    :param float tolerance: the convergence threshold on the parameters variation
+    :return: the calibration data
+    :rtype: dict
+    :raise ValueError: if the samples are inconsistent or not enough to fit the parameters
+    """
+    from .kin import Kinematics
+    from .model import YoupiArm
+
+    poses = np.asarray(poses, dtype=float)[:, :4]
+    positions = np.asarray(positions, dtype=float)
+    if poses.ndim != 2 or poses.shape[1] != 4 or positions.shape != (len(poses), 3):
+        raise ValueError('poses and positions must be (N, 4+) and (N, 3) arrays')
+
+    params_count = len(KINEMATIC_PARAMETERS) + len(FITTED_JOINTS)
+    if 3 * len(poses) < 2 * params_count:
+        raise ValueError('not enough samples (at least %d required)' % -(-2 * params_count // 3))
+
+    model = Kinematics()
+    kin = kin or model
+    params = np.array([getattr(kin, p) for p in KINEMATIC_PARAMETERS] + [0.] * len(FITTED_JOINTS), dtype=float)
+
+    def residuals(p):
+        for name, value in zip(KINEMATIC_PARAMETERS, p):
+            setattr(model, name, value)
+        return (model.dk_batch(poses + p[len(KINEMATIC_PARAMETERS):]) - positions).ravel()
+
+    # finite differences steps, in mm and degrees
+    steps = np.full(params_count, 1e-4)
+    for _ in range(max_iterations):
+        r = residuals(params)
+        jac = np.empty((len(r), params_count))
+        for i, h in enumerate(steps):
+            dp = np.zeros(params_count)
+            dp[i] = h
+            jac[:, i] = (residuals(params + dp) - residuals(params - dp)) / (2 * h)
+
+        delta = np.linalg.lstsq(jac, -r, rcond=None)[0]
+
+        # step halving to ensure the error decreases
+        cost = r.dot(r)
+        while True:
+            r_new = residuals(params + delta)
+            if r_new.dot(r_new) <= cost or np.abs(delta).max() < tolerance:
+                break
+            delta /= 2
+        params += delta
+        if np.abs(delta).max() < tolerance:
+            break
+
+    errors = np.linalg.norm(residuals(params).reshape(-1, 3), axis=1)
+
+    if index_offsets is None:
+        index_offsets = YoupiArm.index_offsets
+    # the fitted angle corrections are such as true angle = reported angle + correction, which
+    # means that the index offsets must be corrected the other way
+    corrections = params[len(KINEMATIC_PARAMETERS):]
+    return {
+        'kinematics': {name: float(v) for name, v in zip(KINEMATIC_PARAMETERS, params)},
+        'index_offsets': {
+            name: float(index_offsets.get(YoupiArm.motor_id(name), 0) - c)
+            for name, c in zip(FITTED_JOINTS, corrections)
+        },
+        'rms_error': float(np.sqrt(np.mean(errors ** 2))),
+        'max_error': float(errors.max()),
+        'samples': len(poses),
+    }
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+
+""" Collision checking of arm poses.
+
+The arm parts are modeled as capsules (i.e. the set of points within a given distance of a
+segment), built on the joint positions provided by the direct kinematics :
+
+* the arm, from the shoulder to the elbow
+* the forearm, from the elbow to the wrist
+* the gripper, from the wrist to the gripper end
+
+The obstacles checked are the table, the base enclosure (modeled as a vertical capsule
+around the base rotation axis) and the arm itself for the gripper, which can be folded back
+onto the arm.
+
+All the checks are vectorized, so that whole trajectories can be validated at once.
+"""
+
+import numpy as np
+
+__author__ = 'Eric Pascual'
+
+
+def _segments_distance(p1, q1, p2, q2):
+    """ Returns the minimal distances between pairs of segments [p1, q1] and [p2, q2].
+
+    The points are given as (N, 3) arrays (or broadcastable to), and the segments are supposed
+    to have a non null length.
+    """
+    d1, d2, r = q1 - p1, q2 - p2, p1 - p2
+    a = np.einsum('...i,...i', d1, d1)
+    e = np.einsum('...i,...i', d2, d2)
+    b = np.einsum('...i,...i', d1, d2)
+    c = np.einsum('...i,...i', d1, r)
+    f = np.einsum('...i,...i', d2, r)
+
+    # parameters of the closest points of the supporting lines, clamped to the segments
+    denom = a * e - b * b
+    parallel = denom < 1e-9 * a * e
+    s = np.where(parallel, 0, np.clip((b * f - c * e) / np.where(parallel, 1, denom), 0, 1))
+    t = (b * s + f) / e
+    s = np.where(t < 0, np.clip(-c / a, 0, 1), np.where(t > 1, np.clip((b - c) / a, 0, 1), s))
+    t = np.clip(t, 0, 1)
+
+    delta = p1 + d1 * s[..., np.newaxis] - p2 - d2 * t[..., np.newaxis]
+    return np.sqrt(np.einsum('...i,...i', delta, delta))
+
+
+class CollisionChecker(object):
+    """ Checks arm poses for collisions with the table, the base and the arm itself.
+
+    The dimensions of the arm are taken from the kinematics model, the other ones
+    being defined as class attributes which can be overridden if needed.
+    """
+    #: Z coordinate of the table surface
+    TABLE_Z = 0
+    #: height of the base enclosure top, above the table
+    BASE_HEIGHT = 200
+    #: radius of the arm and forearm capsules
+    SEGMENT_RADIUS = 25
+    #: radius of the gripper capsule
+    GRIPPER_RADIUS = 30
+    #: additional safety distance
+    CLEARANCE = 5
+
+    #: collision flags, as returned by :py:meth:`check`
+    HIT_TABLE, HIT_BASE, HIT_ARM = 1, 2, 4
+    HIT_NAMES = {HIT_TABLE: 'table', HIT_BASE: 'base', HIT_ARM: 'arm'}
+
+    def __init__(self, kin):
+        """
+        :param kin: the kinematics model
+        """
+        self.kin = kin
+
+    def check(self, poses):
+        """ Checks a set of poses.
+
+        :param poses: the (N, 4+) array of the joint poses (see :py:meth:`Kinematics.dk_batch`)
+        :return: the array of the collision flags of each pose (0 if free)
+        :rtype: numpy.ndarray
+        """
+        kin = self.kin
+        end, elbow, wrist = kin.dk_batch(poses, intermediate=True)
+        shoulder = np.array([-kin.X_OFFSET_FROM_ROTATION_AXIS, 0, kin.Z_SHOULDER])
+        flags = np.zeros(len(end), dtype=np.uint8)
+
+        # the gripper end is allowed to touch the table (rounding errors apart), but not the
+        # body of the segments
+        table_z = self.TABLE_Z + self.CLEARANCE
+        flags[
+            (np.minimum(elbow[:, 2], wrist[:, 2]) < table_z + self.SEGMENT_RADIUS) |
+            (end[:, 2] < self.TABLE_Z - 1e-6)
+        ] |= self.HIT_TABLE
+
+        # the arm is attached to the base top, so that only the downstream parts are checked
+        base_bottom = np.array([-kin.X_OFFSET_FROM_ROTATION_AXIS, 0, self.TABLE_Z])
+        base_top = np.array([-kin.X_OFFSET_FROM_ROTATION_AXIS, 0, self.TABLE_Z + self.BASE_HEIGHT])
+        base_limit = kin.BASE_RADIUS + self.CLEARANCE
+        flags[
+            (_segments_distance(elbow, wrist, base_bottom, base_top) < base_limit + self.SEGMENT_RADIUS) |
+            (_segments_distance(wrist, end, base_bottom, base_top) < base_limit + self.GRIPPER_RADIUS)
+        ] |= self.HIT_BASE
+
+        # the forearm being articulated to both the arm and the gripper, only the gripper
+        # can hit the arm
+        arm_limit = self.SEGMENT_RADIUS + self.GRIPPER_RADIUS + self.CLEARANCE
+        flags[_segments_distance(wrist, end, shoulder, elbow) < arm_limit] |= self.HIT_ARM
+
+        return flags
+
+    def first_collision(self, poses):
+        """ Returns the index of the first colliding pose of a sequence.
+
+        :param poses: the (N, 4+) array of the joint poses
+        :return: the index of the first colliding pose, or None if all poses are free
+        """
+        hits = np.flatnonzero(self.check(poses))
+        return int(hits[0]) if hits.size else None
+
+    def is_free(self, pose):
+        """ Tells if a single pose is collision free. """
+        return not self.check([pose[:4]])[0]
+
+    @classmethod
+    def describe(cls, flags):
+        """ Returns a human readable description of collision flags. """
+        return ', '.join(name for flag, name in sorted(cls.HIT_NAMES.items()) if flags & flag)
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+
+""" External configuration of the motor settings.
+
+The configuration is stored as a JSON file, which can be loaded by
+:py:meth:`pybot.youpi2.model.YoupiArm.configure`. Its content is a dictionary with the
+following items, both optional :
+
+* ``settings`` : the values overriding the ones of the motor settings classes (see
+  :py:class:`pybot.youpi2.model.MotorSettings`), as dictionaries keyed by the setting names
+  (e.g. ``max_speed``, ``acc``), themselves keyed by the motor names
+* ``profiles`` : the named motion profiles, with the same structure as ``settings``, keyed by
+  the profile names. The values of a profile override the ones of the base settings while
+  it is in use (see :py:meth:`pybot.youpi2.model.YoupiArm.use_profile`)
+
+Example::
+
+    {
+        "settings": {
+            "gripper": {"close_speed": 600}
+        },
+        "profiles": {
+            "fast": {
+                "base": {"max_speed": 900, "acc": 400, "dec": 400},
+                "shoulder": {"max_speed": 700, "acc": 300, "dec": 300}
+            },
+            "precise": {
+                "base": {"max_speed": 200, "acc": 60, "dec": 60}
+            }
+        }
+    }
+
+.. note:: JSON having no hexadecimal notation, register values are given in decimal
+"""
+
+import json
+
+__author__ = 'Eric Pascual'
+
+#: default location of the configuration file
+DEFAULT_PATH = '/etc/youpi2/motors.json'
+
+
+def load_config(path=DEFAULT_PATH):
+    """ Loads a configuration file.
+
+    :param str path: the path of the file
+    :return: the configuration data
+    :rtype: dict
+    :raise IOError: if the file cannot be read
+    :raise ValueError: if the file content is invalid
+    """
+    with open(path) as fp:
+        data = json.load(fp)
+    if not isinstance(data, dict) or not set(data).issubset(('settings', 'profiles')):
+        raise ValueError('invalid configuration file (%s)' % path)
+    return data
@@ -198,7 +198,8 @@ class YoupiDemo(DSPINDemo):
             _, max_x = wnd.getmaxyx()
 
             config = self.youpi.CONFIG[motor_num]
-            status = self.youpi.STATUS[motor_num]
+            snapshot = self.youpi.snapshot()
+            status = snapshot.status[motor_num]
 
             label_attrs = curses.color_pair(curses.COLOR_BLUE)
 
@@ -208,6 +209,11 @@ class YoupiDemo(DSPINDemo):
             wnd.addstr(4, 0, 'CONFIG: ', label_attrs)
             wnd.addstr(fill(Configuration.as_string(config), max_x - 10))
 
+            wnd.addstr(8, 0, 'POSITION: ', label_attrs)
+            wnd.addstr('%.2f deg' % snapshot.positions[motor_num])
+            wnd.addstr(9, 0, 'SPEED: ', label_attrs)
+            wnd.addstr('%.2f deg/s' % snapshot.speeds[motor_num])
+
             wnd.refresh()
 
         self.selective_motor_action(
@@ -1,14 +1,121 @@
 # -*- coding: utf-8 -*-
 
+import cmath
 import math
+from collections import OrderedDict
+
+import numpy as np
 
 from pybot.core.log import LogMixin
 
-from model import YoupiArm
+from .model import YoupiArm
+from .calibration import load_calibration, default_calibration, KINEMATIC_PARAMETERS
 
 __author__ = 'Eric Pascual'
 
 
+class IKCache(object):
+    """ Memoization of the inverse kinematics solutions.
+
+    The goals are quantized to the configured resolutions, and the solution is computed
+    for the quantized goal, so that all the goals sharing the same quantized value get
+    exactly the same result. Unreachable goals are cached too.
+
+    The oldest used entries are evicted when the cache is full, and the whole content
+    is discarded when the kinematic model (dimensions or joint limits) is modified.
+    """
+    DEFAULT_SIZE = 1024
+    DEFAULT_LINEAR_RESOLUTION = 0.1
+    DEFAULT_ANGULAR_RESOLUTION = 0.1
+
+    def __init__(self, size=DEFAULT_SIZE,
+                 linear_resolution=DEFAULT_LINEAR_RESOLUTION,
+                 angular_resolution=DEFAULT_ANGULAR_RESOLUTION):
+        """
+        :param int size: the maximum number of cached solutions
+        :param float linear_resolution: the quantization step of the goal coordinates (mm)
+        :param float angular_resolution: the quantization step of the goal wrist pitch (degrees)
+        """
+        if size <= 0:
+            raise ValueError('cache size must be positive')
+        if linear_resolution <= 0 or angular_resolution <= 0:
+            raise ValueError('resolutions must be positive')
+
+        self.size = size
+        self.linear_resolution = linear_resolution
+        self.angular_resolution = angular_resolution
+
+        self._entries = OrderedDict()
+        self._signature = None
+        self.hits = self.misses = self.evictions = self.invalidations = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def hit_ratio(self):
+        lookups = self.hits + self.misses
+        return float(self.hits) / lookups if lookups else 0.
+
+    def stats(self):
+        """ Returns the cache usage statistics.
+
+        :rtype: dict
+        """
+        return {
+            'size': len(self._entries),
+            'max_size': self.size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hit_ratio,
+            'evictions': self.evictions,
+            'invalidations': self.invalidations,
+        }
+
+    def clear(self):
+        """ Discards the cached solutions (the statistics are preserved). """
+        self._entries.clear()
+
+    def ik(self, kin, x, y, z, wrist_pitch):
+        """ Returns the solution for the given goal, computing it with the provided
+        kinematics model if not yet cached.
+
+        See :py:meth:`Kinematics.ik` for the parameters.
+        """
+        signature = kin.model_signature()
+        if signature != self._signature:
+            if self._entries:
+                self.invalidations += 1
+                self._entries.clear()
+            self._signature = signature
+
+        lin_res, ang_res = self.linear_resolution, self.angular_resolution
+        key = (
+            int(round(x / lin_res)), int(round(y / lin_res)), int(round(z / lin_res)),
+            int(round(wrist_pitch / ang_res))
+        )
+        try:
+            q, error = self._entries.pop(key)
+        except KeyError:
+            self.misses += 1
+            try:
+                q, error = kin._ik(key[0] * lin_res, key[1] * lin_res, key[2] * lin_res, key[3] * ang_res), None
+            except ValueError as e:
+                q, error = None, str(e)
+            if len(self._entries) >= self.size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        else:
+            self.hits += 1
+
+        # (re)insert the entry as the most recently used one
+        self._entries[key] = q, error
+
+        if error:
+            raise ValueError(error)
+        return list(q)
+
+
 class Kinematics(LogMixin):
     L_SEGMENT = 162
     L_GRIPPER = 150
@@ -16,8 +123,121 @@ class Kinematics(LogMixin):
     BASE_RADIUS = 100
     X_OFFSET_FROM_ROTATION_AXIS = 105
 
+    #: number of poses processed at once by :py:meth:`dk_batch`
+    DK_BATCH_CHUNK_SIZE = 65536
+
+    #: status code of a valid batch IK solution
+    IK_OK = 0
+    #: status flag set when the goal is out of reach
+    IK_OUT_OF_REACH = 1
+    #: status flags set when the solution violates the limits of the joint (in the
+    #: sequence base, shoulder, elbow and wrist)
+    IK_LIMIT_BASE, IK_LIMIT_SHOULDER, IK_LIMIT_ELBOW, IK_LIMIT_WRIST = \
+        IK_LIMIT_FLAGS = (1 << 1, 1 << 2, 1 << 3, 1 << 4)
+    # weights of the rows of the ik_batch status flags (out of reach, then the joint limits)
+    _IK_STATUS_WEIGHTS = np.array((IK_OUT_OF_REACH,) + IK_LIMIT_FLAGS, dtype=np.uint8)
+
     def __init__(self, *args, **kwargs):
+        """
+        :param calibration: optional calibration data or file path (see :py:meth:`apply_calibration`).
+                            If not provided, the default calibration file is used if it exists
+                            (see :py:func:`pybot.youpi2.calibration.default_calibration`). Use
+                            False to keep the nominal dimensions.
+
+        Other parameters are passed to :py:class:`LogMixin`.
+        """
+        calibration = kwargs.pop('calibration', None)
         LogMixin.__init__(self, *args, **kwargs)
+        self.ik_cache = None
+        # joint limits used by ik_batch, as columns (see _limit_columns)
+        self._limits = None
+        self._limit_cols = None
+        if calibration is None:
+            calibration = default_calibration()
+        if calibration:
+            self.apply_calibration(calibration)
+
+    def apply_calibration(self, calibration):
+        """ Replaces the nominal dimensions of the arm by calibrated ones.
+
+        The values are stored as instance attributes, overriding the class level ones.
+
+        :param calibration: the calibration data (see :py:mod:`pybot.youpi2.calibration`), or the
+                            path of the file containing them
+        """
+        if not isinstance(calibration, dict):
+            calibration = load_calibration(calibration)
+        for name, value in calibration.get('kinematics', {}).iteritems():
+            if name not in KINEMATIC_PARAMETERS:
+                raise ValueError('invalid kinematic parameter (%s)' % name)
+            setattr(self, name, float(value))
+        if self.ik_cache is not None:
+            self.ik_cache.clear()
+        self.log_info('calibration applied: %s' % ', '.join(
+            '%s=%.2f' % (name, getattr(self, name)) for name in KINEMATIC_PARAMETERS
+        ))
+
+    @staticmethod
+    def joint_limits():
+        """ Returns the mechanical limits of the joints involved in the kinematics computations.
+
+        :return: the arrays of the lowest and highest positions (in degrees) of the joints, in the
+                 sequence base, shoulder, elbow and wrist
+        :rtype: tuple
+        """
+        limits = np.array(
+            [(s.MIN_POS_DEG, s.MAX_POS_DEG) for s in YoupiArm.settings[:YoupiArm.MOTOR_HAND_ROT]],
+            dtype=float
+        )
+        return limits[:, 0], limits[:, 1]
+
+    def _limit_columns(self):
+        """ Returns the joint limits as (4, 1) arrays, which are rebuilt only when the limits
+        are modified.
+        """
+        limits = [(s.MIN_POS_DEG, s.MAX_POS_DEG) for s in YoupiArm.settings[:YoupiArm.MOTOR_HAND_ROT]]
+        if limits != self._limits:
+            self._limits = limits
+            self._limit_cols = tuple(np.array(limits, dtype=float).T[:, :, np.newaxis])
+        return self._limit_cols
+
+    def model_signature(self):
+        """ Returns the values defining the kinematic model, i.e. the dimensions of the arm and
+        the mechanical limits of its joints.
+
+        It is intended to be stored with anything derived from the model, so that it can be
+        detected as outdated when the model is modified.
+
+        :return: the model defining values
+        :rtype: tuple
+        """
+        return (
+            self.L_SEGMENT, self.L_GRIPPER, self.Z_SHOULDER, self.X_OFFSET_FROM_ROTATION_AXIS
+        ) + tuple(
+            limit
+            for s in YoupiArm.settings[:YoupiArm.MOTOR_HAND_ROT]
+            for limit in (s.MIN_POS_DEG, s.MAX_POS_DEG)
+        )
+
+    def enable_ik_cache(self, size=IKCache.DEFAULT_SIZE,
+                        linear_resolution=IKCache.DEFAULT_LINEAR_RESOLUTION,
+                        angular_resolution=IKCache.DEFAULT_ANGULAR_RESOLUTION):
+        """ Activates the memoization of the :py:meth:`ik` results.
+
+        Refer to :py:class:`IKCache` for details.
+
+        :param int size: the maximum number of cached solutions
+        :param float linear_resolution: the quantization step of the goal coordinates (mm)
+        :param float angular_resolution: the quantization step of the goal wrist pitch (degrees)
+        :return: the cache
+        :rtype: IKCache
+        """
+        self.ik_cache = IKCache(size, linear_resolution, angular_resolution)
+        return self.ik_cache
+
+    def disable_ik_cache(self):
+        """ Deactivates the memoization of the :py:meth:`ik` results. """
+        self.ik_cache = None
 
     def ik(self, x, y, z, wrist_pitch=90):
         """ Inverse kinematics.
@@ -52,6 +272,12 @@ class Kinematics(LogMixin):
         :rtype: tuple
         :raise ValueError: if the goal position cannot be reached (including the wrist pitch constraint)
         """
+        if self.ik_cache is not None:
+            return self.ik_cache.ik(self, x, y, z, wrist_pitch)
+        return self._ik(x, y, z, wrist_pitch)
+
+    def _ik(self, x, y, z, wrist_pitch):
+        """ Uncached version of :py:meth:`ik` """
         input_parms_msg = 'goal: x=%f y=%f z=%f wrist_pitch=%f' % (x, y, z, wrist_pitch)
         self.log_debug(input_parms_msg)
 
@@ -109,6 +335,332 @@ class Kinematics(LogMixin):
         self.log_debug('>>> solution is valid')
         return q
 
+    def feasible_pitch_ranges(self, x, y, z):
+        """ Returns the ranges of wrist pitches for which a goal position can be reached.
+
+        The ranges are computed analytically : all the pitches at which one of the constraints
+        (reach, and shoulder, elbow and wrist limits) becomes active are obtained as the
+        intersections of the circle described by the wrist (or the elbow) when the pitch varies
+        with the circles bounding the constraint. Since the validity of the solution cannot
+        change between two successive such pitches, checking one pitch per interval is then
+        enough to classify all of them.
+
+        See :py:meth:`ik` for the parameters definition.
+
+        :param float x: X coordinate of the gripper end
+        :param float y: Y coordinate of the gripper end
+        :param float z: Z coordinate of the gripper end
+        :return: the sorted list of the (min, max) feasible pitch ranges (in degrees), within
+                 the [-180, 180] interval
+        :rtype: list
+        """
+        # target position in the arm plane, relative to the shoulder joint, as a complex
+        # number (real part : radial coordinate, imaginary part : vertical one)
+        target = complex(math.hypot(x + self.X_OFFSET_FROM_ROTATION_AXIS, y), z - self.Z_SHOULDER)
+        q_min, q_max = self.joint_limits()
+
+        # The wrist lies at target - L_GRIPPER * exp(-i.pitch), i.e. on a circle centered on
+        # the target. The pitches for which it crosses a circle are thus given by the
+        # intersections of both circles.
+        wrist_circles = [(0, 2 * self.L_SEGMENT)] + [
+            # elbow limits (the elbow angle depends only on the shoulder to wrist distance)
+            (0, 2 * self.L_SEGMENT * math.cos(math.radians(limit) / 2))
+            for limit in (q_min[YoupiArm.MOTOR_ELBOW], q_max[YoupiArm.MOTOR_ELBOW]) if 0 < limit < 180
+        ] + [
+            # shoulder limits (the wrist is then on the circle centered on the elbow)
+            (self.L_SEGMENT * 1j * cmath.exp(-1j * math.radians(limit)), self.L_SEGMENT)
+            for limit in (q_min[YoupiArm.MOTOR_SHOULDER], q_max[YoupiArm.MOTOR_SHOULDER])
+        ]
+        boundaries = [
+            -cmath.phase(target - w)
+            for center, radius in wrist_circles
+            for w in _circles_intersections(target, self.L_GRIPPER, center, radius)
+        ]
+
+        # For a given wrist angle, the elbow lies at target - k * exp(-i.(pitch - psi)), with
+        # k * exp(i.psi) = L_GRIPPER + L_SEGMENT * exp(i.wrist_angle), i.e. on a circle centered
+        # on the target too. The wrist limits are reached when it crosses the shoulder circle.
+        for limit in (q_min[YoupiArm.MOTOR_WRIST], q_max[YoupiArm.MOTOR_WRIST]):
+            k_psi = self.L_GRIPPER + self.L_SEGMENT * cmath.exp(1j * math.radians(limit))
+            boundaries += [
+                cmath.phase(k_psi) - cmath.phase(target - e)
+                for e in _circles_intersections(target, abs(k_psi), 0, self.L_SEGMENT)
+            ]
+
+        # the shoulder angle computation has a discontinuity when the wrist crosses
+        # the horizontal plane of the shoulder
+        if abs(target.imag) <= self.L_GRIPPER:
+            a = math.asin(-target.imag / self.L_GRIPPER)
+            boundaries += [a, math.pi - a]
+
+        boundaries = np.unique(np.clip(
+            (np.degrees(boundaries) + 180) % 360 - 180, -180, 180
+        ).tolist() + [-180, 180])
+
+        # check the validity of the solution in each interval
+        _, status = self.ik_batch(x, y, z, (boundaries[:-1] + boundaries[1:]) / 2)
+        ranges = []
+        for lo, hi, valid in zip(boundaries[:-1], boundaries[1:], status == self.IK_OK):
+            if not valid:
+                continue
+            if ranges and ranges[-1][1] == lo:
+                ranges[-1] = (ranges[-1][0], hi)
+            else:
+                ranges.append((lo, hi))
+        return [(float(lo), float(hi)) for lo, hi in ranges]
+
+    def ik_nearest_pitch(self, x, y, z, wrist_pitch=90):
+        """ Inverse kinematics for the feasible wrist pitch which is the closest to the requested one.
+
+        If the goal can be reached with the requested pitch, the result is the same as the one
+        of :py:meth:`ik`. Otherwise, the closest feasible pitch is determined using
+        :py:meth:`feasible_pitch_ranges` and the solution for it is returned, instead of raising
+        an error.
+
+        :param float x: X coordinate of the gripper end
+        :param float y: Y coordinate of the gripper end
+        :param float z: Z coordinate of the gripper end
+        :param float wrist_pitch: requested absolute pitch of the gripper
+        :return: the tuple containing the used pitch and the pose
+        :rtype: tuple
+        :raise ValueError: if the goal position cannot be reached whatever is the pitch
+        """
+        # The solutions are computed by the uncached IK, since the quantization of the cached
+        # one could move the pitch out of the feasible ranges, the nearest pitch being at
+        # their boundaries.
+        _, status = self.ik_batch(x, y, z, wrist_pitch)
+        if status[0] == self.IK_OK:
+            return wrist_pitch, self._ik(x, y, z, wrist_pitch)
+
+        ranges = self.feasible_pitch_ranges(x, y, z)
+        if not ranges:
+            msg = 'out of reach goal'
+            self.log_error(msg)
+            self.log_error('goal: x=%f y=%f z=%f' % (x, y, z))
+            raise ValueError(msg)
+
+        def angular_distance(a):
+            return abs((a - wrist_pitch + 180) % 360 - 180)
+
+        # use pitches slightly inside the ranges, so that rounding errors cannot
+        # make them fail the limits checks
+        margin = 1e-6
+        pitch = min(
+            (
+                min(max(p, lo + min(margin, (hi - lo) / 2)), hi - min(margin, (hi - lo) / 2))
+                for lo, hi in ranges for p in (lo, hi)
+            ),
+            key=angular_distance
+        )
+        self.log_debug('... nearest feasible pitch: %f' % pitch)
+        return pitch, self._ik(x, y, z, pitch)
+
+    def ik_solutions(self, x, y, z, wrist_pitch=90, hand_angle=None):
+        """ Returns all the valid poses for a goal.
+
+        In addition to the one returned by :py:meth:`ik`, the goal can be reached with the
+        other elbow configuration, and with the base rotated by 180 degrees, the arm reaching
+        then the goal "over the shoulder".
+
+        Since the gripper is symmetrical, hand angles differing by 180 degrees are equivalent.
+        If a hand angle is provided, the returned poses include the hand joint, with all the
+        equivalent angles within its limits.
+
+        See :py:meth:`ik` for the parameters definition.
+
+        :param float x: X coordinate of the gripper end
+        :param float y: Y coordinate of the gripper end
+        :param float z: Z coordinate of the gripper end
+        :param float wrist_pitch: absolute pitch of the gripper
+        :param float hand_angle: optional hand rotation angle
+        :return: the list of the valid poses (possibly empty), as lists of joint angles
+        :rtype: list
+        """
+        q_min, q_max = self.joint_limits()
+
+        x_rel = x + self.X_OFFSET_FROM_ROTATION_AXIS
+        z_rel = z - self.Z_SHOULDER
+        r = math.sqrt(x_rel * x_rel + y * y)
+        base_angle = math.degrees(math.acos(x_rel / r) * (1 if y > 0 else -1)) if r else 0
+
+        if hand_angle is None:
+            hand_angles = [None]
+        else:
+            hand_settings = YoupiArm.settings[YoupiArm.MOTOR_HAND_ROT]
+            hand_angles = [
+                a for a in (hand_angle + k * 180 for k in range(-2, 3))
+                if hand_settings.MIN_POS_DEG <= a <= hand_settings.MAX_POS_DEG
+            ]
+
+        solutions = []
+        # the "over the shoulder" configurations are obtained by mirroring the goal
+        # in the arm plane
+        for plane_r, plane_pitch, base in ((r, wrist_pitch, base_angle), (-r, 180 - wrist_pitch, base_angle + 180)):
+            wrist_rd = math.radians(plane_pitch)
+            r_wrist = plane_r - self.L_GRIPPER * math.cos(wrist_rd)
+            z_wrist = z_rel + self.L_GRIPPER * math.sin(wrist_rd)
+            d = math.sqrt(r_wrist * r_wrist + z_wrist * z_wrist)
+            if d > 2 * self.L_SEGMENT:
+                continue
+
+            a0 = math.atan2(z_wrist, r_wrist)
+            a1 = math.acos(d / 2 / self.L_SEGMENT)
+            for elbow_dir in (1, -1):
+                shoulder_angle = math.pi / 2 - a0 - elbow_dir * a1
+                elbow_angle = elbow_dir * 2 * a1
+                wrist_angle = math.pi / 2 + wrist_rd - shoulder_angle - elbow_angle
+                q = [math.degrees(a) for a in (shoulder_angle, elbow_angle, wrist_angle)]
+                # normalize the wrist angle, since the plane pitch can be out of the usual range
+                q[2] = (q[2] + 180) % 360 - 180
+
+                for b in (base - 360, base, base + 360):
+                    pose = [b] + q
+                    if all(lo <= a <= hi for a, lo, hi in zip(pose, q_min, q_max)) and pose not in solutions:
+                        solutions.append(pose)
+
+        return [pose + [hand] for pose in solutions for hand in hand_angles] if hand_angle is not None else solutions
+
+    @staticmethod
+    def travel_time(from_pose, to_pose):
+        """ Returns an estimation of the time needed to move the arm between two poses.
+
+        The estimation takes the mechanical coupling of the joints into account, and is based
+        on the maximum speed of the motors, the accelerations being ignored. It is intended for
+        comparing moves rather than for predicting their exact durations.
+
+        :param from_pose: the joint angles of the starting pose
+        :param to_pose: the joint angles of the destination pose (only the joints present in
+                        both poses are considered)
+        :return: the time of the move, in seconds
+        :rtype: float
+        """
+        deltas = {j: b - a for j, (a, b) in enumerate(zip(from_pose, to_pose))}
+        # the coupling being linear, it can be applied to angle variations as well
+        YoupiArm.joint_to_motor(deltas)
+        return max(
+            abs(YoupiArm.settings[m].degrees_to_steps(a)) /
+            float(YoupiArm.settings[m].micro_steps * YoupiArm.settings[m].max_speed)
+            for m, a in deltas.items()
+        ) if deltas else 0.
+
+    def ik_min_travel(self, x, y, z, current_pose, wrist_pitch=90, hand_angle=None):
+        """ Inverse kinematics returning the solution reachable the fastest from the current pose.
+
+        All the solutions returned by :py:meth:`ik_solutions` are ranked based on the estimation
+        given by :py:meth:`travel_time`. The current pose is typically obtained by
+        :py:meth:`YoupiArm.get_joint_positions`.
+
+        :param float x: X coordinate of the gripper end
+        :param float y: Y coordinate of the gripper end
+        :param float z: Z coordinate of the gripper end
+        :param current_pose: the current joint angles
+        :param float wrist_pitch: absolute pitch of the gripper
+        :param float hand_angle: optional hand rotation angle (see :py:meth:`ik_solutions`)
+        :return: the selected pose
+        :rtype: list
+        :raise ValueError: if the goal position cannot be reached
+        """
+        solutions = self.ik_solutions(x, y, z, wrist_pitch, hand_angle)
+        if not solutions:
+            msg = 'unreachable goal'
+            self.log_error(msg)
+            self.log_error('goal: x=%f y=%f z=%f wrist_pitch=%f' % (x, y, z, wrist_pitch))
+            raise ValueError(msg)
+
+        return min(solutions, key=lambda pose: self.travel_time(current_pose, pose))
+
+    def ik_batch(self, x, y, z, wrist_pitch=90):
+        """ Vectorized inverse kinematics.
+
+        Same as :py:meth:`ik`, but processes a whole set of goals at once. The coordinates
+        and the pitches can be provided as any array-like objects, which are broadcast
+        together (a scalar pitch can thus be shared by all the goals).
+
+        Instead of raising an error on the first invalid goal, a status code is returned
+        for each of them. It is either :py:attr:`IK_OK` or a combination of
+        :py:attr:`IK_OUT_OF_REACH` and of the :py:attr:`IK_LIMIT_FLAGS` items
+        identifying the joints which limits are exceeded.
+
+        The joint angles of out of reach goals are set to NaN. The ones of goals failing
+        the limits check are returned as computed, so that callers can see by how much the
+        limits are exceeded.
+
+        :param x: X coordinates of the gripper end
+        :param y: Y coordinates of the gripper end
+        :param z: Z coordinates of the gripper end
+        :param wrist_pitch: absolute pitches of the gripper
+        :return: the (N, 4) array of the poses and the (N,) array of the status codes
+        :rtype: tuple
+        """
+        x = np.asarray(x, dtype=float)
+        y = np.asarray(y, dtype=float)
+        z = np.asarray(z, dtype=float)
+        wrist_pitch = np.asarray(wrist_pitch, dtype=float)
+        if not x.shape == y.shape == z.shape == wrist_pitch.shape:
+            x, y, z, wrist_pitch = np.broadcast_arrays(x, y, z, wrist_pitch)
+        x, y, z, wrist_pitch = x.ravel(), y.ravel(), z.ravel(), wrist_pitch.ravel()
+
+        # For the usual batch sizes, the cost is dominated by the number of passes over the
+        # data, and not by the arithmetic. The computations are thus done in place as much as
+        # possible, and the joint angles stored by rows so that all the accesses are contiguous,
+        # the returned poses being the transposed view of them. The status flags are gathered
+        # the same way, in the sequence of their bits.
+        q = np.empty((4, x.size))
+        flags = np.empty((5, x.size), dtype=bool)
+
+        # move to shoulder related frame (translated to shoulder rotation axis center)
+        x_rel = x + self.X_OFFSET_FROM_ROTATION_AXIS
+        r = x_rel * x_rel
+        r += y * y
+        np.sqrt(r, out=r)
+
+        wrist_rd = wrist_pitch * (math.pi / 180)
+        r_wrist = np.cos(wrist_rd)
+        r_wrist *= -self.L_GRIPPER
+        r_wrist += r
+        z_wrist = np.sin(wrist_rd, out=wrist_rd)
+        z_wrist *= self.L_GRIPPER
+        z_wrist += z
+        z_wrist -= self.Z_SHOULDER
+        d = r_wrist * r_wrist
+        d += z_wrist * z_wrist
+        np.sqrt(d, out=d)
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            # the rounding errors cannot push these cosines out of [-1, 1], since the hypotenuses
+            # are computed from the rounded squares of the same values
+            x_rel /= r
+            base_angle = np.arccos(x_rel, out=x_rel)
+            r_wrist /= d
+            a0 = np.arccos(r_wrist, out=r_wrist)
+            # the angles depending on a1 are NaN for the out of reach goals
+            d /= 2 * self.L_SEGMENT
+            out_of_reach = np.greater(d, 1, out=flags[0])
+            a1 = np.arccos(d, out=d)
+        # degenerated goals (on the base rotation axis or on the shoulder joint axis)
+        base_angle[np.isnan(base_angle)] = 0
+        a0[np.isnan(a0)] = 0
+
+        # (unlike in ik, a null Y gives a positive base angle, which makes a difference only for
+        # goals behind the base rotation axis, which are out of its limits anyway)
+        np.multiply(np.copysign(base_angle, y, out=base_angle), 180 / math.pi, out=q[0])
+        np.copyto(q[0], np.nan, where=out_of_reach)
+        a0 *= np.copysign(180 / math.pi, z_wrist, out=z_wrist)
+        a1 *= 180 / math.pi
+        np.subtract(90 - a0, a1, out=q[1])
+        np.add(a1, a1, out=q[2])
+        np.add(wrist_pitch, a0, out=q[3])
+        q[3] -= a1
+
+        # NaN angles of out of reach goals compare as False, and thus do not raise limit flags
+        q_min, q_max = self._limit_columns()
+        with np.errstate(invalid='ignore'):
+            limit_errors = np.less(q, q_min, out=flags[1:])
+            limit_errors |= q > q_max
+        status = np.einsum('j,jn->n', self._IK_STATUS_WEIGHTS, flags.view(np.uint8))
+
+        return q.T, status
+
     def dk(self, pose):
         """ Direct kinematics.
 
@@ -133,3 +685,157 @@ class Kinematics(LogMixin):
         x = r * math.cos(base) - self.X_OFFSET_FROM_ROTATION_AXIS
 
         return x, y, z
+
+    def dk_batch(self, poses, intermediate=False):
+        """ Vectorized direct kinematics.
+
+        Same as :py:meth:`dk`, but processes a whole set of poses at once.
+
+        The poses are provided as an (N, 4+) array-like object, only the first 4 columns
+        of which being used, or as the path of a ``.npy`` file containing such an array. In
+        the later case the file is memory-mapped rather than loaded, so that very long
+        recordings can be processed without duplicating them in memory. For this purpose,
+        the poses are processed by chunks of :py:attr:`DK_BATCH_CHUNK_SIZE` rows, the
+        intermediate arrays being thus bounded whatever the number of poses, and the results
+        written in the preallocated output arrays.
+
+        :param poses: the poses, or the path of the ``.npy`` file storing them
+        :param bool intermediate: if True, the positions of the elbow and of the wrist are
+                                  returned too
+        :return: the (N, 3) array of the gripper end coordinates, or the tuple of the (N, 3)
+                 arrays of the gripper end, the elbow and the wrist coordinates if
+                 ``intermediate`` is True
+        :raise ValueError: if the poses array has not the expected shape
+        """
+        if isinstance(poses, basestring):
+            poses = np.load(poses, mmap_mode='r')
+        elif not isinstance(poses, np.ndarray):
+            poses = np.asarray(poses, dtype=float)
+        if poses.ndim != 2 or poses.shape[1] < 4:
+            raise ValueError('poses must be an (N, 4+) array')
+
+        # one row per point : the gripper end, followed by the elbow and the wrist if requested
+        xyz = np.empty((3 if intermediate else 1, len(poses), 3))
+        for start in range(0, len(poses), self.DK_BATCH_CHUNK_SIZE):
+            end = start + self.DK_BATCH_CHUNK_SIZE
+            self._dk_chunk(poses[start:end], xyz[:, start:end])
+
+        if intermediate:
+            return xyz[0], xyz[1], xyz[2]
+        return xyz[0]
+
+    def _dk_chunk(self, poses, xyz):
+        """ Computes the direct kinematics of a chunk of poses for :py:meth:`dk_batch`.
+
+        :param poses: the (n, 4+) array of the poses
+        :param xyz: the (p, n, 3) output array, p being 1 for the gripper end only, or 3 for
+                    the gripper end, the elbow and the wrist
+        """
+        base, shoulder, elbow, wrist = np.radians(poses[:, :4]).T
+        forearm = shoulder + elbow
+        gripper = forearm + wrist
+
+        # radial and vertical coordinates of the elbow, the wrist and the gripper end,
+        # in the arm plane (one row per point)
+        rz = np.empty((3, 2, len(poses)))
+        rz[0, 0] = self.L_SEGMENT * np.sin(shoulder)
+        rz[0, 1] = self.L_SEGMENT * np.cos(shoulder)
+        rz[1, 0] = rz[0, 0] + self.L_SEGMENT * np.sin(forearm)
+        rz[1, 1] = rz[0, 1] + self.L_SEGMENT * np.cos(forearm)
+        rz[2, 0] = rz[1, 0] + self.L_GRIPPER * np.sin(gripper)
+        rz[2, 1] = rz[1, 1] + self.L_GRIPPER * np.cos(gripper)
+        # same sequence as the output rows
+        rz = rz[[2, 0, 1][:len(xyz)]]
+
+        xyz[:, :, 0] = rz[:, 0] * np.cos(base) - self.X_OFFSET_FROM_ROTATION_AXIS
+        xyz[:, :, 1] = -rz[:, 0] * np.sin(base)
+        xyz[:, :, 2] = rz[:, 1] + self.Z_SHOULDER
+
+    def jacobian(self, pose):
+        """ Returns the Jacobian matrix of the direct kinematics at a given pose.
+
+        The considered outputs are the gripper end coordinates, as returned by :py:meth:`dk`,
+        completed by the absolute pitch of the gripper. The considered inputs are the angles
+        of the base, shoulder, elbow and wrist joints.
+
+        :param iterable pose: joint angles, in the sequence of motor ids (only the first 4 are used)
+        :return: the (4, 4) matrix of the partial derivatives of (x, y, z, pitch), in mm/degree
+                 and degree/degree, with respect to the joint angles
+        :rtype: numpy.ndarray
+        """
+        base, shoulder, elbow, wrist = (math.radians(a) for a in pose[:4])
+        forearm = shoulder + elbow
+        gripper = forearm + wrist
+
+        # radial and vertical contributions of the segments downstream each joint
+        r_gripper = self.L_GRIPPER * math.sin(gripper)
+        z_gripper = self.L_GRIPPER * math.cos(gripper)
+        r_forearm = r_gripper + self.L_SEGMENT * math.sin(forearm)
+        z_forearm = z_gripper + self.L_SEGMENT * math.cos(forearm)
+        r_arm = r_forearm + self.L_SEGMENT * math.sin(shoulder)
+        z_arm = z_forearm + self.L_SEGMENT * math.cos(shoulder)
+
+        cos_b, sin_b = math.cos(base), math.sin(base)
+        to_deg = math.pi / 180
+        return np.array([
+            [-r_arm * sin_b * to_deg] + [dr * cos_b * to_deg for dr in (z_arm, z_forearm, z_gripper)],
+            [-r_arm * cos_b * to_deg] + [-dr * sin_b * to_deg for dr in (z_arm, z_forearm, z_gripper)],
+            [0] + [-dz * to_deg for dz in (r_arm, r_forearm, r_gripper)],
+            [0, 1, 1, 1],
+        ])
+
+    #: smallest singular value of the Jacobian (in mm/degree) under which the damping of the
+    #: resolved rate control is activated
+    DLS_EPSILON = 0.2
+    #: maximum damping factor of the resolved rate control
+    DLS_LAMBDA_MAX = 0.5
+
+    def resolved_rate(self, pose, velocity):
+        """ Returns the joint rates producing a given gripper velocity.
+
+        The inverse of the Jacobian is computed with the damped least squares method, the
+        damping being activated only near singularities (i.e. when the smallest singular value
+        of the Jacobian drops under :py:attr:`DLS_EPSILON`). This trades some tracking accuracy
+        for bounded joint rates in these configurations.
+
+        The pitch rate is weighted as the linear velocity it produces at the gripper end, so
+        that the singular values are homogeneous with the linear terms ones.
+
+        :param iterable pose: current joint angles (only the first 4 are used)
+        :param iterable velocity: the gripper velocity, as (vx, vy, vz, vpitch) in mm/s and
+                                  degrees/s, in the frame of :py:meth:`dk`
+        :return: the base, shoulder, elbow and wrist rates, in degrees/s
+        :rtype: numpy.ndarray
+        """
+        weights = np.array([1, 1, 1, self.L_GRIPPER * math.pi / 180])
+        j = self.jacobian(pose) * weights[:, np.newaxis]
+        v = np.asarray(velocity, dtype=float) * weights
+
+        sigma_min = np.linalg.svd(j, compute_uv=False)[-1]
+        if sigma_min < self.DLS_EPSILON:
+            damping = self.DLS_LAMBDA_MAX ** 2 * (1 - (sigma_min / self.DLS_EPSILON) ** 2)
+        else:
+            damping = 0.
+        return j.T.dot(np.linalg.solve(j.dot(j.T) + damping * np.eye(4), v))
+
+
+def _circles_intersections(c0, r0, c1, r1):
+    """ Returns the intersection points of two circles of the plane.
+
+    Points are represented as complex numbers.
+
+    :param complex c0: center of the first circle
+    :param float r0: radius of the first circle
+    :param complex c1: center of the second circle
+    :param float r1: radius of the second circle
+    :return: the list of the intersections (empty if the circles do not intersect)
+    :rtype: list
+    """
+    d = abs(c1 - c0)
+    if d == 0 or d > r0 + r1 or d < abs(r0 - r1):
+        return []
+    a = (r0 * r0 - r1 * r1 + d * d) / (2 * d)
+    h = math.sqrt(max(r0 * r0 - a * a, 0))
+    u = (c1 - c0) / d
+    m = c0 + a * u
+    return [m + 1j * h * u, m - 1j * h * u]
@@ -2,14 +2,23 @@
 
 """ Classes implementing the models of the motors and the arm. """
 
+import collections
+import copy
+import threading
 import time
 
+import numpy as np
+
 from pybot.core import log
 from pybot.dspin import defs, real_raspi, GPIO
 from pybot.dspin.core import DSPinSpiDev, CommandTimeOut
 from pybot.dspin.daisychain import DaisyChain
 from pybot.dspin.defs import Register
 
+from .calibration import load_calibration, default_calibration
+from .config import load_config
+from .state import load_state, save_state
+
 __author__ = 'Eric Pascual'
 
 
@@ -21,7 +30,8 @@ class MotorSettings(object):
     the values documentation) and a couple of convenience methods too.
 
     The settings can be tuned for specific motors by sub-classing and overriding
-    the required attributes.
+    the required attributes, or by an external configuration (see
+    :py:meth:`YoupiArm.configure`).
     """
     STEPS_PER_TURN = 200    #: number of steps per motor turn
     GEAR_RATIO = 32         #: gear ratio of joint transmission
@@ -58,6 +68,39 @@ class MotorSettings(object):
         """ Inverse of :py:meth:`degrees_to_steps` """
         return steps * 360. / self.micro_steps / self.STEPS_PER_TURN / self.GEAR_RATIO
 
+    def dps_to_speed(self, dps):
+        """ Converts a joint angular speed (in degrees per second) into the equivalent motor speed,
+        expressed in full steps per second as the ``*_speed`` settings."""
+        return dps * self.STEPS_PER_TURN * self.GEAR_RATIO / 360.
+
+    def move_duration(self, steps, max_speed=None, acc=None, dec=None):
+        """ Estimates the duration of a move, based on the trapezoidal speed profile
+        generated by the dSPIN chip.
+
+        The motion is supposed to start and end at rest. Since the chip actually starts the
+        motion at the minimum speed, the estimation is slightly pessimistic.
+
+        :param int steps: the move distance, in micro-steps (its sign is ignored)
+        :param float max_speed: the maximum speed (full steps/s) if not the configured one
+        :param int acc: the ``ACC`` register value if not the configured one
+        :param int dec: the ``DEC`` register value if not the configured one
+        :return: the move duration (s)
+        :rtype: float
+        """
+        distance = abs(steps) / float(self.micro_steps)
+        if not distance:
+            return 0.
+        v = float(max_speed or self.max_speed)
+        a = (acc or self.acc) / ACC_REG_FACTOR
+        d = (dec or self.dec) / ACC_REG_FACTOR
+
+        ramps_distance = v * v / 2 * (1 / a + 1 / d)
+        if distance >= ramps_distance:
+            return v / a + v / d + (distance - ramps_distance) / v
+        # triangular profile : the maximum speed is not reached
+        peak = (2 * distance * a * d / (a + d)) ** 0.5
+        return peak / a + peak / d
+
 
 class BaseMotorSettings(MotorSettings):
     """ Settings for the arm base rotation motor """
@@ -135,12 +178,64 @@ class GripperMotorSettings(MotorSettings):
     close_speed = 800
 
     turns = 28
+    open_width = 60.    #: spacing of the jaws when the gripper is fully open (mm)
 
-    def __init__(self, **kwargs):
-        """ Defines the step count for the full range open action."""
-        super(GripperMotorSettings, self).__init__(**kwargs)
+    @property
+    def open_steps(self):
+        """ The step count for the full range open action. """
+        return int(self.turns * self.STEPS_PER_TURN * self.micro_steps)
 
-        self.open_steps = int(self.turns * self.STEPS_PER_TURN * self.micro_steps)
+    @property
+    def steps_per_mm(self):
+        """ The motor steps per millimeter of jaws spacing change. """
+        return self.open_steps / self.open_width
+
+    def width_to_position(self, width):
+        """ Converts a jaws spacing (mm) into the corresponding motor position, the fully open
+        position being 0 and the closed one ``-open_steps`` once the gripper is calibrated."""
+        return int(round((width - self.open_width) * self.steps_per_mm))
+
+    def position_to_width(self, position):
+        """ Inverse of :py:meth:`width_to_position` """
+        return self.open_width + position / self.steps_per_mm
+
+
+def _coupling_matrix(children):
+    """ Returns the coupling matrix of a joint chain.
+
+    Each joint drives all its descendants in the chain, with the direction given by the
+    sign of the child reference (see :py:attr:`YoupiArm.JOINT_CHILDREN`).
+    """
+    matrix = np.identity(len(children))
+    for joint in range(len(children)):
+        child = children[joint]
+        while child is not None:
+            matrix[abs(child), joint] = -1 if child < 0 else +1
+            child = children[abs(child)]
+    return matrix
+
+
+#: conversion factor from speeds (step/s) to SPEED register values
+SPEED_REG_FACTOR = 2 ** 28 * 250e-9
+#: conversion factor from speeds (step/s) to MAX_SPEED register values
+MAX_SPEED_REG_FACTOR = 2 ** 18 * 250e-9
+#: conversion factor from speeds (step/s) to MIN_SPEED register values
+MIN_SPEED_REG_FACTOR = 2 ** 24 * 250e-9
+#: conversion factor from accelerations (step/s^2) to ACC and DEC register values
+ACC_REG_FACTOR = 2 ** 40 * 250e-9 ** 2
+#: width of the ABS_POS register (bits)
+ABS_POS_BITS = 22
+
+#: the state of the motors at a given time (see :py:meth:`YoupiArm.snapshot`), each field
+#: but the time stamp being a tuple of per motor values :
+#:
+#: * ``positions`` : the positions (degrees)
+#: * ``speeds`` : the signed speeds (degrees/s)
+#: * ``busy`` : the BUSY state of the chips
+#: * ``switches`` : the state of the switches
+#: * ``faults`` : the fault flags of the STATUS register, all made active high (0 if no fault)
+#: * ``status`` : the raw STATUS register values
+Snapshot = collections.namedtuple('Snapshot', 'timestamp positions speeds busy switches faults status')
 
 
 class YoupiArm(DaisyChain):
@@ -154,6 +249,10 @@ class YoupiArm(DaisyChain):
     DEFAULT_STANDBY_PIN = 11
     DEFAULT_BUSYN_PIN = 13
 
+    #: tells if the dSPIN chain can be driven, the hardware related operations being bypassed
+    #: if not (overridden by simulated implementations)
+    backend_available = real_raspi
+
     settings = [
         BaseMotorSettings(),
         ShoulderMotorSettings(),
@@ -177,7 +276,23 @@ class YoupiArm(DaisyChain):
     JOINT_CHILDREN = [None, MOTOR_ELBOW, MOTOR_WRIST, -MOTOR_HAND_ROT, None, None]
     JOINT_PARENTS = [None, None, MOTOR_SHOULDER, MOTOR_ELBOW, -MOTOR_WRIST, None]
 
+    #: the matrix converting the joint angles into motor angles, derived from the joint
+    #: coupling chain (motor angles = C . joint angles)
+    COUPLING_MATRIX = _coupling_matrix(JOINT_CHILDREN)
+    #: the matrix converting the motor angles into joint angles
+    DECOUPLING_MATRIX = np.round(np.linalg.inv(COUPLING_MATRIX))
+    #: the motors involved in the motion of each joint
+    COUPLED_MOTORS = [tuple(np.flatnonzero(COUPLING_MATRIX[:, j]).tolist()) for j in MOTORS_ALL]
+
     class TimeOuts(object):
+        """ Motion timeouts (s).
+
+        The timeouts of the moves which distance is known are derived from their estimated
+        durations (see :py:meth:`YoupiArm.move_duration`), by applying a safety factor and
+        adding a fixed margin. The fixed values are used as upper bounds of the derived
+        timeouts of the corresponding motions, :py:attr:`DEFAULT` being used for the motions
+        which duration cannot be estimated.
+        """
         DEFAULT = 30
 
         OPEN_GRIPPER = 10
@@ -186,6 +301,75 @@ class YoupiArm(DaisyChain):
         SEEK_ORIGIN = 30
         ROTATE_HAND = 30
 
+        ESTIMATE_FACTOR = 1.5
+        ESTIMATE_MARGIN = 1.
+
+        @classmethod
+        def from_duration(cls, duration, limit=DEFAULT):
+            """ Returns the timeout of a motion given its estimated duration.
+
+            :param float duration: the estimated duration (s)
+            :param float limit: the upper bound of the timeout
+            """
+            return min(duration * cls.ESTIMATE_FACTOR + cls.ESTIMATE_MARGIN, limit)
+
+    #: the motor settings which can be changed by the configuration and the motion profiles
+    #: once the arm is initialized, with the register they are written to and the conversion
+    #: of their value (None if written as is)
+    SETTINGS_REGISTERS = {
+        'max_speed': ('MAX_SPEED', defs.max_spd_calc),
+        'min_speed': ('MIN_SPEED', defs.min_spd_calc),
+        'fs_spd': ('FS_SPD', defs.fs_spd_calc),
+        'acc': ('ACC', None),
+        'dec': ('DEC', None),
+        'kval_run': ('KVAL_RUN', None),
+        'kval_acc': ('KVAL_ACC', None),
+        'kval_dec': ('KVAL_DEC', None),
+        'kval_hold': ('KVAL_HOLD', None),
+    }
+    #: the motor settings which cannot be changed once the arm is initialized, since this
+    #: would invalidate the positions
+    STATIC_SETTINGS = ('micro_steps', 'turns')
+
+    #: polling period (s) of the motors state while executing blended waypoints
+    WAYPOINTS_POLL_PERIOD = 0.002
+
+    #: polling period (s) of the busy state and of the switches, when the BUSYN line edges
+    #: cannot be notified
+    BUSY_POLL_PERIOD = 0.005
+    #: period (s) of the wait callbacks invocation while waiting for BUSYN line edges
+    WAIT_CB_PERIOD = 0.1
+    #: number of completion detection latencies kept for the statistics
+    LATENCY_HISTORY = 100
+
+    #: the time source of the snapshots time stamps
+    clock = staticmethod(time.time)
+
+    #: distance (degrees) from the index position at which the switch state is checked
+    #: by :py:meth:`verify_index`
+    INDEX_VERIFY_MARGIN = 1.
+
+    #: spacing (mm) kept from the expected object width at the end of the fast approach
+    #: of the gripper (see :py:meth:`close_gripper`)
+    GRIPPER_APPROACH_MARGIN = 5.
+    #: the STATUS flags (active low) signaling the grasp of an object by a motor stall
+    GRIPPER_STALL_FLAGS = defs.Status.STEP_LOSS_A | defs.Status.STEP_LOSS_B | defs.Status.OCD
+
+    #: default rate (Hz) of the Cartesian velocity control loop
+    CARTESIAN_CONTROL_RATE = 20
+
+    #: optional collision checker (see :py:class:`pybot.youpi2.collision.CollisionChecker`) used
+    #: to reject the moves before they are executed
+    collision_checker = None
+    #: joint angle step (degrees) used to sample the paths checked for collisions
+    COLLISION_CHECK_STEP = 2.
+
+    #: period (s) of the verification of the shadow positions against the ABS_POS registers
+    #: (None for no periodic verification)
+    position_verify_period = None
+    #: maximum difference (steps) between the shadow positions and the ABS_POS registers
+    POSITION_VERIFY_TOLERANCE = 0
+
     #: offset angles from the optical index to the true zero mechanical position
     index_offsets = {
         MOTOR_SHOULDER: -6,
@@ -207,42 +391,207 @@ class YoupiArm(DaisyChain):
         except ValueError:
             raise ValueError("invalid motor name (%s)" % motor_name)
 
-    def __init__(self, spi_bus=0, spi_dev=0, logger=None):
+    def __init__(self, spi_bus=0, spi_dev=0, logger=None, calibration=None, state_path=None):
         """
         :param int spi_bus: the number of the SPI bus used
         :param int spi_dev: the id of the device on the SPI bus
         :param logger: optional logger
+        :param calibration: optional calibration data or file path (see :py:meth:`apply_calibration`).
+                            If not provided, the default calibration file is used if it exists
+                            (see :py:func:`pybot.youpi2.calibration.default_calibration`). Use
+                            False to keep the nominal index offsets.
+        :param str state_path: optional path of the file the motor positions are persisted in
+                               (see :py:mod:`pybot.youpi2.state`)
         """
         super(YoupiArm, self).__init__(
             chain_length=self.MOTORS_COUNT,
-            spi=DSPinSpiDev(spi_bus, spi_dev),
+            spi=self._create_spi_device(spi_bus, spi_dev),
             standby_pin=self.DEFAULT_STANDBY_PIN,
             busyn_pin=self.DEFAULT_BUSYN_PIN,
             logger=logger
         )
         self.ready = False
 
+        # motor settings configuration (see configure and use_profile)
+        self._base_settings = self.settings
+        #: the named motion profiles, as (motor name: (setting name: value)) dictionaries
+        self.profiles = {}
+        #: the name of the profile in use, None for the base settings
+        self.profile = None
+
+        # shadow model of the motor positions (see _shadow_positions)
+        self._shadow_pos = [None] * self.MOTORS_COUNT
+        self._shadow_moving = set()
+        self._shadow_verified_at = 0
+
+        # current values of the motion profile registers (see _apply_profiles)
+        self._profile_regs = self.nominal_profile_registers()
+        self._scaled_motors = set()
+        self._profiles_pending = False
+
+        # motion completion notification by the BUSYN line edges (see _wait_motion)
+        self._busyn_event = None
+        self._busyn_released_at = None
+        self._completion_latencies = collections.deque(maxlen=self.LATENCY_HISTORY)
+
+        #: lock serializing the accesses to the chain (see :py:meth:`snapshot`)
+        self.bus_lock = threading.RLock()
+
+        # persistence of the positions (see initialize and shutdown)
+        self.state_path = state_path
+        #: the motors which positions have been restored at initialization
+        self.restored_motors = []
+        self._origins_known = set()
+
+        if calibration is None:
+            calibration = default_calibration()
+        if calibration:
+            self.apply_calibration(calibration)
+
+    def _create_spi_device(self, spi_bus, spi_dev):
+        """ Returns the SPI device used to communicate with the dSPIN chain. """
+        return DSPinSpiDev(spi_bus, spi_dev)
+
+    def apply_calibration(self, calibration):
+        """ Replaces the nominal index offsets by calibrated ones.
+
+        The offsets are stored as an instance attribute, overriding the class level ones. Offsets
+        not provided by the calibration keep their nominal value. The new offsets are taken
+        in account by the next origins seeking.
+
+        :param calibration: the calibration data (see :py:mod:`pybot.youpi2.calibration`), or the
+                            path of the file containing them
+        """
+        if not isinstance(calibration, dict):
+            calibration = load_calibration(calibration)
+        index_offsets = dict(YoupiArm.index_offsets)
+        for name, offset in calibration.get('index_offsets', {}).iteritems():
+            index_offsets[self.motor_id(name)] = float(offset)
+        self.index_offsets = index_offsets
+        self.logger.info('calibration applied: index_offsets=%s', ', '.join(
+            '%s:%.2f' % (self.motor_name(m), o) for m, o in sorted(index_offsets.iteritems())
+        ))
+
     def configure(self, cfg):
         """ Configures the arm based on the provided data.
 
-        :param dict cfg: configuration data
+        The base settings of the motors are replaced by the configured ones, and the named
+        motion profiles are defined (see :py:meth:`use_profile`). The settings are stored as
+        an instance attribute, overriding the class level ones.
+
+        The settings listed in :py:attr:`STATIC_SETTINGS` can be changed only if the arm
+        is not initialized yet. Once it is, the dynamic registers which values are changed
+        by the new settings are written immediately, the base settings being put in use.
+
+        :param cfg: the configuration data (see :py:mod:`pybot.youpi2.config`), or the
+                    path of the file containing them
+        :raise ValueError: if the configuration is invalid
         """
+        if not isinstance(cfg, dict):
+            cfg = load_config(cfg)
         self.logger.info('loading external configuration:')
-        raise NotImplementedError()
-        # for m_name, m_cfg in cfg.iteritems():
-        #     prefix = m_name.upper() + '_'
-        #     for p_name, p_value in m_cfg.iteritems():
-        #         a_name = prefix + p_name.upper()
-        #         self.log.info('- %s : %s', a_name, p_value)
-        #         setattr(self, a_name, p_value)
+        for motor_name, values in sorted(cfg.get('settings', {}).iteritems()):
+            self.logger.info('- %s: %s', motor_name, values)
+
+        base = self._overridden_settings(type(self).settings, cfg.get('settings', {}), not self.ready)
+        profiles = {}
+        for name, overrides in cfg.get('profiles', {}).iteritems():
+            # checked now, so that errors are reported at configuration time
+            self._overridden_settings(base, overrides, False)
+            profiles[name] = overrides
+            self.logger.info('- profile %s: %s', name, overrides)
+
+        self._base_settings = base
+        self.profiles = profiles
+        self.use_profile(None)
+
+    def _overridden_settings(self, settings, overrides, static_allowed):
+        """ Returns a copy of the motor settings list, some of their values being overridden.
+
+        :param list settings: the motor settings
+        :param dict overrides: the new values, keyed by setting name, themselves keyed by motor name
+        :param bool static_allowed: True if the settings listed in :py:attr:`STATIC_SETTINGS` can
+                                    be changed
+        :return: the new motor settings list
+        :rtype: list
+        :raise ValueError: if a motor or a setting is unknown, or if a static setting is changed
+                           while not allowed
+        """
+        settings = list(settings)
+        for motor_name, values in overrides.iteritems():
+            m = self.motor_id(motor_name)
+            s = copy.copy(settings[m])
+            for name, value in values.iteritems():
+                if not name.islower() or name.startswith('_') or callable(getattr(s, name, None)):
+                    raise ValueError('invalid setting (%s.%s)' % (motor_name, name))
+                if isinstance(getattr(type(s), name, None), property):
+                    raise ValueError('%s.%s is derived from other settings' % (motor_name, name))
+                if name in self.STATIC_SETTINGS and value != getattr(s, name) and not static_allowed:
+                    raise ValueError('%s.%s cannot be changed while the arm is in use' % (motor_name, name))
+                setattr(s, name, value)
+            settings[m] = s
+        return settings
+
+    def use_profile(self, name=None):
+        """ Puts a named motion profile in use.
+
+        If the arm is initialized, only the registers which values are changed by the
+        profile are written, without re-initializing the chain. Since the ``ACC`` and ``DEC``
+        registers can be written only when the motors are stopped, the arm must not be moving.
+
+        :param str name: the name of the profile, or None for the base settings
+        :raise ValueError: if the profile is not defined
+        :raise YoupiArmError: if the motors are moving
+        """
+        if name is not None and name not in self.profiles:
+            raise ValueError('undefined profile (%s)' % name)
+        settings = self._base_settings if name is None else \
+            self._overridden_settings(self._base_settings, self.profiles[name], False)
+
+        if self.ready:
+            if self.is_busy:
+                raise YoupiArmError('profile cannot be changed while moving')
+            current = self._settings_registers(self.settings)
+            # the profile registers may have been scaled for a synchronized move
+            current.update(self._profile_regs)
+            changed = []
+            for reg, values in sorted(self._settings_registers(settings).iteritems()):
+                if values != list(current[reg]):
+                    setattr(self, reg, tuple(values))
+                    changed.append(reg)
+            self.logger.info('profile %s applied (written registers: %s)', name, ', '.join(changed) or 'none')
+
+        self.settings = settings
+        self.profile = name
+        self._profile_regs = self.nominal_profile_registers()
+        self._scaled_motors.clear()
+        self._profiles_pending = False
+
+    @staticmethod
+    def _settings_registers(settings):
+        """ Returns the values of the dynamic registers defined by motor settings.
+
+        :param list settings: the motor settings
+        :return: the per motor values, keyed by register name
+        :rtype: dict
+        """
+        return {
+            reg: [conv(getattr(s, name)) if conv else getattr(s, name) for s in settings]
+            for name, (reg, conv) in YoupiArm.SETTINGS_REGISTERS.iteritems()
+        }
 
     def initialize(self):
         """ Customized initialisation of dSPIN chain. """
-        if not real_raspi:
+        if not self.backend_available:
             self.logger.warn('not on a real RasPi => bypassing initialization')
             return
 
-        GPIO.setmode(GPIO.BOARD)
+        if real_raspi:
+            GPIO.setmode(GPIO.BOARD)
+
+        self._invalidate_shadow()
+        # must be checked before the chain initialization resets the chips
+        state = self._restorable_state() if self.state_path else None
 
         self.logger.info('initializing daisy chain')
         try:
@@ -251,6 +600,9 @@ class YoupiArm(DaisyChain):
         except IOError as e:
             raise YoupiArmError('IOError (check arm connection to SPI)')
 
+        if real_raspi:
+            self._setup_busyn_notification()
+
         self.logger.info("applying settings")
         for i, s in enumerate(self.settings):
             self.logger.info("[%d] %s", i, s)
@@ -273,6 +625,14 @@ class YoupiArm(DaisyChain):
                 for s in self.settings
             )
         )
+        self._profile_regs = self.nominal_profile_registers()
+        self._scaled_motors.clear()
+
+        self.restored_motors = []
+        self._origins_known.clear()
+        if state:
+            self._restore_positions(state)
+
         self.set_config(
             oc_sd=defs.Configuration.OC_SD_DISABLE,
             sw_mode=defs.Configuration.SW_MODE_USER
@@ -288,7 +648,7 @@ class YoupiArm(DaisyChain):
 
         :param bool emergency: emergency shutdown option (don't try to act on the arm is set)
         """
-        if not real_raspi:
+        if not self.backend_available:
             self.logger.warn('not on a real RasPi => bypassing shutdown')
             return
 
@@ -298,52 +658,316 @@ class YoupiArm(DaisyChain):
             except CommandTimeOut:
                 self.logger.error('timeout while waiting for gripper opening completion')
 
+            if self.state_path:
+                self._save_state()
+
+        if self._busyn_event is not None:
+            GPIO.remove_event_detect(self.DEFAULT_BUSYN_PIN)
+            self._busyn_event = None
+
         super(YoupiArm, self).shutdown()
 
-    def open_gripper(self, wait=True, wait_cb=None, timeout=TimeOuts.OPEN_GRIPPER):
+    def _restorable_state(self):
+        """ Returns the persisted position state if it can be restored, None otherwise.
+
+        The positions can be restored if they have been saved by a clean shutdown and if the
+        chips report no power loss since then (UVLO flag).
+        """
+        try:
+            state = load_state(self.state_path)
+        except (IOError, ValueError) as e:
+            self.logger.info('no usable position state (%s)', e)
+            return None
+
+        # from now on, a crash must not let these positions be restored
+        save_state(dict(state, clean_shutdown=False), self.state_path)
+        if not state['clean_shutdown']:
+            self.logger.warning('last shutdown was not clean => positions not restored')
+            return None
+
+        try:
+            status = self.get_status()
+        except IOError:
+            return None
+        # UVLO flag is active low, and is latched until a status read
+        if any(not s & defs.Status.UVLO for s in status):
+            self.logger.warning('power loss detected => positions not restored')
+            return None
+        return state
+
+    def _restore_positions(self, state):
+        """ Restores the persisted positions of the motors which origin was known. """
+        motors = [self.motor_id(name) for name in state['homed']]
+        positions = self.read_register(Register.ABS_POS)
+        for m in motors:
+            positions[m] = state['positions'][self.MOTOR_NAMES[m]]
+        self.ABS_POS = tuple(positions)
+
+        self._invalidate_shadow()
+        self._origins_known.update(motors)
+        self.restored_motors = sorted(motors)
+        self.logger.info('positions restored for %s', ', '.join(self.MOTOR_NAMES[m] for m in self.restored_motors))
+
+    def _save_state(self):
+        """ Persists the current positions, with the clean shutdown marker if no motion is in
+        progress.
+        """
+        positions = self.read_register(Register.ABS_POS)
+        commanded = self._shadow_positions(goals=True)
+        save_state({
+            'clean_shutdown': not self.is_busy,
+            'homed': [self.MOTOR_NAMES[m] for m in sorted(self._origins_known)],
+            'positions': dict(zip(self.MOTOR_NAMES, positions)),
+            'commanded': dict(zip(self.MOTOR_NAMES, commanded)),
+            'saved_at': time.time(),
+        }, self.state_path)
+
+    def _setup_busyn_notification(self):
+        """ Sets up the notification of the BUSYN line release (i.e. of its rising edge),
+        waits falling back to polling if not possible.
+        """
+        event = threading.Event()
+
+        def busyn_released(_channel):
+            self._busyn_released_at = time.time()
+            event.set()
+
+        try:
+            GPIO.add_event_detect(self.DEFAULT_BUSYN_PIN, GPIO.RISING, callback=busyn_released)
+        except RuntimeError as e:
+            self.logger.warning('BUSYN edge detection not available (%s) => using polling', e)
+        else:
+            self._busyn_event = event
+
+    def _wait_motion(self, wait_cb=None, timeout=None):
+        """ Waits for the end of the motions in progress.
+
+        The release of the BUSYN line is notified by an edge interrupt if available, the
+        busy state being polled otherwise (as for the simulated chains).
+
+        :param wait_cb: optional callable invoked periodically while waiting
+        :param float timeout: the maximum wait time (s)
+        :raise CommandTimeOut: if the timeout expired before the end of the motions
+        """
+        time_limit = time.time() + timeout if timeout else None
+        event = self._busyn_event
+        period = self.BUSY_POLL_PERIOD if event is None else self.WAIT_CB_PERIOD
+        last_busy_at = None
+        while True:
+            if event is not None:
+                # cleared before checking the line, so that no edge can be missed
+                event.clear()
+            if not self.is_busy:
+                break
+            last_busy_at = time.time()
+            if time_limit and last_busy_at >= time_limit:
+                raise CommandTimeOut('motion not completed in %.1fs' % timeout)
+            if event is not None:
+                event.wait(period)
+            else:
+                time.sleep(period)
+            if wait_cb:
+                wait_cb()
+
+        if last_busy_at is not None:
+            now = time.time()
+            released_at = self._busyn_released_at
+            if event is not None and released_at is not None and released_at >= last_busy_at:
+                self._completion_latencies.append(now - released_at)
+            else:
+                # the motion ended somewhere since the last busy state reading
+                self._completion_latencies.append(now - last_busy_at)
+
+    def completion_latency(self):
+        """ Returns the statistics of the motion completion detection latency, i.e. the delay
+        between the end of a motion and the moment it is noticed by the waits.
+
+        With edge notifications, the latency is measured from the BUSYN line release. When
+        polling, its upper bound is given, measured from the last busy state reading.
+
+        :return: the (count, mean, max) tuple of the latencies (s) of the last waits, or None
+                 if no wait occurred yet
+        """
+        latencies = self._completion_latencies
+        if not latencies:
+            return None
+        return len(latencies), sum(latencies) / len(latencies), max(latencies)
+
+    def open_gripper(self, wait=True, wait_cb=None, timeout=None):
         """ Opens the gripper.
 
         :param bool wait: if True, wait until the motion is complete before returning to caller
         :param wait_cb: callback function which is called at the end of the motion
-        :param timeout: the maximum motion duration
+        :param timeout: the maximum motion duration (default: derived from its estimation)
         """
-        if not real_raspi:
+        if not self.backend_available:
             self.logger.warn('not on a real RasPi => bypassing open_gripper')
             return
 
         motors = [self.MOTOR_GRIPPER]
+        if timeout is None:
+            position = self._shadow_positions(goals=True)[self.MOTOR_GRIPPER]
+            timeout = self.TimeOuts.from_duration(
+                self.settings[self.MOTOR_GRIPPER].move_duration(position), self.TimeOuts.OPEN_GRIPPER
+            )
 
         self.go_home(motors, wait, wait_cb, timeout)
 
-    def close_gripper(self, wait=True, wait_cb=None, timeout=TimeOuts.CLOSE_GRIPPER):
+    def open_gripper_to(self, width, wait=True, wait_cb=None, timeout=None):
+        """ Moves the gripper jaws to a given spacing, based on the model defined by the
+        gripper settings (see :py:class:`GripperMotorSettings`).
+
+        The gripper must have been calibrated (see :py:meth:`calibrate_gripper`).
+
+        :param float width: the spacing of the jaws (mm)
+        :param bool wait: if True, wait until the motion is complete before returning to caller
+        :param wait_cb: callback function which is called at the end of the motion
+        :param timeout: the maximum motion duration (default: derived from its estimation)
+        :raise: OutOfBoundError if the spacing is outside of the gripper range
+        :raise: YoupiArmError if the gripper is not calibrated
+        """
+        if not self.backend_available:
+            self.logger.warn('not on a real RasPi => bypassing open_gripper_to')
+            return
+
+        settings = self.settings[self.MOTOR_GRIPPER]
+        if not 0 <= width <= settings.open_width:
+            raise OutOfBoundError("gripper width (%f) out of bounds" % width)
+        if self.MOTOR_GRIPPER not in self._origins_known:
+            raise YoupiArmError('gripper not calibrated')
+
+        self.goto(*self.expand_parameters({
+            self.MOTOR_GRIPPER: [settings.width_to_position(width)]
+        }), wait=wait, wait_cb=wait_cb, timeout=timeout)
+
+    def open_gripper_by(self, delta, wait=True, wait_cb=None, timeout=None):
+        """ Changes the spacing of the gripper jaws (see :py:meth:`open_gripper_to`).
+
+        :param float delta: the spacing change (mm), negative values closing the gripper
+        :param bool wait: if True, wait until the motion is complete before returning to caller
+        :param wait_cb: callback function which is called at the end of the motion
+        :param timeout: the maximum motion duration (default: derived from its estimation)
+        :raise: OutOfBoundError if the resulting spacing is outside of the gripper range
+        :raise: YoupiArmError if the gripper is not calibrated
+        """
+        if not self.backend_available:
+            self.logger.warn('not on a real RasPi => bypassing open_gripper_by')
+            return
+
+        self.open_gripper_to(self.gripper_width() + delta, wait=wait, wait_cb=wait_cb, timeout=timeout)
+
+    def gripper_width(self):
+        """ Returns the current spacing (mm) of the gripper jaws, as given by the model defined
+        by the gripper settings. The result is meaningful only if the gripper is calibrated.
+        """
+        position = self._shadow_positions(goals=True)[self.MOTOR_GRIPPER]
+        return self.settings[self.MOTOR_GRIPPER].position_to_width(position)
+
+    def close_gripper(self, wait=True, wait_cb=None, timeout=None, object_width=None):
         """ Closes the gripper.
 
         The motion is automatically stopped when the object (if any) grasp is detected.
 
+        If the width of the object is given, the fast close mode is used : the gripper is
+        moved at full speed up to :py:attr:`GRIPPER_APPROACH_MARGIN` from the object, and then
+        closed at the closing speed. The grasp is detected by the switch or by the stall and
+        over-current flags of the motor status (see :py:attr:`GRIPPER_STALL_FLAGS`), whichever
+        comes first. The approach requires the gripper to be calibrated, and the call is
+        always blocking in this mode (``wait`` must be True). The object must not be wider
+        than expected by more than the approach margin, since it would be hit at full speed.
+
         :param bool wait: if True, wait until the motion is complete before returning to caller
         :param wait_cb: callback function which is called at the end of the motion
-        :param timeout: the maximum motion duration
+        :param timeout: the maximum motion duration (default: derived from its estimation),
+                        including the approach in fast close mode
+        :param float object_width: the expected width (mm) of the grasped object, for using the
+                                   fast close mode
+        :raise: ValueError if the fast close mode is requested without waiting
         """
-        if not real_raspi:
+        if not self.backend_available:
             self.logger.warn('not on a real RasPi => bypassing close_gripper')
             return
 
         if self.switch_is_closed[self.MOTOR_GRIPPER]:
             return
 
+        settings = self.settings[self.MOTOR_GRIPPER]
+        if object_width is not None:
+            if not wait:
+                raise ValueError('the fast close mode is blocking')
+            self._fast_close_gripper(object_width, wait_cb, timeout)
+            return
+
+        if timeout is None:
+            # the closing distance is not known, but cannot exceed the full range
+            timeout = self.TimeOuts.from_duration(
+                settings.move_duration(settings.open_steps, max_speed=settings.close_speed),
+                self.TimeOuts.CLOSE_GRIPPER
+            )
+
         self.go_until(*self.expand_parameters({
             self.MOTOR_GRIPPER: (
                 defs.GoUntilAction.COPY,
                 defs.Direction.REV,
-                self.settings[self.MOTOR_GRIPPER].close_speed
+                settings.close_speed
             )
         }), wait=wait, wait_cb=wait_cb, timeout=timeout)
 
+    def _fast_close_gripper(self, object_width, wait_cb, timeout):
+        """ Fast close mode of :py:meth:`close_gripper`. """
+        motor, settings = self.MOTOR_GRIPPER, self.settings[self.MOTOR_GRIPPER]
+        closed = -settings.open_steps
+
+        approach = None
+        if motor in self._origins_known:
+            position = self._shadow_positions(goals=True)[motor]
+            approach = settings.width_to_position(object_width + self.GRIPPER_APPROACH_MARGIN)
+            if position <= approach:
+                approach = None
+        else:
+            self.logger.warning('gripper not calibrated => no fast approach')
+            position = 0
+
+        if timeout is None:
+            duration = settings.move_duration(position - closed, max_speed=settings.close_speed)
+            if approach is not None:
+                duration = settings.move_duration(position - approach) + \
+                    settings.move_duration(approach - closed, max_speed=settings.close_speed)
+            timeout = self.TimeOuts.from_duration(duration, self.TimeOuts.CLOSE_GRIPPER)
+        # the timeout applies to the whole sequence
+        time_limit = time.time() + timeout
+
+        if approach is not None:
+            self.goto(*self.expand_parameters({motor: [approach]}), wait_cb=wait_cb,
+                      timeout=max(time_limit - time.time(), 0.001))
+        if self.switch_is_closed[motor]:
+            return
+
+        # clears the latched flags
+        self.get_status()
+        self.go_until(*self.expand_parameters({
+            motor: (defs.GoUntilAction.COPY, defs.Direction.REV, settings.close_speed)
+        }), wait=False)
+        while True:
+            status = self.get_status()[motor]
+            if ~status & self.GRIPPER_STALL_FLAGS:       # flags are active low
+                self.logger.info('gripper stall detected (status=0x%04x)', status)
+                self.hard_stop([motor])
+                break
+            if status & defs.Status.BUSY:               # BUSY flag is active low
+                break
+            if time.time() >= time_limit:
+                self.soft_stop([motor])
+                raise CommandTimeOut('gripper not closed in %.1fs' % timeout)
+            if wait_cb:
+                wait_cb()
+            time.sleep(self.BUSY_POLL_PERIOD)
+
     def gripper_is_closed(self):
         """ Tells if the gripper is currently closed or holding something """
         return self.switch_is_closed[self.MOTOR_GRIPPER]
 
-    def calibrate_gripper(self, wait=True, wait_cb=None, timeout=TimeOuts.CALIBRATE_GRIPPER):
+    def calibrate_gripper(self, wait=True, wait_cb=None, timeout=None):
         """ Calibrates the gripper.
 
         The executed sequence consists in locating the end of the close motion, then opening
@@ -352,32 +976,101 @@ class YoupiArm(DaisyChain):
 
         :param bool wait: if True, wait until the motion is complete before returning to caller
         :param wait_cb: callback function which is called at the end of the motion
-        :param timeout: the maximum motion duration
+        :param timeout: the maximum duration of the opening motion (default: derived from its estimation)
         """
-        if not real_raspi:
+        if not self.backend_available:
             self.logger.warn('not on a real RasPi => bypassing calibrate_gripper')
             return
 
-        self.close_gripper()
+        self.close_gripper(wait_cb=wait_cb)
+        settings = self.settings[self.MOTOR_GRIPPER]
+        if timeout is None:
+            timeout = self.TimeOuts.from_duration(
+                settings.move_duration(settings.open_steps), self.TimeOuts.CALIBRATE_GRIPPER
+            )
         self.move(*self.expand_parameters({
             self.MOTOR_GRIPPER: (
                 defs.Direction.FWD,
-                self.settings[self.MOTOR_GRIPPER].open_steps
+                settings.open_steps
             )
         }), wait=wait, wait_cb=wait_cb, timeout=timeout)
 
         self.reset_pos([self.MOTOR_GRIPPER])
+        self._origins_known.add(self.MOTOR_GRIPPER)
 
-    def seek_origins(self, joint_sequence=None, timeout=TimeOuts.SEEK_ORIGIN):
+    def seek_origins(self, joint_sequence=None, timeout=TimeOuts.SEEK_ORIGIN, concurrent=False):
         """ Moves to the origins for a list of joints.
 
         The motions are done in the sequence of the provided joints list.
 
+        In concurrent mode, the index searches of all the joints are executed at the same time.
+        This is possible since the position of the optical index of a motor depends on this
+        motor only, and not on the positions of the joints it is coupled with (see
+        :py:meth:`index_compensation`). The compensations of the optical index offsets are
+        applied by a single move at the end.
+
         :param list joint_sequence: the list of involved joints
         :param timeout: the maximum motion duration
+        :param bool concurrent: True for seeking the origins of independent joints at the same time
         """
-        for motor in joint_sequence or range(self.MOTORS_COUNT):
-            self.seek_origin(motor, timeout=timeout)
+        motors = joint_sequence or range(self.MOTORS_COUNT)
+        if not concurrent:
+            for motor in motors:
+                self.seek_origin(motor, timeout=timeout)
+            return
+
+        if not self.backend_available:
+            self.logger.warn('not on a real RasPi => bypassing seek_origins')
+            return
+
+        motors = [m for m in motors if m != self.MOTOR_GRIPPER]
+        self._concurrent_index_searches([[m] for m in motors], timeout)
+        self.joints_move({m: self.index_compensation(m) for m in motors})
+        self.reset_pos(motors)
+        self._origins_known.update(motors)
+
+    def home(self, verify_joint=None, timeout=TimeOuts.SEEK_ORIGIN, concurrent=True):
+        """ Moves the joints to their origins, unless their positions have been restored at
+        initialization.
+
+        When all the positions have been restored, the index of a joint can be checked to
+        confirm them, a failure triggering a full homing.
+
+        :param int verify_joint: the joint which index is checked if the positions have been
+                                 restored (see :py:meth:`verify_index`), None for no check
+        :param timeout: the maximum motion duration
+        :param bool concurrent: see :py:meth:`seek_origins`
+        """
+        motors = [m for m in self.JOINT_MOTORS if m not in self.restored_motors]
+        if not motors and verify_joint is not None and not self.verify_index(verify_joint, timeout=timeout):
+            self.logger.warning('restored positions are wrong => full homing')
+            motors = self.JOINT_MOTORS
+        if motors:
+            self.seek_origins(motors, timeout=timeout, concurrent=concurrent)
+
+    def verify_index(self, motor, timeout=None):
+        """ Checks the position of a motor with respect to its optical index.
+
+        The motor is moved on both sides of the index, at the distance defined by
+        :py:attr:`INDEX_VERIFY_MARGIN`, and the switch state is checked at each place. The motor
+        is moved back to its initial position at the end.
+
+        :param int motor: the id of the motor
+        :param timeout: the maximum motion duration (default: derived from its estimation)
+        :return: True if the switch states match the index expected position
+        :rtype: bool
+        """
+        index = -self.index_compensation(motor)
+        start = self.get_motor_positions(goals=True)[motor]
+        try:
+            for offset, closed in ((-self.INDEX_VERIFY_MARGIN, False), (self.INDEX_VERIFY_MARGIN, True)):
+                self.joints_goto({motor: index + offset}, timeout=timeout)
+                if self.switch_is_closed[motor] != closed:
+                    self.logger.warning('%s index not found at its expected position', self.MOTOR_NAMES[motor])
+                    return False
+            return True
+        finally:
+            self.joints_goto({motor: start}, timeout=timeout)
 
     def seek_origin(self, motor, timeout=TimeOuts.SEEK_ORIGIN):
         """ Moves a given motor to its origin and resets its position register.
@@ -387,93 +1080,264 @@ class YoupiArm(DaisyChain):
         :param motor: id of the involved motor
         :param timeout: the maximum motion duration
         """
-        if not real_raspi:
+        if not self.backend_available:
             self.logger.warn('not on a real RasPi => bypassing seek_origin')
             return
 
         if motor == self.MOTOR_GRIPPER:
             return
 
-        initial_switch_state = self.switch_is_closed[motor]
-
-        def timeout_abort(action):
-            msg = "%s %s motor origin" % (action, self.MOTOR_NAMES[motor])
-            self.logger.error("time out while " + msg)
-            raise CommandTimeOut(msg)
-
-        # starts the motor in the appropriate direction to go towards the origin
-        direction = defs.Direction.REV if initial_switch_state else defs.Direction.FWD
-        self.run(*self.expand_parameters({
-            motor: (
-                direction,
-                self.settings[motor].max_speed)
-        }))
-        # wait until the index is detected or the maximum allowed delay is expired,
-        # and abort the operation in this case
-        time_limit = time.time() + timeout
-        try:
-            while self.switch_is_closed[motor] == initial_switch_state:
-                if time.time() >= time_limit:
-                    timeout_abort('seeking')
-                time.sleep(0.1)
-        finally:
-            # use a soft sop to be sure we will slight pass the index
-            self.soft_stop([motor])
+        for condition, phase in self._index_search(motor):
+            try:
+                if condition == self._SWITCH_OPEN:
+                    time_limit = time.time() + timeout
+                    while self.switch_is_closed[motor]:
+                        if time.time() >= time_limit:
+                            raise CommandTimeOut()
+                        time.sleep(self.BUSY_POLL_PERIOD)
+                else:
+                    self._wait_motion(timeout=timeout)
+            except CommandTimeOut:
+                self._abort_index_search([motor], phase)
 
-        # starts the motor to go back slowly to the index (we have overshot it
-        # since using a soft stop previously)
-        self.run(*self.expand_parameters({
-            motor: (
-                defs.Direction.invert(direction),
-                self.settings[motor].min_speed)
-        }))
+        self.joints_move({motor: self.index_compensation(motor)})
+        self.reset_pos([motor])
+        self._origins_known.add(motor)
 
-        # wait until the index is detected again or the maximum allowed delay is expired,
-        # and abort the operation in this case
-        time_limit = time.time() + timeout
-        try:
-            while self.switch_is_closed[motor] != initial_switch_state:
-                if time.time() >= time_limit:
-                    timeout_abort('adjusting to')
-                time.sleep(0.1)
-        except CommandTimeOut:
-            self.hard_stop([motor])
-            raise
+    def index_compensation(self, motor):
+        """ Returns the compensation of the optical index offset of a motor, taking into account
+        the coupling with parent joints if any.
 
-        # if here, we could complete the whole sequence successfully
-        self.hard_stop([motor])
+        The optical index is detected on the motor side of the transmission, its position being
+        thus fixed in the motor frame, whatever the positions of the other motors. The coupling
+        only affects the joint origins, which are defined with respect to the parent joints
+        ones, hence the accumulation of the parents offsets.
 
-        # apply the compensation for the optical index offset, taking into account
-        # the coupling with parent joints if any
+        :param int motor: the motor id
+        :return: the angle (degrees) between the index and the origin of the motor
+        :rtype: float
+        """
         parent = self.JOINT_PARENTS[motor]
         compensation = self.index_offsets.get(motor, 0)
         while parent:
             compensation += self.index_offsets.get(parent, 0)
             parent = self.JOINT_PARENTS[parent]
-        self.joints_move({motor: compensation})
+        return compensation
 
-        self.reset_pos([motor])
+    # end conditions of the index search phases
+    _SWITCH_OPEN, _MOTION_END = range(2)
+
+    def _index_search(self, motor):
+        """ Generator moving a motor to its optical index.
+
+        The commands of each phase are issued by the generator, which then yields the
+        (condition, phase) tuple describing the end of the phase to be waited for.
+        """
+        settings = self.settings[motor]
 
-    def rotate_hand(self, angle, wait=True, wait_cb=None, timeout=TimeOuts.ROTATE_HAND):
+        # starts the motor in the appropriate direction to go towards the origin
+        if self.switch_is_closed[motor]:
+            direction = defs.Direction.REV
+            # the chips can stop on the switch opening at low speed only, hence the polling
+            self.run(*self.expand_parameters({motor: (direction, settings.max_speed)}))
+            yield self._SWITCH_OPEN, 'seeking'
+            # use a soft sop to be sure we will slight pass the index
+            self.soft_stop([motor])
+            yield self._MOTION_END, 'seeking'
+
+            # go back slowly to the index, the chip stopping by itself when the switch closes again
+            self.go_until(*self.expand_parameters({
+                motor: (defs.GoUntilAction.COPY, defs.Direction.invert(direction), settings.min_speed)
+            }), wait=False)
+            yield self._MOTION_END, 'adjusting to'
+
+        else:
+            direction = defs.Direction.FWD
+            # the chip stops by itself (soft stop) when the switch closes, slightly passing the
+            # index
+            self.go_until(*self.expand_parameters({
+                motor: (defs.GoUntilAction.COPY, direction, settings.max_speed)
+            }), wait=False)
+            yield self._MOTION_END, 'seeking'
+
+            # go back slowly to the index, the chip stopping by itself when the switch opens
+            self.release_sw(*self.expand_parameters({
+                motor: (defs.GoUntilAction.COPY, defs.Direction.invert(direction))
+            }), wait=False)
+            yield self._MOTION_END, 'adjusting to'
+
+    def _abort_index_search(self, motors, phase):
+        msg = "%s %s motor origin" % (phase, ', '.join(self.MOTOR_NAMES[m] for m in motors))
+        self.logger.error("time out while " + msg)
+        self.hard_stop(motors)
+        raise CommandTimeOut(msg)
+
+    def _concurrent_index_searches(self, sequences, timeout):
+        """ Executes the index searches of several sequences of motors at the same time.
+
+        The end of the phases being detected by polling the switches and the status of the
+        motors, the BUSYN line cannot tell which motor has completed its motion.
+
+        :param list sequences: the sequences of motors
+        :param timeout: the maximum duration of each phase
+        """
+        pending = [list(seq) for seq in sequences]
+        # the state of the search in progress of each sequence, as a list
+        # (motor, search, condition, phase, time limit)
+        current = [None] * len(pending)
+
+        def advance(i):
+            while pending[i] or current[i]:
+                if current[i] is None:
+                    motor = pending[i].pop(0)
+                    current[i] = [motor, self._index_search(motor)]
+                motor, search = current[i][:2]
+                try:
+                    condition, phase = next(search)
+                except StopIteration:
+                    current[i] = None
+                else:
+                    current[i] = [motor, search, condition, phase, time.time() + timeout]
+                    return
+
+        try:
+            for i in range(len(pending)):
+                advance(i)
+            while any(current):
+                closed = self.switch_is_closed
+                busy = self._busy_motors()
+                for i, state in enumerate(current):
+                    if state is None:
+                        continue
+                    motor, _, condition, phase, time_limit = state
+                    if not (closed[motor] if condition == self._SWITCH_OPEN else motor in busy):
+                        advance(i)
+                    elif time.time() >= time_limit:
+                        self._abort_index_search([motor], phase)
+                time.sleep(self.BUSY_POLL_PERIOD)
+        except:
+            # do not leave the other motors running
+            self.hard_stop([state[0] for state in current if state is not None])
+            raise
+
+    def rotate_hand(self, angle, wait=True, wait_cb=None, timeout=None):
         """ Rotates the hand by a given angle.
 
         :param int angle: the rotation angle, in degrees
         :param bool wait: if True, wait until the motion is complete before returning to caller
         :param wait_cb: callback function which is called at the end of the motion
-        :param timeout: the maximum motion duration
+        :param timeout: the maximum motion duration (default: derived from its estimation)
         """
+        if timeout is None:
+            timeout = self.TimeOuts.from_duration(
+                self.joints_move_duration({self.MOTOR_HAND_ROT: angle}, coupled=True), self.TimeOuts.ROTATE_HAND
+            )
         self.coupled_joints_move({self.MOTOR_HAND_ROT: angle}, wait=wait, wait_cb=wait_cb, timeout=timeout)
 
-    def rotate_hand_to(self, angle, wait=True, wait_cb=None, timeout=TimeOuts.ROTATE_HAND):
+    def rotate_hand_to(self, angle, wait=True, wait_cb=None, timeout=None):
         """ Rotates the hand to a given angle.
 
         :param int angle: the target angle, in degrees
         :param bool wait: if True, wait until the motion is complete before returning to caller
         :param wait_cb: callback function which is called at the end of the motion
-        :param timeout: the maximum motion duration
+        :param timeout: the maximum motion duration (default: derived from its estimation)
         """
+        if timeout is None:
+            current = self.get_joint_positions(goals=True)[self.MOTOR_HAND_ROT]
+            timeout = self.TimeOuts.from_duration(
+                self.joints_move_duration({self.MOTOR_HAND_ROT: angle - current}, coupled=True),
+                self.TimeOuts.ROTATE_HAND
+            )
         self.coupled_joints_goto({self.MOTOR_HAND_ROT: angle}, wait=wait, wait_cb=wait_cb, timeout=timeout)
 
+    def cartesian_velocity_control(self, kin, velocity_source, rate=CARTESIAN_CONTROL_RATE, stop_event=None):
+        """ Moves the gripper according to a stream of Cartesian velocity set points.
+
+        This implements a resolved rate control : at a fixed rate, the current set point is
+        obtained from the provided source, converted into joint rates using the Jacobian of the
+        kinematics model (see :py:meth:`pybot.youpi2.kin.Kinematics.resolved_rate`), and then
+        into motor speeds, taking the joints coupling into account. They are applied with
+        ``run`` commands, the motors being thus continuously moving instead of stopping at
+        each step.
+
+        The resulting motor speeds are uniformly scaled down if needed to stay within the motor
+        limits, so that the direction of the motion is preserved. The arm is held in place
+        as long as the set point would lead a joint out of its limits.
+
+        The loop ends when the source returns None or when the stop event is set, the motors
+        being then soft stopped.
+
+        :param kin: the kinematics model (a :py:class:`pybot.youpi2.kin.Kinematics` instance)
+        :param velocity_source: a callable returning the current velocity set point, as
+                                (vx, vy, vz, vpitch) in mm/s and degrees/s, or None to stop
+        :param float rate: the control loop rate (Hz)
+        :param stop_event: an optional :py:class:`threading.Event` used to stop the loop
+        """
+        if not self.backend_available:
+            self.logger.warn('not on a real RasPi => bypassing cartesian_velocity_control')
+            return
+
+        period = 1. / rate
+        horizon = 2 * period
+        joints = self.JOINT_MOTORS[:self.MOTOR_HAND_ROT]
+
+        next_time = time.time()
+        try:
+            while not (stop_event and stop_event.is_set()):
+                velocity = velocity_source()
+                if velocity is None:
+                    break
+
+                pose = self.get_joint_positions()
+                rates = dict(zip(joints, kin.resolved_rate(pose, velocity)))
+
+                # hold the arm if the joints would go past their limits before the next updates
+                for j, q_dot in rates.items():
+                    settings = self.settings[j]
+                    if not settings.MIN_POS_DEG <= pose[j] + q_dot * horizon <= settings.MAX_POS_DEG:
+                        if self.logger.getEffectiveLevel() == log.DEBUG:
+                            self.logger.debug('cartesian_velocity_control: %s limit reached', self.MOTOR_NAMES[j])
+                        rates = dict.fromkeys(joints, 0)
+                        break
+                else:
+                    if self.collision_checker is not None and not self.collision_checker.is_free(
+                            [pose[j] + rates[j] * horizon for j in joints]):
+                        if self.logger.getEffectiveLevel() == log.DEBUG:
+                            self.logger.debug('cartesian_velocity_control: collision ahead')
+                        rates = dict.fromkeys(joints, 0)
+
+                # the coupling being linear, it applies to the rates as well
+                self.joint_to_motor(rates)
+                speeds = {m: self.settings[m].dps_to_speed(abs(r)) for m, r in rates.items()}
+                scale = max(float(sp) / self.settings[m].max_speed for m, sp in speeds.items())
+                if scale > 1:
+                    speeds = {m: sp / scale for m, sp in speeds.items()}
+
+                self.run(*self.expand_parameters({
+                    m: (defs.Direction.FWD if rates[m] > 0 else defs.Direction.REV, sp)
+                    for m, sp in speeds.items()
+                }))
+
+                next_time += period
+                time.sleep(max(next_time - time.time(), 0))
+        finally:
+            self.soft_stop(self.JOINT_MOTORS)
+
+    def cartesian_jog(self, kin, velocity, duration, rate=CARTESIAN_CONTROL_RATE):
+        """ Moves the gripper at a constant Cartesian velocity for a given duration.
+
+        Shorthand for :py:meth:`cartesian_velocity_control` with a constant set point.
+
+        :param kin: the kinematics model
+        :param velocity: the gripper velocity, as (vx, vy, vz, vpitch) in mm/s and degrees/s
+        :param float duration: the duration of the motion (s)
+        :param float rate: the control loop rate (Hz)
+        """
+        time_limit = time.time() + duration
+        self.cartesian_velocity_control(
+            kin, lambda: velocity if time.time() < time_limit else None, rate=rate
+        )
+
     @staticmethod
     def _normalize_angles_parameter(angles):
         """ Ensures the angles are specified as a dictionary keyed by the joint identifier.
@@ -493,64 +1357,279 @@ class YoupiArm(DaisyChain):
         the joint angles contained in the dictionary into the corresponding motor angles, take
         mechanical coupling of the motions transmission into account.
 
-        .. Note::
+        The motors coupled to the provided joints are added to the dictionary if not yet
+        included, missing joints being considered at 0.
 
-            The iteration and test seem a bit C-ish, since it does not use
-            iteration on a key view, but this is on purpose. We need to iterate over the
-            sorted list of motors because of the way joints are coupled. Iterating over
-            keys does not ensure this order.
+        Dictionary based wrapper of :py:meth:`joint_to_motor_batch`.
 
         :param dict angles: the angles set points for involved joints
         """
-        for m in [m for m in reversed(cls.MOTORS_ALL) if m in angles]:
-            m_angle = angles[m]
-            child = cls.JOINT_CHILDREN[m]
-            while child is not None:
-                c_dir = -1 if child < 0 else +1
-                child = abs(child)
-                angles[child] = (angles[child] + c_dir * m_angle) if child in angles else c_dir * m_angle
-                child = cls.JOINT_CHILDREN[child]
+        result = cls.COUPLING_MATRIX.dot(cls._angles_vector(angles)).tolist()
+        for m in cls._coupled_motors(angles):
+            angles[m] = result[m]
 
     @classmethod
     def motor_to_joint(cls, angles):
-        """ Performs the reverse operation of :py:meth:``joint_to_motor`` """
-        for m in [m for m in reversed(cls.MOTORS_ALL) if m in angles]:
-            m_angle = angles[m]
-            parent = cls.JOINT_PARENTS[m]
-            if parent is not None:
-                c_dir = -1 if parent < 0 else +1
-                parent = abs(parent)
-                angles[m] = m_angle - angles[parent] * c_dir
+        """ Performs the reverse operation of :py:meth:``joint_to_motor``
+
+        Only the angles of the motors contained in the dictionary are converted, missing ones
+        being considered at 0.
+
+        Dictionary based wrapper of :py:meth:`motor_to_joint_batch`.
+        """
+        result = cls.DECOUPLING_MATRIX.dot(cls._angles_vector(angles)).tolist()
+        for m in angles:
+            angles[m] = result[m]
 
     @classmethod
     def global_to_local(cls, angles):
         """ Converts joint angles to their relative (aka local) value.
 
+        This is the same transformation as :py:meth:`motor_to_joint`, the global angles of the
+        joints being the motor ones.
+
         :param list angles: the angles to convert
         :return: the corresponding local values
         :rtype: list
         """
-        local_angles = angles[:]
-        for j, a in enumerate(angles):
-            parent = cls.JOINT_PARENTS[j]
-            if parent is not None:
-                c_dir = -1 if parent < 0 else +1
-                parent = abs(parent)
-                local_angles[j] = a - angles[parent] * c_dir
+        return cls.DECOUPLING_MATRIX.dot(angles).tolist()
+
+    @classmethod
+    def joint_to_motor_batch(cls, angles):
+        """ Converts joint angles into motor angles.
+
+        :param angles: the (N, 6) array of the joint angles (a single (6,) pose is accepted too)
+        :return: the array of the corresponding motor angles, with the same shape
+        :rtype: numpy.ndarray
+        """
+        return np.dot(angles, cls.COUPLING_MATRIX.T)
 
-        return local_angles
+    @classmethod
+    def motor_to_joint_batch(cls, angles):
+        """ Converts motor angles into joint angles.
+
+        :param angles: the (N, 6) array of the motor angles (a single (6,) pose is accepted too)
+        :return: the array of the corresponding joint angles, with the same shape
+        :rtype: numpy.ndarray
+        """
+        return np.dot(angles, cls.DECOUPLING_MATRIX.T)
+
+    @classmethod
+    def _angles_vector(cls, angles):
+        """ Converts a (motor: angle) dictionary into the equivalent vector. """
+        vector = [0] * cls.MOTORS_COUNT
+        for m, a in angles.iteritems():
+            vector[m] = a
+        return vector
+
+    @classmethod
+    def _coupled_motors(cls, joints):
+        """ Returns the motors involved in the motion of a set of joints. """
+        return set(m for j in joints for m in cls.COUPLED_MOTORS[j])
+
+    # Shadow model of the motor positions
+    #
+    # Reading the ABS_POS registers requires a full round-trip on the daisy chain. To avoid it,
+    # the positions are tracked from the commands issued to the motors, the goal of position
+    # commands being known in advance. Motors driven by speed commands (run, go until,...) or
+    # stopped before the end of their motion have their position re-read from the chips when
+    # needed. Motors which motion has not been waited for are considered as moving until a
+    # reading of their position tells they have reached their goal.
+
+    def _invalidate_shadow(self, motors=None):
+        for m in range(self.MOTORS_COUNT) if motors is None else motors:
+            self._shadow_pos[m] = None
+            self._shadow_moving.discard(m)
+
+    def _sync_shadow(self):
+        """ Reads the positions from the chips and updates the shadow model with them.
+
+        :return: the list of the motors which shadow position was wrong
+        :rtype: list
+        """
+        positions = self.read_register(Register.ABS_POS)
+        errors = []
+        for m, steps in enumerate(positions):
+            shadow = self._shadow_pos[m]
+            if m in self._shadow_moving:
+                if steps == shadow:
+                    self._shadow_moving.discard(m)
+                continue
+            if shadow is not None and abs(steps - shadow) > self.POSITION_VERIFY_TOLERANCE:
+                errors.append(m)
+            self._shadow_pos[m] = steps
+        self._shadow_verified_at = time.time()
+        if errors:
+            self.logger.warning('shadow positions out of sync for %s', ', '.join(self.MOTOR_NAMES[m] for m in errors))
+        return errors
+
+    def _shadow_positions(self, goals=False):
+        """ Returns the positions of the motors (in steps), from the shadow model if possible.
+
+        :param bool goals: if True, the goal positions of moving motors are returned
+        :return: the positions of the motors
+        :rtype: list
+        """
+        verify_due = self.position_verify_period is not None and \
+            time.time() - self._shadow_verified_at >= self.position_verify_period
+        if verify_due or None in self._shadow_pos or (self._shadow_moving and not goals):
+            if goals:
+                self._sync_shadow()
+            else:
+                positions = self.read_register(Register.ABS_POS)
+                self._shadow_moving.difference_update(
+                    m for m in list(self._shadow_moving) if positions[m] == self._shadow_pos[m]
+                )
+                for m, steps in enumerate(positions):
+                    if m not in self._shadow_moving:
+                        self._shadow_pos[m] = steps
+                self._shadow_verified_at = time.time()
+                return positions
+        return list(self._shadow_pos)
+
+    def verify_positions(self):
+        """ Verifies the shadow positions against the ABS_POS registers, and resynchronizes them.
+
+        :return: the list of the motors which shadow position was wrong
+        :rtype: list
+        """
+        return self._sync_shadow()
+
+    def _shadowed_command(self, command, motors, goals, wait=False, wait_cb=None, timeout=None):
+        """ Executes a motion command, updating the shadow positions of the involved motors.
+
+        :param command: a callable executing the command, without waiting for its completion
+        :param list motors: the motors involved in the command
+        :param goals: a callable returning the goal position of a motor, given its id, or
+                      None if the command has no known goal
+        :param bool wait: True for waiting for the end of the motion (see :py:meth:`_wait_motion`)
+        :param wait_cb: optional callable invoked while waiting
+        :param timeout: the maximum motion duration (default: see :py:meth:`_motion_timeout`)
+        """
+        if self._profiles_pending:
+            # the command uses the profiles just set for it
+            self._profiles_pending = False
+        else:
+            self._restore_profiles(motors)
+
+        if wait and timeout is None:
+            timeout = self._motion_timeout(motors, goals)
+
+        if goals is None:
+            self._invalidate_shadow(motors)
+        else:
+            for m in motors:
+                goal = goals(m)
+                if goal is None:
+                    # relative move from an unknown position
+                    self._invalidate_shadow([m])
+                else:
+                    self._shadow_pos[m] = goal
+                    self._shadow_moving.add(m)
+        try:
+            with self.bus_lock:
+                command()
+            if wait:
+                self._wait_motion(wait_cb, timeout)
+        except:
+            self._invalidate_shadow(motors)
+            raise
+        if goals is not None and wait:
+            self._shadow_moving.difference_update(motors)
 
-    def _check_limits(self, angles, rel_move):
+    @staticmethod
+    def _involved_motors(params):
+        return [m for m, p in enumerate(params) if p is not None]
+
+    def move(self, *params, **kwargs):
+        def goals(m):
+            current = self._shadow_pos[m]
+            if current is None:
+                # the move is relative to the position reached after the previous command
+                current = self._shadow_positions(goals=True)[m]
+            direction, steps = params[m]
+            return current + (abs(steps) if direction == defs.Direction.FWD else -abs(steps))
+
+        self._shadowed_command(
+            lambda: super(YoupiArm, self).move(*params, wait=False),
+            self._involved_motors(params), goals, **self._wait_options(kwargs)
+        )
+
+    def goto(self, *params, **kwargs):
+        self._shadowed_command(
+            lambda: super(YoupiArm, self).goto(*params, wait=False),
+            self._involved_motors(params), lambda m: params[m][0], **self._wait_options(kwargs)
+        )
+
+    def run(self, *params, **kwargs):
+        self._shadowed_command(
+            lambda: super(YoupiArm, self).run(*params, **kwargs),
+            self._involved_motors(params), None
+        )
+
+    def go_until(self, *params, **kwargs):
+        self._shadowed_command(
+            lambda: super(YoupiArm, self).go_until(*params, wait=False),
+            self._involved_motors(params), None, **self._wait_options(kwargs)
+        )
+
+    def release_sw(self, *params, **kwargs):
+        self._shadowed_command(
+            lambda: super(YoupiArm, self).release_sw(*params, wait=False),
+            self._involved_motors(params), None, **self._wait_options(kwargs)
+        )
+
+    def go_home(self, motors=None, wait=True, wait_cb=None, timeout=None):
+        self._shadowed_command(
+            lambda: super(YoupiArm, self).go_home(motors, False),
+            range(self.MOTORS_COUNT) if motors is None else motors, lambda m: 0,
+            wait=wait, wait_cb=wait_cb, timeout=timeout
+        )
+
+    @staticmethod
+    def _wait_options(kwargs):
+        """ Returns the wait related options of a motion command, with their defaults. """
+        return {
+            'wait': kwargs.get('wait', True),
+            'wait_cb': kwargs.get('wait_cb'),
+            'timeout': kwargs.get('timeout'),
+        }
+
+    def soft_stop(self, motors=None):
+        self._invalidate_shadow(motors)
+        super(YoupiArm, self).soft_stop(motors)
+
+    def hard_stop(self, motors=None):
+        self._invalidate_shadow(motors)
+        super(YoupiArm, self).hard_stop(motors)
+
+    def soft_hi_Z(self, motors=None):
+        self._invalidate_shadow(motors)
+        super(YoupiArm, self).soft_hi_Z(motors)
+
+    def hard_hi_Z(self, motors=None):
+        self._invalidate_shadow(motors)
+        super(YoupiArm, self).hard_hi_Z(motors)
+
+    def reset_pos(self, motors=None):
+        super(YoupiArm, self).reset_pos(motors)
+        for m in range(self.MOTORS_COUNT) if motors is None else motors:
+            self._shadow_pos[m] = 0
+            self._shadow_moving.discard(m)
+
+    def _check_limits(self, angles, rel_move, current=None):
         """ Checks if the passed angle goals are compatible with the mechanical
         constraints of the arm.
 
         :param dict angles: the joint angle goals
         :param bool rel_move: True if the move is a relative one
+        :param list current: the motor positions (steps) the move starts from (default: the
+                             goal positions of the shadow model)
         :raise: OutOfBoundError if the requested move would push one of more joints outside of
         its limits
         """
         # compute the final positions, depending on the kind of move (absolute or relative)
-        abs_pos_regs = self.read_register(Register.ABS_POS)
+        abs_pos_regs = self._shadow_positions(goals=True) if current is None else current
         if self.logger.getEffectiveLevel() == log.DEBUG:
             self.logger.debug('_check_limits: abs_pos_regs=%s', abs_pos_regs)
         if rel_move:
@@ -577,7 +1656,36 @@ class YoupiArm(DaisyChain):
             if not settings.MIN_POS_DEG <= angle <= settings.MAX_POS_DEG:
                 raise OutOfBoundError("%s goal (%f) out of bounds" % (self.MOTOR_NAMES[motor], angle))
 
-    def joints_move(self, angles, wait=True, wait_cb=None, coupled=False, timeout=TimeOuts.DEFAULT):
+        if self.collision_checker is not None:
+            self._check_collisions(
+                self.global_to_local([self.settings[j].steps_to_degrees(s) for j, s in enumerate(abs_pos_regs)]),
+                local_angles
+            )
+
+    def _check_collisions(self, from_pose, to_pose):
+        """ Checks if the path between two joint poses is collision free.
+
+        The path is approximated by the linear interpolation of the joint angles.
+
+        :param list from_pose: the joint angles at the start of the move
+        :param list to_pose: the joint angles at the end of the move
+        :raise: CollisionError if a collision is detected along the path
+        """
+        from_pose = np.asarray(from_pose[:self.MOTOR_HAND_ROT], dtype=float)
+        to_pose = np.asarray(to_pose[:self.MOTOR_HAND_ROT], dtype=float)
+        count = max(int(np.ceil(np.abs(to_pose - from_pose).max() / self.COLLISION_CHECK_STEP)), 1)
+        path = from_pose + np.linspace(0, 1, count + 1)[:, np.newaxis] * (to_pose - from_pose)
+
+        flags = self.collision_checker.check(path)
+        hits = np.flatnonzero(flags)
+        if hits.size:
+            i = hits[0]
+            raise CollisionError('collision with %s at (%s)' % (
+                self.collision_checker.describe(flags[i]), ', '.join('%.1f' % a for a in path[i])
+            ))
+
+    def joints_move(self, angles, wait=True, wait_cb=None, coupled=False, timeout=None,
+                    synchronized=False):
         """ Moves joints, either as independent motors or as mechanically coupled joints.
 
         In coupled mode, the real commands applied to the motors will take the coupling
@@ -593,7 +1701,9 @@ class YoupiArm(DaisyChain):
         :param bool wait: True if blocking call
         :param wait_cb: an optional callback o be invoked while waiting in blocking mode
         :param bool coupled: True for taking the coupling in account (default: False)
-        :param timeout: the maximum motion duration
+        :param timeout: the maximum motion duration (default: derived from its estimation)
+        :param bool synchronized: True for having all the motors start and finish their motion
+                                  together (see :py:meth:`synchronized_profiles`)
 
         :raise: OutOfBoundError if the requested move would push one of more joints outside of
                 their limits
@@ -605,50 +1715,370 @@ class YoupiArm(DaisyChain):
 
         self._check_limits(angles, rel_move=True)
 
+        steps = {m: self.settings[m].degrees_to_steps(a) for m, a in angles.iteritems()}
         parms = self.expand_parameters({
-            m: [
-                defs.Direction.FWD if a > 0 else defs.Direction.REV,
-                self.settings[m].degrees_to_steps(a)
-            ]
-            for m, a in angles.iteritems()
+            m: [defs.Direction.FWD if n > 0 else defs.Direction.REV, abs(n)]
+            for m, n in steps.iteritems()
         })
 
+        if synchronized:
+            self._apply_profiles(self.synchronized_profiles(steps))
         self.move(*parms, wait=wait, wait_cb=wait_cb, timeout=timeout)
 
-    def coupled_joints_move(self, angles, wait=True, wait_cb=None, timeout=TimeOuts.DEFAULT):
+    def coupled_joints_move(self, angles, wait=True, wait_cb=None, timeout=None, synchronized=False):
         """ Shorthand for applying the coupling to a relative move.
         """
-        return self.joints_move(angles, wait=wait, wait_cb=wait_cb, coupled=True, timeout=timeout)
+        return self.joints_move(angles, wait=wait, wait_cb=wait_cb, coupled=True, timeout=timeout,
+                                synchronized=synchronized)
 
-    def joints_goto(self, angles, wait=True, wait_cb=None, coupled=False, timeout=TimeOuts.DEFAULT):
+    def joints_goto(self, angles, wait=True, wait_cb=None, coupled=False, timeout=None,
+                    synchronized=False):
         """ Same as :py:meth:`joints_move` but for an absolute move
         """
         self.logger.info('joints_goto(%s)', angles)
+        goal_steps = self._goto_goals(angles, coupled)
+        parms = self.expand_parameters({m: [n] for m, n in goal_steps.iteritems()})
+
+        if synchronized:
+            current = self._shadow_positions(goals=True)
+            self._apply_profiles(self.synchronized_profiles(
+                {m: n - current[m] for m, n in goal_steps.iteritems()}
+            ))
+        self.goto(*parms, wait=wait, wait_cb=wait_cb, timeout=timeout)
+
+    def coupled_joints_goto(self, angles, wait=True, wait_cb=None, timeout=None, synchronized=False):
+        """ Shorthand for applying the coupling to an absolute move.
+
+        Using this method with result in the arm joints having the position specified
+        in the parameters at the end of the motion.
+        """
+        return self.joints_goto(angles, wait=wait, wait_cb=wait_cb, coupled=True, timeout=timeout,
+                                synchronized=synchronized)
+
+    def _goto_goals(self, angles, coupled, current=None):
+        """ Returns the motor goals of an absolute joints move, after having checked them.
+
+        :param angles: the joint goals, as for :py:meth:`joints_goto`
+        :param bool coupled: True for taking the coupling in account
+        :param list current: the motor positions (steps) the move starts from (default: the
+                             goal positions of the shadow model)
+        :return: the (motor: steps) dictionary of the goal positions
+        :rtype: dict
+        """
         angles = self._normalize_angles_parameter(angles)
+        if current is None:
+            current = self._shadow_positions(goals=True)
 
         if coupled:
-            goal_angles = {i: p for i, p in enumerate(self.get_joint_positions())}
+            goal_angles = dict(enumerate(self.global_to_local(
+                [self.settings[m].steps_to_degrees(s) for m, s in enumerate(current)]
+            )))
             goal_angles.update(angles)
             self.joint_to_motor(goal_angles)
         else:
             goal_angles = angles
 
-        self._check_limits(goal_angles, rel_move=False)
-        parms = self.expand_parameters({
-            m: [self.settings[m].degrees_to_steps(a)]
-            for m, a in goal_angles.iteritems()
-        })
-        self.goto(*parms, wait=wait, wait_cb=wait_cb, timeout=timeout)
+        self._check_limits(goal_angles, rel_move=False, current=current)
+        return {m: self.settings[m].degrees_to_steps(a) for m, a in goal_angles.iteritems()}
+
+    # Waypoints execution
+    #
+    # The command of the next waypoint is computed and checked while the arm is moving to the
+    # current one, so that it can be dispatched as soon as the motion completes.
+
+    def execute_waypoints(self, waypoints, coupled=True, blend=False, wait_cb=None, timeout=None):
+        """ Moves the arm through a sequence of joint positions.
+
+        By default, the arm stops at each waypoint, the next motion being started as soon as
+        the BUSYN line is released.
+
+        In blend mode, each motor is sent to its next goal as soon as it has reached the current
+        one, without waiting for the other ones, so that the arm as a whole does not stop at the
+        waypoints. Since the dSPIN chips cannot change their target while moving, each motor
+        still stops at its own goals. A motor never gets more than one waypoint ahead of the
+        slowest one, but the joint positions in between are not the ones of the plain mode,
+        limits and collisions being checked for the waypoints only.
+
+        :param waypoints: an iterable of joint positions, in the format of :py:meth:`joints_goto`
+        :param bool coupled: True for taking the coupling in account (default: True)
+        :param bool blend: True for blending the motions at the waypoints (default: False)
+        :param wait_cb: optional callback invoked periodically while waiting
+        :param timeout: the maximum motion duration for each waypoint (default: derived from its estimation)
+        :return: the number of waypoints reached
+        :rtype: int
+        :raise: OutOfBoundError or CollisionError if a waypoint cannot be reached, the motions to
+                the previous ones being completed
+        :raise: CommandTimeOut if a waypoint is not reached in time
+        """
+        goals = self._waypoint_goals(waypoints, coupled, timeout)
+        if blend:
+            return self._execute_blended(goals, wait_cb)
+
+        count = 0
+        pending = next(goals, None)
+        while pending is not None:
+            pending, pending_timeout = pending
+            self.goto(*self.expand_parameters({m: [n] for m, n in pending.iteritems()}), wait=False)
+            started_at = time.time()
+            try:
+                pending = next(goals, None)
+            finally:
+                # the time spent preparing the next waypoint is part of the motion one
+                remaining = max(pending_timeout - (time.time() - started_at), 0.001) if pending_timeout else None
+                try:
+                    self._wait_motion(wait_cb, remaining)
+                except CommandTimeOut:
+                    raise CommandTimeOut('waypoint %d not reached in time' % count)
+                self._shadow_moving.difference_update(self.MOTORS_ALL)
+            count += 1
+        return count
+
+    def _waypoint_goals(self, waypoints, coupled, timeout=None):
+        """ Generates the motor goals of the waypoints, each one being checked with respect to
+        the previous one, together with the timeout of the motion reaching it (derived from
+        its estimated duration if not provided).
+        """
+        current = self._shadow_positions(goals=True)
+        for angles in waypoints:
+            goals = self._goto_goals(angles, coupled, current)
+            motion_timeout = timeout or self.TimeOuts.from_duration(
+                self.move_duration({m: n - current[m] for m, n in goals.iteritems()})
+            )
+            current = list(current)
+            for m, steps in goals.iteritems():
+                current[m] = steps
+            yield goals, motion_timeout
 
-    def coupled_joints_goto(self, angles, wait=True, wait_cb=None, timeout=TimeOuts.DEFAULT):
-        """ Shorthand for applying the coupling to an absolute move.
+    def _waypoint_wait(self, wait_cb, time_limit, index):
+        """ Waits between two readings of the motors state in blend mode.
 
-        Using this method with result in the arm joints having the position specified
-        in the parameters at the end of the motion.
+        Since the BUSYN line is released only when all the motors are stopped, its notification
+        (if available) only shortens the wait at the end of the last motions.
+        """
+        if time_limit and time.time() >= time_limit:
+            raise CommandTimeOut('waypoint %d not reached in time' % index)
+        if wait_cb:
+            wait_cb()
+        if self._busyn_event is not None:
+            self._busyn_event.wait(self.WAYPOINTS_POLL_PERIOD)
+        else:
+            time.sleep(self.WAYPOINTS_POLL_PERIOD)
+
+    def _busy_motors(self):
+        """ Returns the set of the motors which BUSY status flag is set. """
+        return set(
+            m for m, status in enumerate(self.read_register(Register.STATUS))
+            if not status & defs.Status.BUSY        # BUSY flag is active low
+        )
+
+    def _execute_blended(self, goals, wait_cb):
+        """ Blend mode execution of :py:meth:`execute_waypoints`. """
+        prepared, timeouts = {}, {}
+        # index of the waypoint each motor is going to (or has reached if not moving)
+        index = [-1] * self.MOTORS_COUNT
+        moving = set()
+        next_index, exhausted, error = 0, False, None
+        reached = time_limit = None
+
+        while True:
+            # the motors can go up to the waypoint following the one of the slowest motor, and
+            # the command of the next one is kept ready
+            slowest = min(index)
+            while not exhausted and next_index <= slowest + 2:
+                try:
+                    prepared[next_index], timeouts[next_index] = next(goals)
+                except StopIteration:
+                    exhausted = True
+                except YoupiArmError as e:
+                    # reported once the previous waypoints are reached
+                    exhausted, error = True, e
+                else:
+                    next_index += 1
+
+            arm_reached = min(index[m] - (m in moving) for m in self.MOTORS_ALL)
+            if arm_reached != reached:
+                reached = arm_reached
+                timeout = timeouts.get(reached + 1)
+                time_limit = time.time() + timeout if timeout else None
+            for k in [k for k in prepared if k <= reached]:
+                del prepared[k]
+                del timeouts[k]
+            if exhausted and reached == next_index - 1:
+                self._shadow_moving.difference_update(self.MOTORS_ALL)
+                if error:
+                    raise error
+                return next_index
+
+            commands = {}
+            for m in self.MOTORS_ALL:
+                while m not in moving and index[m] <= slowest and index[m] + 1 in prepared:
+                    index[m] += 1
+                    goal = prepared[index[m]].get(m)
+                    if goal is not None and goal != self._shadow_pos[m]:
+                        commands[m] = [goal]
+                        moving.add(m)
+            if commands:
+                self.goto(*self.expand_parameters(commands), wait=False)
+                continue
+
+            if self._busyn_event is not None:
+                # cleared before reading the status, so that no edge can be missed
+                self._busyn_event.clear()
+            moving &= self._busy_motors()
+            if moving:
+                self._waypoint_wait(wait_cb, time_limit, reached + 1)
+
+    # Motion profiles
+    #
+    # In synchronized moves, the motion profile of each motor is scaled according to the
+    # distance it has to travel, so that all the motors follow the same normalized profile.
+    # The modified registers are restored to their nominal values when the next command
+    # involving the motor is issued.
+
+    #: the registers defining the motion profiles
+    PROFILE_REGISTERS = ('MAX_SPEED', 'MIN_SPEED', 'ACC', 'DEC')
+
+    def nominal_profile_registers(self):
+        """ Returns the values of the profile registers defined by the motor settings in use
+        (see :py:meth:`use_profile`).
+
+        :return: the per motor values, keyed by register name
+        :rtype: dict
+        """
+        registers = self._settings_registers(self.settings)
+        return {name: registers[name] for name in self.PROFILE_REGISTERS}
+
+    def synchronized_profiles(self, steps):
+        """ Computes the motion profiles making a set of motors start and finish their
+        moves together.
+
+        The profile of each motor is the common normalized profile scaled by the distance
+        it travels. The normalized profile is the fastest one for which no motor exceeds its
+        nominal maximum speed, acceleration and deceleration. Since the dSPIN chips compute
+        their trajectories independently, they then stay in sync all along the motion.
+
+        The profiles being defined by register values, the shortest move is the one most
+        affected by their quantization. The normalized profile is thus slightly slowed down
+        so that the registers of the shortest move are exact.
+
+        :param dict steps: the (motor: steps) dictionary of the moves, in micro-steps
+        :return: a (motor: register values) dictionary, the values being given in the
+                 :py:attr:`PROFILE_REGISTERS` order
+        :rtype: dict
+        """
+        distances = {
+            m: abs(n) / float(self.settings[m].micro_steps) for m, n in steps.iteritems() if n
+        }
+        if not distances:
+            return {}
+        shortest = min(distances.itervalues())
+
+        nominal = self.nominal_profile_registers()
+        profiles = {m: [] for m in distances}
+        for name in self.PROFILE_REGISTERS:
+            scale = min(nominal[name][m] / d for m, d in distances.iteritems())
+            if scale * shortest >= 1:
+                scale = int(scale * shortest) / shortest
+            lowest = 0 if name == 'MIN_SPEED' else 1
+            for m, d in distances.iteritems():
+                profiles[m].append(max(int(round(scale * d)), lowest))
+        return {m: tuple(regs) for m, regs in profiles.iteritems()}
+
+    def move_duration(self, steps, synchronized=False):
+        """ Estimates the duration of a set of moves, based on the motion profiles of the
+        motors (see :py:meth:`MotorSettings.move_duration`).
+
+        :param dict steps: the (motor: steps) dictionary of the moves, in micro-steps
+        :param bool synchronized: True if the moves are synchronized (see
+                                  :py:meth:`synchronized_profiles`)
+        :return: the duration (s) of the longest move
+        :rtype: float
         """
-        return self.joints_goto(angles, wait=wait, wait_cb=wait_cb, coupled=True, timeout=timeout)
+        if synchronized:
+            profiles = self.synchronized_profiles(steps)
+        else:
+            nominal = self.nominal_profile_registers()
+            profiles = {m: tuple(nominal[name][m] for name in self.PROFILE_REGISTERS) for m in steps}
+        return self._profiles_duration(steps, profiles)
+
+    def joints_move_duration(self, angles, coupled=False, synchronized=False):
+        """ Estimates the duration of a relative joints move.
+
+        :param angles: the joint angles, as for :py:meth:`joints_move`
+        :param bool coupled: True for taking the coupling in account
+        :param bool synchronized: True if the moves are synchronized
+        :return: the estimated duration (s)
+        :rtype: float
+        """
+        angles = dict(self._normalize_angles_parameter(angles))
+        if coupled:
+            self.joint_to_motor(angles)
+        return self.move_duration(
+            {m: self.settings[m].degrees_to_steps(a) for m, a in angles.iteritems()}, synchronized
+        )
 
-    def get_motor_positions(self):
+    def _profiles_duration(self, steps, profiles):
+        """ Returns the duration of the longest move, given the profile register values
+        (in the :py:attr:`PROFILE_REGISTERS` order) of the motors.
+        """
+        duration = 0.
+        for m, n in steps.iteritems():
+            if not n:
+                continue
+            regs = dict(zip(self.PROFILE_REGISTERS, profiles[m]))
+            duration = max(duration, self.settings[m].move_duration(
+                n, max_speed=regs['MAX_SPEED'] / MAX_SPEED_REG_FACTOR, acc=regs['ACC'], dec=regs['DEC']
+            ))
+        return duration
+
+    def _motion_timeout(self, motors, goals):
+        """ Returns the timeout of a motion command, derived from its estimated duration with
+        the current profile registers, or the default one if its goals are not known.
+        """
+        if goals is None:
+            return self.TimeOuts.DEFAULT
+        start = self._shadow_positions(goals=True)
+        steps = {}
+        for m in motors:
+            goal = goals(m)
+            if goal is None:
+                return self.TimeOuts.DEFAULT
+            steps[m] = goal - start[m]
+        profiles = {
+            m: tuple(self._profile_regs[name][m] for name in self.PROFILE_REGISTERS) for m in motors
+        }
+        return self.TimeOuts.from_duration(self._profiles_duration(steps, profiles))
+
+    def _write_profile_registers(self, profiles):
+        for i, name in enumerate(self.PROFILE_REGISTERS):
+            values = self._profile_regs[name]
+            for m, regs in profiles.iteritems():
+                values[m] = regs[i]
+            setattr(self, name, tuple(values))
+
+    def _apply_profiles(self, profiles):
+        """ Sets the motion profiles to be used by the next command.
+
+        :param dict profiles: the profiles, as returned by :py:meth:`synchronized_profiles`
+        """
+        if self.logger.getEffectiveLevel() == log.DEBUG:
+            self.logger.debug('_apply_profiles: %s', profiles)
+
+        self._write_profile_registers(profiles)
+        self._scaled_motors.update(profiles)
+        self._profiles_pending = True
+
+    def _restore_profiles(self, motors):
+        """ Restores the nominal profiles of the given motors if they have been modified. """
+        motors = self._scaled_motors.intersection(motors)
+        if motors:
+            nominal = self.nominal_profile_registers()
+            self._write_profile_registers({
+                m: tuple(nominal[name][m] for name in self.PROFILE_REGISTERS) for m in motors
+            })
+            self._scaled_motors.difference_update(motors)
+
+    def get_motor_positions(self, goals=False):
         """ Returns the current position (in degrees) of the motors.
 
         The motor positions car be different from the joint ones, especially for the
@@ -656,20 +2086,93 @@ class YoupiArm(DaisyChain):
 
         Positions are returned as an array, which index is the joint motor id.
 
+        :param bool goals: if True, the goal positions of the motors still moving are returned
+                           instead of their current ones
         :return: current motors positions
         :rtype: list
         """
-        return [self.settings[m].steps_to_degrees(s) for m, s in enumerate(self.ABS_POS)]
+        return [self.settings[m].steps_to_degrees(s) for m, s in enumerate(self._shadow_positions(goals))]
 
-    def get_joint_positions(self):
+    def get_joint_positions(self, goals=False):
         """ Returns the current position (in degrees) of the joints.
 
         Positions are returned as an array, which index is the joint motor id.
 
+        :param bool goals: see :py:meth:`get_motor_positions`
         :return: current joints positions
         :rtype: list
         """
-        return self.global_to_local(self.get_motor_positions())
+        return self.global_to_local(self.get_motor_positions(goals))
+
+    # Chain accesses
+    #
+    # Register accesses are serialized by the bus lock, so that other threads (telemetry
+    # for instance) can read the chain without interleaving their transfers with the commands.
+
+    def read_register(self, reg):
+        with self.bus_lock:
+            return super(YoupiArm, self).read_register(reg)
+
+    def write_register(self, reg, values):
+        with self.bus_lock:
+            return super(YoupiArm, self).write_register(reg, values)
+
+    def get_status(self):
+        with self.bus_lock:
+            return super(YoupiArm, self).get_status()
+
+    #: the fault flags of the STATUS register which are active low
+    ACTIVE_LOW_FAULTS = (
+        defs.Status.UVLO | defs.Status.TH_WRN | defs.Status.TH_SD | defs.Status.OCD |
+        defs.Status.STEP_LOSS_A | defs.Status.STEP_LOSS_B
+    )
+    #: the fault flags of the STATUS register which are active high
+    ACTIVE_HIGH_FAULTS = defs.Status.NOTPERF_CMD | defs.Status.WRONG_CMD
+
+    def snapshot(self):
+        """ Returns the state of the motors.
+
+        The ABS_POS, SPEED and STATUS registers are read back to back, each read addressing
+        all the chips of the chain in the same frames, and the bus lock being held for the
+        whole sequence. The STATUS register is read as a parameter, so that its latched
+        flags are not cleared.
+
+        :return: the decoded state, time stamped at the middle of the reads
+        :rtype: Snapshot
+        """
+        with self.bus_lock:
+            start = self.clock()
+            positions = self.read_register(Register.ABS_POS)
+            speeds = self.read_register(Register.SPEED)
+            status = self.read_register(Register.STATUS)
+            timestamp = (start + self.clock()) / 2
+        return self.decode_snapshot(timestamp, positions, speeds, status)
+
+    def decode_snapshot(self, timestamp, positions, speeds, status):
+        """ Builds a snapshot from the raw register values, using the motor settings in use.
+
+        :param float timestamp: the time stamp of the reads
+        :param list positions: the ABS_POS register values
+        :param list speeds: the SPEED register values
+        :param list status: the STATUS register values
+        :rtype: Snapshot
+        """
+        sign_bit = 1 << (ABS_POS_BITS - 1)
+        return Snapshot(
+            timestamp,
+            tuple(
+                s.steps_to_degrees(((p & (2 * sign_bit - 1)) ^ sign_bit) - sign_bit)
+                for s, p in zip(self.settings, positions)
+            ),
+            tuple(
+                s.steps_to_degrees(v * s.micro_steps / SPEED_REG_FACTOR) * (1 if st & defs.Status.DIR else -1)
+                for s, v, st in zip(self.settings, speeds, status)
+            ),
+            tuple(not st & defs.Status.BUSY for st in status),      # BUSY flag is active low
+            tuple(bool(st & defs.Status.SW_F) for st in status),
+            tuple((~st & self.ACTIVE_LOW_FAULTS) | (st & self.ACTIVE_HIGH_FAULTS) for st in status),
+            tuple(status),
+        )
 
 
 class YoupiArmError(Exception):
@@ -678,3 +2181,7 @@ class YoupiArmError(Exception):
 
 class OutOfBoundError(YoupiArmError):
     pass
+
+
+class CollisionError(YoupiArmError):
+    pass
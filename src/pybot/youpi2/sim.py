@@ -0,0 +1,595 @@
+# -*- coding: utf-8 -*-
+
+""" In-process simulation of the dSPIN daisy chain driving the arm.
+
+:py:class:`SimulatedDaisyChain` replaces the SPI communication with the dSPIN chips by a
+model of their behavior, so that the code using the chain can be run, tested and profiled
+on any machine :
+
+* motion commands (``move``, ``goto``, ``run``, ``go_until``, stops,...) follow trapezoidal
+  speed profiles based on the ``ACC``, ``DEC`` and ``MAX_SPEED`` registers
+* the ``ABS_POS``, ``SPEED`` and ``STATUS`` registers reflect the simulated motion,
+  the other ones being simply stored
+* the switch input of each chip is driven by a model of the switch attached to the motor
+
+The simulation is evaluated lazily, each time the chain is accessed, based on the elapsed
+time which can be accelerated for speeding up the tests.
+
+:py:class:`SimulatedYoupiArm` is the arm model built on this simulated chain, with models
+of the joint optical indexes and of the gripper closing detection.
+
+Registers are exposed with their dSPIN encoding. This applies to the ``STATUS`` register,
+which flags are active low for the ``BUSY`` and the faults ones (see the L6470 datasheet).
+"""
+
+import logging
+import threading
+import time
+
+from pybot.dspin import defs
+from pybot.dspin.core import CommandTimeOut
+from pybot.dspin.daisychain import DaisyChain
+from pybot.dspin.defs import Register, Status
+
+from .model import (
+    YoupiArm, SPEED_REG_FACTOR, MAX_SPEED_REG_FACTOR, MIN_SPEED_REG_FACTOR, ACC_REG_FACTOR
+)
+
+__author__ = 'Eric Pascual'
+
+#: the registers handled by the simulated chips, with their value after reset
+REGISTER_DEFAULTS = {
+    'ABS_POS': 0,
+    'EL_POS': 0,
+    'MARK': 0,
+    'SPEED': 0,
+    'ACC': 0x08a,
+    'DEC': 0x08a,
+    'MAX_SPEED': 0x041,
+    'MIN_SPEED': 0,
+    'FS_SPD': 0x027,
+    'KVAL_HOLD': 0x29,
+    'KVAL_RUN': 0x29,
+    'KVAL_ACC': 0x29,
+    'KVAL_DEC': 0x29,
+    'OCD_TH': 0x8,
+    'STEP_MODE': 0x7,
+    'ALARM_EN': 0xff,
+    'CONFIG': 0x2e88,
+    'STATUS': 0,
+}
+
+#: status flags which are active low
+_ACTIVE_LOW_FLAGS = [
+    getattr(Status, name) for name in ('UVLO', 'TH_WRN', 'TH_SD', 'OCD', 'STEP_LOSS_A', 'STEP_LOSS_B')
+    if hasattr(Status, name)
+]
+
+#: motor status values, as encoded in the MOT_STATUS field of the STATUS register
+MOT_STOPPED, MOT_ACCELERATING, MOT_DECELERATING, MOT_CONSTANT_SPEED = range(4)
+
+
+class _MotorState(object):
+    """ The simulated state of a motor and of its driver. """
+    # motion modes
+    IDLE, GOTO, RUN, GO_UNTIL, RELEASE_SW, STOPPING = range(6)
+
+    def __init__(self):
+        self.position = 0.          # physical position (micro-steps)
+        self.origin = 0.            # physical position corresponding to ABS_POS = 0
+        self.speed = 0.             # signed speed (step/s)
+        self.mode = self.IDLE
+        self.target = 0.            # GOTO target physical position
+        self.target_speed = 0.      # RUN, GO_UNTIL and RELEASE_SW absolute speed (step/s)
+        self.direction = 1          # RUN, GO_UNTIL and RELEASE_SW direction (+1/-1)
+        self.action = None          # GO_UNTIL action
+        self.hiz_at_stop = False
+        self.hiz = True
+        self.mot_status = MOT_STOPPED
+        self.switch_closed = False
+        self.switch_event = False
+        self.step_loss = False
+        self.uvlo = False
+        self.registers = dict(REGISTER_DEFAULTS)
+
+    @property
+    def busy(self):
+        if self.mode == self.RUN:
+            return abs(self.speed) != self.target_speed
+        return self.mode != self.IDLE
+
+
+def _register_property(name):
+    """ Returns the property giving access to a register of all the chips of the chain. """
+    def getter(self):
+        return self.read_register(name)
+
+    def setter(self, values):
+        self.write_register(name, values)
+
+    return property(getter, setter, doc='%s register of the chips of the chain' % name)
+
+
+class SimulatedDaisyChain(DaisyChain):
+    """ Simulated dSPIN daisy chain.
+
+    The commands parameters are provided as when using the real chain, i.e. as one positional
+    argument per chip (see :py:meth:`expand_parameters`).
+
+    The physical behavior of each motor can be customized by setting the following attributes
+    (per motor lists) :
+
+    * ``switch_models`` : callables receiving the motor physical position (micro-steps), and
+      returning True if the switch attached to the chip is closed
+    * ``position_limits`` : (min, max) physical positions beyond which the motor is stalled,
+      as when blocked by a mechanical end stop
+    """
+    #: maximum time step of the simulation (s)
+    SIMULATION_STEP = 0.001
+    #: polling period used when waiting for the end of motions (s)
+    WAIT_POLL_PERIOD = 0.005
+
+    #: the time source of the simulation, which can be replaced for driving it explicitly
+    clock = staticmethod(time.time)
+
+    def __init__(self, chain_length, spi=None, standby_pin=None, busyn_pin=None, logger=None, time_scale=1.):
+        """
+        The parameters related to the hardware are accepted for compatibility, but ignored.
+
+        :param int chain_length: the number of chips in the chain
+        :param logger: optional logger
+        :param float time_scale: the ratio between the simulated time and the real one
+        """
+        # the real chain initialization is not invoked, since it accesses the hardware
+        self.chain_length = chain_length
+        self.logger = logger or logging.getLogger(self.__class__.__name__)
+        self.time_scale = time_scale
+
+        self._lock = threading.RLock()
+        self._motors = [_MotorState() for _ in range(chain_length)]
+        self.switch_models = [None] * chain_length
+        self.position_limits = [None] * chain_length
+        self._last_update = self.clock()
+
+        # registers are addressed with the Register constants by read/write_register
+        self._register_names = {
+            getattr(Register, name): name for name in REGISTER_DEFAULTS if hasattr(Register, name)
+        }
+        self._register_names.update((name, name) for name in REGISTER_DEFAULTS)
+
+    # ---------------------------------------------------------------------------------------
+    # chain management
+    # ---------------------------------------------------------------------------------------
+
+    def initialize(self):
+        with self._lock:
+            self._update()
+            for m in self._motors:
+                m.hiz = False
+        return True
+
+    def shutdown(self):
+        self.soft_hi_Z()
+
+    def awake(self):
+        with self._lock:
+            self._update()
+            for m in self._motors:
+                m.hiz = False
+
+    def power_cycle(self):
+        """ Simulates a power loss of the chips, which registers are reset, the motors
+        keeping their physical positions.
+        """
+        with self._lock:
+            self._update()
+            for m in self._motors:
+                m.mode, m.speed, m.mot_status = _MotorState.IDLE, 0., MOT_STOPPED
+                m.origin = m.position
+                m.hiz = m.uvlo = True
+                m.registers = dict(REGISTER_DEFAULTS)
+
+    def expand_parameters(self, params):
+        """ Converts a (motor: parameters) dictionary into the list of per-chip parameters
+        expected by the commands, motors not involved getting None.
+        """
+        return [params.get(i) for i in range(self.chain_length)]
+
+    def set_config(self, **kwargs):
+        self.logger.info('simulated chain configuration: %s', kwargs)
+
+    def set_lspd_opt(self, enabled):
+        self.logger.info('simulated chain low speed optimization: %s', enabled)
+
+    # ---------------------------------------------------------------------------------------
+    # registers
+    # ---------------------------------------------------------------------------------------
+
+    def _register_name(self, reg):
+        try:
+            return self._register_names[reg]
+        except (KeyError, TypeError):
+            raise ValueError('unsupported register (%s)' % (reg,))
+
+    def read_register(self, reg):
+        """ Returns the values of a register for all the chips of the chain. """
+        name = self._register_name(reg)
+        with self._lock:
+            self._update()
+            if name == 'ABS_POS':
+                return [int(round(m.position - m.origin)) for m in self._motors]
+            if name == 'SPEED':
+                return [int(abs(m.speed) * SPEED_REG_FACTOR) for m in self._motors]
+            if name == 'STATUS':
+                return [self._status(m) for m in self._motors]
+            return [m.registers[name] for m in self._motors]
+
+    def write_register(self, reg, values):
+        """ Writes a register of the chips of the chain.
+
+        :param reg: the register
+        :param values: a sequence of per chip values (None for unchanged ones), or a single
+                       value for all the chips
+        """
+        name = self._register_name(reg)
+        if name in ('SPEED', 'STATUS'):
+            raise ValueError('read-only register (%s)' % name)
+        if not isinstance(values, (list, tuple)):
+            values = [values] * self.chain_length
+        with self._lock:
+            self._update()
+            for m, value in zip(self._motors, values):
+                if value is None:
+                    continue
+                if name == 'ABS_POS':
+                    m.origin = m.position - value
+                else:
+                    m.registers[name] = value
+
+    def get_status(self):
+        """ Returns the STATUS registers, clearing the latched flags as the GET_STATUS command. """
+        with self._lock:
+            status = self.read_register('STATUS')
+            for m in self._motors:
+                m.switch_event = m.step_loss = m.uvlo = False
+            return status
+
+    def _status(self, m):
+        status = 0
+        if m.hiz:
+            status |= Status.HIZ
+        if not m.busy:
+            status |= Status.BUSY
+        if m.switch_closed:
+            status |= Status.SW_F
+        if m.switch_event:
+            status |= Status.SW_EVN
+        if m.speed > 0 or (m.speed == 0 and m.direction > 0):
+            status |= Status.DIR
+        mot_status_mask = getattr(Status, 'MOT_STATUS', 0)
+        if mot_status_mask:
+            status |= (m.mot_status * (mot_status_mask & -mot_status_mask)) & mot_status_mask
+        for flag in _ACTIVE_LOW_FLAGS:
+            status |= flag
+        if m.step_loss:
+            status &= ~(getattr(Status, 'STEP_LOSS_A', 0) | getattr(Status, 'STEP_LOSS_B', 0))
+        if m.uvlo:
+            status &= ~getattr(Status, 'UVLO', 0)
+        return status
+
+    @property
+    def switch_is_closed(self):
+        with self._lock:
+            self._update()
+            return [m.switch_closed for m in self._motors]
+
+    @property
+    def is_busy(self):
+        with self._lock:
+            self._update()
+            return any(m.busy for m in self._motors)
+
+    # ---------------------------------------------------------------------------------------
+    # commands
+    # ---------------------------------------------------------------------------------------
+
+    def _command(self, params, handler):
+        with self._lock:
+            self._update()
+            for i, p in enumerate(params[:self.chain_length]):
+                if p is not None:
+                    m = self._motors[i]
+                    m.hiz = False
+                    m.hiz_at_stop = False
+                    handler(m, *p)
+
+    @staticmethod
+    def _speed(m, speed):
+        """ Returns a speed set point, limited by the motor maximum speed. """
+        return min(abs(speed), m.registers['MAX_SPEED'] / MAX_SPEED_REG_FACTOR)
+
+    def _motors_list(self, motors):
+        return range(self.chain_length) if motors is None else motors
+
+    def move(self, *params, **kwargs):
+        def handler(m, direction, steps):
+            m.mode, m.target = _MotorState.GOTO, m.position + _direction_sign(direction) * abs(steps)
+        self._command(params, handler)
+        self._wait_if_requested(params, **kwargs)
+
+    def goto(self, *params, **kwargs):
+        def handler(m, position, direction=None):
+            m.mode, m.target = _MotorState.GOTO, m.origin + position
+        self._command(params, handler)
+        self._wait_if_requested(params, **kwargs)
+
+    def run(self, *params, **kwargs):
+        def handler(m, direction, speed):
+            m.mode, m.direction, m.target_speed = _MotorState.RUN, _direction_sign(direction), self._speed(m, speed)
+        self._command(params, handler)
+
+    def go_until(self, *params, **kwargs):
+        def handler(m, action, direction, speed):
+            m.mode, m.direction, m.target_speed = _MotorState.GO_UNTIL, _direction_sign(direction), self._speed(m, speed)
+            m.action = action
+        self._command(params, handler)
+        self._wait_if_requested(params, **kwargs)
+
+    def release_sw(self, *params, **kwargs):
+        def handler(m, action, direction):
+            m.mode, m.direction, m.action = _MotorState.RELEASE_SW, _direction_sign(direction), action
+            m.target_speed = self._speed(m, max(m.registers['MIN_SPEED'] / MIN_SPEED_REG_FACTOR, 5))
+        self._command(params, handler)
+        self._wait_if_requested(params, **kwargs)
+
+    def go_home(self, motors=None, wait=True, wait_cb=None, timeout=None):
+        motors = self._motors_list(motors)
+        self.goto(*[(0,) if i in motors else None for i in range(self.chain_length)],
+                  wait=wait, wait_cb=wait_cb, timeout=timeout)
+
+    def soft_stop(self, motors=None):
+        self._stop(motors, soft=True, hiz=False)
+
+    def hard_stop(self, motors=None):
+        self._stop(motors, soft=False, hiz=False)
+
+    def soft_hi_Z(self, motors=None):
+        self._stop(motors, soft=True, hiz=True)
+
+    def hard_hi_Z(self, motors=None):
+        self._stop(motors, soft=False, hiz=True)
+
+    def _stop(self, motors, soft, hiz):
+        with self._lock:
+            self._update()
+            for i in self._motors_list(motors):
+                m = self._motors[i]
+                if soft and m.speed:
+                    m.mode, m.hiz_at_stop = _MotorState.STOPPING, hiz
+                else:
+                    m.mode, m.speed, m.mot_status = _MotorState.IDLE, 0., MOT_STOPPED
+                    m.hiz = m.hiz or hiz
+
+    def reset_pos(self, motors=None):
+        with self._lock:
+            self._update()
+            for i in self._motors_list(motors):
+                m = self._motors[i]
+                m.origin = m.position
+
+    def wait_for_completion(self, motors=None, wait_cb=None, timeout=None):
+        """ Waits until the motors are no more busy.
+
+        :param motors: the motors to be waited for (default: all)
+        :param wait_cb: optional callable invoked periodically while waiting
+        :param float timeout: the maximum wait time (s)
+        :raise CommandTimeOut: if the timeout expired before the end of the motions
+        """
+        motors = self._motors_list(motors)
+        time_limit = time.time() + timeout if timeout else None
+        while True:
+            with self._lock:
+                self._update()
+                if not any(self._motors[i].busy for i in motors):
+                    return
+            if time_limit and time.time() >= time_limit:
+                raise CommandTimeOut('motion not completed in %.1fs' % timeout)
+            if wait_cb:
+                wait_cb()
+            time.sleep(self.WAIT_POLL_PERIOD)
+
+    def _wait_if_requested(self, params, wait=True, wait_cb=None, timeout=None):
+        if wait:
+            self.wait_for_completion(
+                [i for i, p in enumerate(params) if p is not None], wait_cb=wait_cb, timeout=timeout
+            )
+
+    # ---------------------------------------------------------------------------------------
+    # simulation
+    # ---------------------------------------------------------------------------------------
+
+    def _update(self):
+        """ Advances the simulation up to the current time. """
+        now = self.clock()
+        elapsed = (now - self._last_update) * self.time_scale
+        self._last_update = now
+
+        active = [(i, m) for i, m in enumerate(self._motors) if m.mode != _MotorState.IDLE]
+        if not active:
+            self._update_switches()
+            return
+
+        while elapsed > 0:
+            dt = min(elapsed, self.SIMULATION_STEP)
+            elapsed -= dt
+            for i, m in active:
+                if m.mode != _MotorState.IDLE:
+                    self._step_motor(i, m, dt)
+        self._update_switches()
+
+    def _update_switches(self):
+        for i, m in enumerate(self._motors):
+            model = self.switch_models[i]
+            closed = bool(model(m.position)) if model else False
+            if closed and not m.switch_closed:
+                m.switch_event = True
+            m.switch_closed = closed
+
+    def _step_motor(self, i, m, dt):
+        regs = m.registers
+        micro_steps = 1 << (regs['STEP_MODE'] & 0x07)
+        max_speed = regs['MAX_SPEED'] / MAX_SPEED_REG_FACTOR
+        acc = max(regs['ACC'], 1) / ACC_REG_FACTOR
+        dec = max(regs['DEC'], 1) / ACC_REG_FACTOR
+
+        if m.mode == _MotorState.GOTO:
+            remaining = (m.target - m.position) / micro_steps
+            # speed allowing to stop at the target with the configured deceleration
+            wanted = _sign(remaining) * min(max_speed, (2 * dec * abs(remaining)) ** 0.5)
+        elif m.mode == _MotorState.STOPPING:
+            wanted = 0.
+        else:
+            wanted = m.direction * m.target_speed
+
+        # apply the acceleration or deceleration limits
+        speed = m.speed
+        if speed * wanted >= 0 and abs(wanted) > abs(speed):
+            speed = min(abs(wanted), abs(speed) + acc * dt) * _sign(wanted)
+            m.mot_status = MOT_ACCELERATING
+        elif wanted != speed:
+            delta = dec * dt
+            speed = max(speed - delta, wanted) if speed > wanted else min(speed + delta, wanted)
+            m.mot_status = MOT_DECELERATING
+        else:
+            m.mot_status = MOT_CONSTANT_SPEED if speed else MOT_STOPPED
+        m.speed = speed
+
+        position = m.position + speed * dt * micro_steps
+        if m.mode == _MotorState.GOTO:
+            new_remaining = m.target - position
+            if abs(new_remaining) < 0.5 or new_remaining * remaining < 0:
+                position = m.target
+                m.mode, m.speed, m.mot_status = _MotorState.IDLE, 0., MOT_STOPPED
+
+        limits = self.position_limits[i]
+        if limits is not None:
+            clamped = min(max(position, limits[0]), limits[1])
+            if clamped != position:
+                # the motor is blocked : it keeps on trying but loses steps
+                position = clamped
+                m.step_loss = True
+        m.position = position
+
+        if m.mode == _MotorState.STOPPING and m.speed == 0:
+            m.mode, m.mot_status = _MotorState.IDLE, MOT_STOPPED
+            m.hiz = m.hiz or m.hiz_at_stop
+
+        elif m.mode in (_MotorState.GO_UNTIL, _MotorState.RELEASE_SW):
+            model = self.switch_models[i]
+            closed = bool(model(m.position)) if model else False
+            if m.mode == _MotorState.GO_UNTIL and closed and not m.switch_closed:
+                self._switch_action(m)
+                m.mode = _MotorState.STOPPING
+            elif m.mode == _MotorState.RELEASE_SW and not closed and m.switch_closed:
+                self._switch_action(m)
+                m.mode, m.speed, m.mot_status = _MotorState.IDLE, 0., MOT_STOPPED
+            if closed and not m.switch_closed:
+                m.switch_event = True
+            m.switch_closed = closed
+
+    @staticmethod
+    def _switch_action(m):
+        if m.action == defs.GoUntilAction.RESET:
+            m.origin = m.position
+        else:
+            m.registers['MARK'] = int(round(m.position - m.origin))
+
+
+for _name in REGISTER_DEFAULTS:
+    setattr(SimulatedDaisyChain, _name, _register_property(_name))
+del _name
+
+
+def _sign(value):
+    return 1 if value > 0 else -1 if value < 0 else 0
+
+
+def _direction_sign(direction):
+    return 1 if direction == defs.Direction.FWD else -1
+
+
+class SimulatedYoupiArm(YoupiArm, SimulatedDaisyChain):
+    """ The arm model, running on a simulated daisy chain.
+
+    The simulated joint optical indexes are located so that the joints are at their
+    mechanical origin when the origins seeking sequence is complete, the initial position
+    of the motors being 0. The gripper is initially fully open, and its switch closes when
+    the jaws get in contact with each other or with the simulated grasped object (see
+    :py:attr:`gripper_object_steps`).
+    """
+    backend_available = True
+
+    #: travel of the gripper after the jaws contact, corresponding to the compression of the
+    #: detection mechanism spring (motor steps)
+    GRIPPER_COMPLIANCE_STEPS = 400
+
+    def __init__(self, logger=None, calibration=False, time_scale=1., initial_positions=None, state_path=None):
+        """
+        :param logger: optional logger
+        :param calibration: see :py:class:`YoupiArm`. The default calibration file of the host
+                            is not used by default, the simulated arm having the nominal
+                            dimensions
+        :param state_path: see :py:class:`YoupiArm`
+        :param float time_scale: the ratio between the simulated time and the real one
+        :param initial_positions: optional initial positions of the motors (degrees), in the
+                                  sequence of motor ids
+        """
+        super(SimulatedYoupiArm, self).__init__(logger=logger, calibration=calibration, state_path=state_path)
+        self.time_scale = time_scale
+
+        #: position of the gripper jaws contact with the grasped object, relative to the
+        #: fully closed position (motor steps), None if no object
+        self.gripper_object_steps = None
+
+        for motor in self.JOINT_MOTORS:
+            self.switch_models[motor] = self._index_model(motor)
+        self.switch_models[self.MOTOR_GRIPPER] = self._gripper_switch_model
+        self.position_limits[self.MOTOR_GRIPPER] = (self._gripper_contact_position() - self.GRIPPER_COMPLIANCE_STEPS,
+                                                    float('inf'))
+
+        if initial_positions:
+            for m, angle in enumerate(initial_positions):
+                self._motors[m].position = self.settings[m].degrees_to_steps(angle)
+        self._update_switches()
+
+    def _create_spi_device(self, spi_bus, spi_dev):
+        return None
+
+    def _index_model(self, motor):
+        """ Returns the model of a joint optical index switch, closed on the positive side
+        of the index.
+        """
+        index_position = self.settings[motor].degrees_to_steps(-self.index_compensation(motor))
+        return lambda position: position >= index_position
+
+    def _gripper_contact_position(self):
+        settings = self.settings[self.MOTOR_GRIPPER]
+        closed = -settings.open_steps
+        if self.gripper_object_steps is None:
+            return closed
+        return closed + self.gripper_object_steps
+
+    def _gripper_switch_model(self, position):
+        return position <= self._gripper_contact_position()
+
+    def grasp_object(self, width_steps):
+        """ Places a simulated object between the gripper jaws.
+
+        :param int width_steps: the position of the contact with the object, relative to the
+                                fully closed position (motor steps), None to remove the object
+        """
+        with self._lock:
+            self.gripper_object_steps = width_steps
+            self.position_limits[self.MOTOR_GRIPPER] = (
+                self._gripper_contact_position() - self.GRIPPER_COMPLIANCE_STEPS, float('inf')
+            )
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+
+""" Persistence of the motor positions across the arm controller restarts.
+
+The positions are saved when the arm is shut down, so that they can be restored at the next
+initialization, provided that the dSPIN chips have been powered all along and that the arm has
+not been moved meanwhile. The file is a JSON dictionary with the following items :
+
+* ``clean_shutdown`` : True if the positions have been saved by a clean shutdown. It is reset
+  as soon as the file is read at initialization, so that a crash forces a full homing
+* ``homed`` : the names of the motors which origin was known at shutdown time
+* ``positions`` : the positions (steps) read from the ``ABS_POS`` registers, keyed by motor name
+* ``commanded`` : the last commanded positions (steps), keyed by motor name
+* ``saved_at`` : the save time stamp
+"""
+
+import json
+import os
+
+__author__ = 'Eric Pascual'
+
+#: default location of the position state file
+DEFAULT_PATH = '/var/lib/youpi2/position_state.json'
+
+
+def load_state(path=DEFAULT_PATH):
+    """ Loads a position state file.
+
+    :param str path: the path of the file
+    :return: the position state
+    :rtype: dict
+    :raise IOError: if the file cannot be read
+    :raise ValueError: if the file content is invalid
+    """
+    with open(path) as fp:
+        data = json.load(fp)
+    if not isinstance(data, dict) or not {'clean_shutdown', 'homed', 'positions'}.issubset(data):
+        raise ValueError('invalid position state file (%s)' % path)
+    return data
+
+
+def save_state(data, path=DEFAULT_PATH):
+    """ Saves a position state.
+
+    The file is replaced atomically, so that an interrupted save cannot leave it corrupted.
+
+    :param dict data: the position state
+    :param str path: the path of the file
+    """
+    dir_path = os.path.dirname(path)
+    if dir_path and not os.path.isdir(dir_path):
+        os.makedirs(dir_path)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as fp:
+        json.dump(data, fp, indent=4, sort_keys=True)
+        fp.flush()
+        os.fsync(fp.fileno())
+    os.rename(tmp_path, path)
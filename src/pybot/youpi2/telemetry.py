@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+
+""" Background recording of the motors state.
+
+:py:class:`TelemetryRecorder` is a thread sampling the ``ABS_POS``, ``SPEED`` and ``STATUS``
+registers of the arm at a fixed rate. The raw register values are stored in a preallocated
+ring buffer (a NumPy structured array), their decoding being done only when the samples are
+retrieved.
+
+Sampling never delays the arm commands by more than the duration of one sample reading : the
+bus lock of the arm is tried without blocking, and the sample is skipped if it is not
+available.
+
+Recorded windows can be exported as ``.npy`` files (raw samples) or as CSV files (decoded
+values) for post-mortem analysis.
+"""
+
+import csv
+import threading
+import time
+
+import numpy as np
+
+from pybot.dspin.defs import Register, Status
+
+from .model import SPEED_REG_FACTOR, ABS_POS_BITS
+
+__author__ = 'Eric Pascual'
+
+
+class TelemetryRecorder(threading.Thread):
+    """ Thread recording the motors state of an arm.
+
+    The recorder is a daemon thread, which must be stopped with :py:meth:`stop`.
+    """
+    #: default sampling rate (Hz)
+    DEFAULT_RATE = 100
+    #: default capacity of the ring buffer (samples)
+    DEFAULT_CAPACITY = 60000
+
+    def __init__(self, arm, rate=DEFAULT_RATE, capacity=DEFAULT_CAPACITY, logger=None):
+        """
+        :param arm: the arm (see :py:class:`pybot.youpi2.model.YoupiArm`)
+        :param float rate: the sampling rate (Hz)
+        :param int capacity: the number of samples kept in the ring buffer
+        :param logger: optional logger (default: the arm one)
+        """
+        super(TelemetryRecorder, self).__init__(name='telemetry')
+        self.daemon = True
+
+        self.arm = arm
+        self.period = 1. / rate
+        self.logger = logger or arm.logger
+
+        motors = arm.MOTORS_COUNT
+        self.dtype = np.dtype([
+            ('timestamp', 'f8'),
+            ('abs_pos', 'i4', (motors,)),
+            ('speed', 'u4', (motors,)),
+            ('status', 'u2', (motors,)),
+        ])
+        self._buffer = np.zeros(capacity, dtype=self.dtype)
+        # per field views, for storing the samples without creating intermediate records
+        self._timestamps = self._buffer['timestamp']
+        self._abs_pos = self._buffer['abs_pos']
+        self._speed = self._buffer['speed']
+        self._status = self._buffer['status']
+
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+
+        #: the total number of recorded samples
+        self.count = 0
+        #: the number of samples skipped because the bus was in use
+        self.skipped = 0
+        #: the longest time the bus lock has been held for reading a sample (s)
+        self.max_read_time = 0.
+
+        # per motor conversion factors of the decoding
+        self._deg_per_step = np.array([s.steps_to_degrees(1.) for s in arm.settings])
+        self._micro_steps = np.array([s.micro_steps for s in arm.settings])
+
+    @property
+    def capacity(self):
+        return len(self._buffer)
+
+    def run(self):
+        arm, bus_lock = self.arm, self.arm.bus_lock
+        next_time = time.time()
+        while not self._stop_event.is_set():
+            # commands have the priority over the sampling
+            if bus_lock.acquire(False):
+                try:
+                    start = time.time()
+                    timestamp = arm.clock()
+                    positions = arm.read_register(Register.ABS_POS)
+                    speeds = arm.read_register(Register.SPEED)
+                    status = arm.read_register(Register.STATUS)
+                    self.max_read_time = max(self.max_read_time, time.time() - start)
+                finally:
+                    bus_lock.release()
+                self._store(timestamp, positions, speeds, status)
+            else:
+                self.skipped += 1
+
+            next_time += self.period
+            delay = next_time - time.time()
+            if delay < 0:
+                # late : no attempt to catch up
+                next_time -= delay
+            self._stop_event.wait(max(delay, 0))
+
+    def _store(self, timestamp, positions, speeds, status):
+        with self._lock:
+            i = self.count % len(self._buffer)
+            self._timestamps[i] = timestamp
+            self._abs_pos[i] = positions
+            self._speed[i] = speeds
+            self._status[i] = status
+            self.count += 1
+
+    def stop(self, timeout=None):
+        """ Stops the recording and waits for the thread termination. """
+        self._stop_event.set()
+        if self.is_alive():
+            self.join(timeout)
+
+    def window(self, start=None, end=None):
+        """ Returns the recorded raw samples.
+
+        :param float start: the time stamp of the first returned sample (default: the oldest one)
+        :param float end: the time stamp after which samples are excluded (default: the latest one)
+        :return: the samples, in chronological order
+        :rtype: numpy.ndarray
+        """
+        with self._lock:
+            count, capacity = self.count, len(self._buffer)
+            if count <= capacity:
+                samples = self._buffer[:count].copy()
+            else:
+                samples = np.roll(self._buffer, -(count % capacity))
+
+        if start is not None or end is not None:
+            timestamps = samples['timestamp']
+            lo = 0 if start is None else np.searchsorted(timestamps, start, side='left')
+            hi = len(samples) if end is None else np.searchsorted(timestamps, end, side='right')
+            samples = samples[lo:hi]
+        return samples
+
+    def decode(self, samples):
+        """ Decodes raw samples.
+
+        :param samples: the raw samples, as returned by :py:meth:`window`
+        :return: a dictionary of arrays, containing the time stamps (``timestamp``) and,
+                 with one column per motor, the positions (``positions``, degrees), the signed
+                 speeds (``speeds``, degrees/s), the busy states (``busy``), the switch states
+                 (``switches``) and the fault flags (``faults``, as for
+                 :py:class:`pybot.youpi2.model.Snapshot`)
+        :rtype: dict
+        """
+        sign_bit = 1 << (ABS_POS_BITS - 1)
+        abs_pos = ((samples['abs_pos'].astype(np.int64) & (2 * sign_bit - 1)) ^ sign_bit) - sign_bit
+        status = samples['status'].astype(np.int64)
+        direction = np.where(status & Status.DIR, 1., -1.)
+        arm = self.arm
+        return {
+            'timestamp': samples['timestamp'],
+            'positions': abs_pos * self._deg_per_step,
+            'speeds': samples['speed'] * (self._micro_steps / SPEED_REG_FACTOR) * self._deg_per_step * direction,
+            'busy': (status & Status.BUSY) == 0,        # BUSY flag is active low
+            'switches': (status & Status.SW_F) != 0,
+            'faults': (~status & arm.ACTIVE_LOW_FAULTS) | (status & arm.ACTIVE_HIGH_FAULTS),
+        }
+
+    def save_npy(self, path, start=None, end=None):
+        """ Saves a window of raw samples (see :py:meth:`window`) as a ``.npy`` file.
+
+        :return: the number of saved samples
+        """
+        samples = self.window(start, end)
+        np.save(path, samples)
+        return len(samples)
+
+    def save_csv(self, path, start=None, end=None):
+        """ Saves a window of decoded samples (see :py:meth:`window`) as a CSV file.
+
+        Each line contains the time stamp followed by the position, speed and raw status of
+        each motor.
+
+        :return: the number of saved samples
+        """
+        samples = self.window(start, end)
+        data = self.decode(samples)
+        names = self.arm.MOTOR_NAMES
+        with open(path, 'w') as fp:
+            writer = csv.writer(fp)
+            writer.writerow(['timestamp'] + [
+                '%s_%s' % (name, field) for name in names for field in ('position', 'speed', 'status')
+            ])
+            for i in range(len(samples)):
+                row = ['%.6f' % data['timestamp'][i]]
+                for m in range(len(names)):
+                    row += [
+                        '%.4f' % data['positions'][i, m], '%.4f' % data['speeds'][i, m],
+                        '0x%04x' % samples['status'][i, m]
+                    ]
+                writer.writerow(row)
+        return len(samples)
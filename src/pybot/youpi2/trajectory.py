@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+
+""" Lazy generation of Cartesian trajectories.
+
+The trajectories are composed of straight line and circular arc segments, defined by
+gripper end positions and absolute wrist pitches (see :py:meth:`pybot.youpi2.kin.Kinematics.ik`
+for the reference frame). They are sampled at a given spatial resolution (or at a temporal
+one for a given speed), and converted on the fly into the corresponding joint poses.
+
+Poses are produced by generators, so that long paths are never materialized as a whole, and
+their execution can start as soon as the first poses are available. The inverse kinematics is
+solved by chunks of samples using the vectorized version, and a chunk is fully validated before
+any of its poses is produced. An unreachable part of the path is thus reported without having
+the arm stopped in the middle of it.
+"""
+
+import math
+
+import numpy as np
+
+__author__ = 'Eric Pascual'
+
+#: default sampling step (mm)
+DEFAULT_STEP = 1.
+#: default number of samples processed at once
+DEFAULT_CHUNK_SIZE = 256
+#: default wrist pitch, when not specified with the positions
+DEFAULT_PITCH = 90
+
+
+def _goal(point):
+    """ Returns a goal as an (x, y, z, pitch) array, the pitch being optional in the input. """
+    goal = np.empty(4)
+    goal[:] = tuple(point) + ((DEFAULT_PITCH,) if len(point) == 3 else ())
+    return goal
+
+
+class Segment(object):
+    """ Root class of trajectory segments. """
+    def __init__(self, start, end):
+        """
+        :param start: the start (x, y, z[, pitch]) goal
+        :param end: the end (x, y, z[, pitch]) goal
+        """
+        self.start = _goal(start)
+        self.end = _goal(end)
+
+    @property
+    def length(self):
+        """ The length of the segment (mm) """
+        raise NotImplementedError()
+
+    def goals(self, s):
+        """ Returns the goals at given curvilinear abscissas.
+
+        The wrist pitch is linearly interpolated between the ones of the segment ends.
+
+        :param s: the abscissas, normalized to [0, 1]
+        :return: the (N, 4) array of the (x, y, z, pitch) goals
+        """
+        raise NotImplementedError()
+
+
+class Line(Segment):
+    """ A straight line segment """
+    @property
+    def length(self):
+        return float(np.linalg.norm(self.end[:3] - self.start[:3]))
+
+    def goals(self, s):
+        s = np.asarray(s, dtype=float)[:, np.newaxis]
+        return self.start + s * (self.end - self.start)
+
+
+class Arc(Segment):
+    """ A circular arc segment, defined by its ends and an intermediate point. """
+    def __init__(self, start, via, end):
+        """
+        :param start: the start (x, y, z[, pitch]) goal
+        :param via: an intermediate (x, y, z) point of the arc (its pitch is ignored if provided)
+        :param end: the end (x, y, z[, pitch]) goal
+        :raise ValueError: if the points are aligned
+        """
+        super(Arc, self).__init__(start, end)
+
+        p0, p1, p2 = self.start[:3], np.asarray(via[:3], dtype=float), self.end[:3]
+        a, b = p0 - p2, p1 - p2
+        a_x_b = np.cross(a, b)
+        norm2 = a_x_b.dot(a_x_b)
+        if norm2 < 1e-9 * a.dot(a) * b.dot(b):
+            raise ValueError('arc points are aligned')
+
+        self.center = p2 + np.cross(a.dot(a) * b - b.dot(b) * a, a_x_b) / (2 * norm2)
+        self.radius = float(np.linalg.norm(p0 - self.center))
+
+        # orthonormal basis of the arc plane, oriented so that the arc goes from start
+        # to end through the intermediate point with increasing angles
+        normal = np.cross(p1 - p0, p2 - p1)
+        self._u = (p0 - self.center) / self.radius
+        self._v = np.cross(normal / np.linalg.norm(normal), self._u)
+
+        end_rel = p2 - self.center
+        self.angle = math.atan2(end_rel.dot(self._v), end_rel.dot(self._u)) % (2 * math.pi)
+
+    @property
+    def length(self):
+        return self.radius * self.angle
+
+    def goals(self, s):
+        s = np.asarray(s, dtype=float)
+        theta = (s * self.angle)[:, np.newaxis]
+        goals = np.empty((len(s), 4))
+        goals[:, :3] = self.center + self.radius * (np.cos(theta) * self._u + np.sin(theta) * self._v)
+        goals[:, 3] = self.start[3] + s * (self.end[3] - self.start[3])
+        return goals
+
+
+def _resolve_step(step, speed, period):
+    if speed is not None or period is not None:
+        if step is not None:
+            raise ValueError('step and speed/period are mutually exclusive')
+        if not (speed and period):
+            raise ValueError('both speed and period must be provided')
+        step = float(speed) * period
+    elif step is None:
+        step = DEFAULT_STEP
+    if step <= 0:
+        raise ValueError('sampling step must be positive')
+    return step
+
+
+def poses(kin, segments, step=None, speed=None, period=None, chunk_size=DEFAULT_CHUNK_SIZE,
+          collision_checker=None):
+    """ Generates the joint poses along a path.
+
+    The sampling is specified either by a spatial step, or by the speed of the gripper and
+    the period of the samples. In both cases it is adjusted for each segment to have evenly
+    spaced samples, including both ends. The first sample of a segment is skipped when it
+    is the same as the last one of the previous segment.
+
+    :param kin: the kinematics model
+    :param segments: an iterable of :py:class:`Segment` (which can be a generator too)
+    :param float step: the sampling step (mm)
+    :param float speed: the gripper speed (mm/s)
+    :param float period: the sampling period (s)
+    :param int chunk_size: the number of samples processed at once
+    :param collision_checker: optional :py:class:`pybot.youpi2.collision.CollisionChecker` used
+                              to validate the poses
+    :return: a generator of poses, as lists of the base, shoulder, elbow and wrist angles
+    :raise ValueError: if a part of the path cannot be reached or leads to a collision, or on
+                       invalid parameters
+    """
+    step = _resolve_step(step, speed, period)
+    last_goal = None
+    for seg_num, segment in enumerate(segments):
+        count = max(int(math.ceil(segment.length / step)), 1)
+        first = 1 if last_goal is not None and np.allclose(segment.start, last_goal) else 0
+        for chunk_start in range(first, count + 1, chunk_size):
+            s = np.arange(chunk_start, min(chunk_start + chunk_size, count + 1)) / float(count)
+            goals = segment.goals(s)
+            q, status = kin.ik_batch(*goals.T)
+            failures = np.flatnonzero(status != kin.IK_OK)
+            if failures.size:
+                msg = 'unreachable goal in segment %d (x=%f y=%f z=%f wrist_pitch=%f)' % (
+                    (seg_num,) + tuple(goals[failures[0]])
+                )
+                kin.log_error(msg)
+                raise ValueError(msg)
+
+            if collision_checker is not None:
+                flags = collision_checker.check(q)
+                hits = np.flatnonzero(flags)
+                if hits.size:
+                    msg = 'collision with %s in segment %d (x=%f y=%f z=%f wrist_pitch=%f)' % (
+                        (collision_checker.describe(flags[hits[0]]), seg_num) + tuple(goals[hits[0]])
+                    )
+                    kin.log_error(msg)
+                    raise ValueError(msg)
+
+            for pose in q.tolist():
+                yield pose
+        last_goal = segment.end
+
+
+def line(kin, start, end, **kwargs):
+    """ Generates the joint poses along a straight line.
+
+    Shorthand for :py:func:`poses` with a single :py:class:`Line` segment.
+    """
+    return poses(kin, [Line(start, end)], **kwargs)
+
+
+def arc(kin, start, via, end, **kwargs):
+    """ Generates the joint poses along a circular arc.
+
+    Shorthand for :py:func:`poses` with a single :py:class:`Arc` segment.
+    """
+    return poses(kin, [Arc(start, via, end)], **kwargs)
+
+
+def polyline(kin, points, **kwargs):
+    """ Generates the joint poses along a sequence of straight lines joining successive points.
+
+    The points can be provided by a generator.
+    """
+    def segments():
+        it = iter(points)
+        try:
+            previous = next(it)
+        except StopIteration:
+            return
+        for point in it:
+            yield Line(previous, point)
+            previous = point
+
+    return poses(kin, segments(), **kwargs)
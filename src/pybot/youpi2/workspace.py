@@ -0,0 +1,250 @@
+# -*- coding: utf-8 -*-
+
+""" Precomputed index of the arm reachable workspace.
+
+The index is a voxel grid covering the workspace, expressed in the table frame used
+by :py:class:`pybot.youpi2.kin.Kinematics`. Each cell stores if its center can be
+reached and the range of the wrist pitches which can be used for this.
+
+Building the index is expensive, but it is done once for all, and the result is stored
+in a compact file, which is memory-mapped when loaded. Reachability queries then become
+simple table lookups.
+"""
+
+import json
+import os
+import struct
+
+import numpy as np
+
+__author__ = 'Eric Pascual'
+
+
+class WorkspaceIndex(object):
+    """ The reachable workspace index.
+
+    The feasible pitches of a cell are stored as the interval enclosing all the pitches
+    found valid when building the index, within the ``[-180, 180)`` degrees range. It
+    can thus contain some invalid pitches when the feasible set is not contiguous.
+    """
+    FILE_MAGIC = b'YWSI'
+    FILE_VERSION = 1
+    #: file preamble : magic, version, JSON header length
+    _PREAMBLE = struct.Struct('<4sHI')
+    #: alignment of the cells data in the file
+    _DATA_ALIGNMENT = 16
+
+    CELL_DTYPE = np.dtype([('reachable', 'u1'), ('pitch_min', '<i2'), ('pitch_max', '<i2')])
+
+    DEFAULT_RESOLUTION = 10     #: default cell size (mm)
+    DEFAULT_PITCH_STEP = 5      #: default wrist pitch sampling step (degrees)
+    PITCH_MIN, PITCH_MAX = -180, 180
+
+    def __init__(self, cells, origin, resolution, pitch_step, signature):
+        """
+        Instances are not supposed to be created directly, but using :py:meth:`build`,
+        :py:meth:`load` or :py:meth:`open`.
+
+        :param cells: the 3D array of cells, indexed by X, Y and Z
+        :param origin: the coordinates of the grid lowest corner
+        :param int resolution: the size of the cells
+        :param int pitch_step: the wrist pitch sampling step used to build the index
+        :param tuple signature: the signature of the kinematic model the index is built for
+        """
+        self.cells = cells
+        self.origin = np.asarray(origin, dtype=float)
+        self.resolution = resolution
+        self.pitch_step = pitch_step
+        self.signature = tuple(signature)
+
+    @property
+    def shape(self):
+        return self.cells.shape
+
+    @staticmethod
+    def default_bounds(kin):
+        """ Returns the bounds of the grid enclosing the whole workspace above the table.
+
+        :param kin: the kinematics model
+        :return: the (min, max) bounds along X, Y and Z
+        :rtype: tuple
+        """
+        reach = 2 * kin.L_SEGMENT + kin.L_GRIPPER
+        x_axis = -kin.X_OFFSET_FROM_ROTATION_AXIS
+        return (x_axis - reach, x_axis + reach), (-reach, reach), (0, kin.Z_SHOULDER + reach)
+
+    @classmethod
+    def grid_geometry(cls, kin, bounds=None, resolution=DEFAULT_RESOLUTION):
+        """ Returns the origin and the shape of the grid covering given bounds.
+
+        :param kin: the kinematics model
+        :param bounds: the (min, max) bounds of the grid along X, Y and Z (default: see :py:meth:`default_bounds`)
+        :param int resolution: the size of the cells
+        :return: the coordinates of the grid lowest corner and the number of cells along X, Y and Z
+        :rtype: tuple
+        """
+        bounds = np.array(cls.default_bounds(kin) if bounds is None else bounds, dtype=float)
+        origin = bounds[:, 0]
+        return origin, tuple(int(n) for n in np.ceil((bounds[:, 1] - origin) / resolution))
+
+    @classmethod
+    def build(cls, kin, bounds=None, resolution=DEFAULT_RESOLUTION, pitch_step=DEFAULT_PITCH_STEP):
+        """ Builds the index of the workspace of a given kinematic model.
+
+        :param kin: the kinematics model
+        :param bounds: the (min, max) bounds of the grid along X, Y and Z (default: see :py:meth:`default_bounds`)
+        :param int resolution: the size of the cells
+        :param int pitch_step: the wrist pitch sampling step
+        :return: the index
+        :rtype: WorkspaceIndex
+        """
+        resolution, pitch_step = int(resolution), int(pitch_step)
+        if resolution <= 0 or pitch_step <= 0:
+            raise ValueError('resolution and pitch step must be positive')
+
+        origin, shape = cls.grid_geometry(kin, bounds, resolution)
+
+        kin.log_info(
+            'building workspace index (shape=%s resolution=%d pitch_step=%d)' % (shape, resolution, pitch_step)
+        )
+
+        cell_centers = [origin[i] + (np.arange(n) + 0.5) * resolution for i, n in enumerate(shape)]
+        pitches = np.arange(cls.PITCH_MIN, cls.PITCH_MAX, pitch_step)
+        y, z, pitch = np.meshgrid(cell_centers[1], cell_centers[2], pitches, indexing='ij')
+
+        cells = np.zeros(shape, dtype=cls.CELL_DTYPE)
+        # process the grid by X slices to keep the memory usage reasonable
+        for ix, x in enumerate(cell_centers[0]):
+            _, status = kin.ik_batch(x, y, z, pitch)
+            valid = (status == kin.IK_OK).reshape(pitch.shape)
+
+            reachable = valid.any(axis=2)
+            layer = cells[ix]
+            layer['reachable'] = reachable
+            layer['pitch_min'][reachable] = np.where(valid, pitch, cls.PITCH_MAX).min(axis=2)[reachable]
+            layer['pitch_max'][reachable] = np.where(valid, pitch, cls.PITCH_MIN).max(axis=2)[reachable]
+
+        return cls(cells, origin, resolution, pitch_step, kin.model_signature())
+
+    def save(self, path):
+        """ Saves the index in a file which can be memory-mapped by :py:meth:`load`.
+
+        :param str path: the path of the file
+        """
+        header = json.dumps({
+            'origin': self.origin.tolist(),
+            'shape': list(self.shape),
+            'resolution': self.resolution,
+            'pitch_step': self.pitch_step,
+            'signature': list(self.signature),
+        }).encode('utf-8')
+        header_end = self._PREAMBLE.size + len(header)
+        header += b' ' * (-header_end % self._DATA_ALIGNMENT)
+
+        with open(path, 'wb') as fp:
+            fp.write(self._PREAMBLE.pack(self.FILE_MAGIC, self.FILE_VERSION, len(header)))
+            fp.write(header)
+            fp.write(np.ascontiguousarray(self.cells).tobytes())
+
+    @classmethod
+    def load(cls, path):
+        """ Loads an index from a file, the cells being memory-mapped.
+
+        :param str path: the path of the file
+        :return: the index
+        :rtype: WorkspaceIndex
+        :raise ValueError: if the file is not a valid index file
+        """
+        with open(path, 'rb') as fp:
+            preamble = fp.read(cls._PREAMBLE.size)
+            if len(preamble) != cls._PREAMBLE.size:
+                raise ValueError('not a workspace index file (%s)' % path)
+            magic, version, header_len = cls._PREAMBLE.unpack(preamble)
+            if magic != cls.FILE_MAGIC:
+                raise ValueError('not a workspace index file (%s)' % path)
+            if version != cls.FILE_VERSION:
+                raise ValueError('unsupported workspace index file version (%d)' % version)
+            header = json.loads(fp.read(header_len).decode('utf-8'))
+
+        cells = np.memmap(
+            path, dtype=cls.CELL_DTYPE, mode='r',
+            offset=cls._PREAMBLE.size + header_len, shape=tuple(header['shape'])
+        )
+        return cls(cells, header['origin'], header['resolution'], header['pitch_step'], header['signature'])
+
+    @classmethod
+    def open(cls, path, kin, bounds=None, resolution=DEFAULT_RESOLUTION, pitch_step=DEFAULT_PITCH_STEP):
+        """ Returns the index stored in a file, (re)building it if the file does not exist or
+        if it has been built for a different kinematic model or with different parameters.
+
+        :param str path: the path of the index file
+        :param kin: the kinematics model
+        :param bounds: see :py:meth:`build`
+        :param int resolution: see :py:meth:`build`
+        :param int pitch_step: see :py:meth:`build`
+        :return: the index
+        :rtype: WorkspaceIndex
+        """
+        if os.path.exists(path):
+            try:
+                index = cls.load(path)
+            except ValueError as e:
+                kin.log_warning('%s => rebuilding it' % e)
+            else:
+                if index.is_valid_for(kin, bounds, resolution, pitch_step):
+                    return index
+                kin.log_info('workspace index is outdated => rebuilding it')
+                # release the memory-mapped file before overwriting it
+                del index
+
+        index = cls.build(kin, bounds, resolution, pitch_step)
+        index.save(path)
+        return cls.load(path)
+
+    def is_valid_for(self, kin, bounds=None, resolution=DEFAULT_RESOLUTION, pitch_step=DEFAULT_PITCH_STEP):
+        """ Tells if the index corresponds to a given kinematic model and build parameters. """
+        if tuple(self.signature) != tuple(kin.model_signature()):
+            return False
+        if (self.resolution, self.pitch_step) != (int(resolution), int(pitch_step)):
+            return False
+        origin, shape = self.grid_geometry(kin, bounds, resolution)
+        return tuple(self.shape) == shape and np.allclose(self.origin, origin)
+
+    def _cells_at(self, x, y, z):
+        """ Returns the cells containing the given points, and a mask telling which points
+        are inside the grid.
+        """
+        ijk = np.floor(
+            (np.stack(np.broadcast_arrays(x, y, z), axis=-1) - self.origin) / self.resolution
+        ).astype(int)
+        inside = ((ijk >= 0) & (ijk < self.shape)).all(axis=-1)
+        ijk[~inside] = 0
+        return self.cells[ijk[..., 0], ijk[..., 1], ijk[..., 2]], inside
+
+    def is_reachable(self, x, y, z):
+        """ Tells if a point can be reached.
+
+        Coordinates can be arrays, in which case an array of booleans is returned.
+
+        :param x: X coordinate of the gripper end
+        :param y: Y coordinate of the gripper end
+        :param z: Z coordinate of the gripper end
+        :return: True if the point can be reached
+        """
+        cells, inside = self._cells_at(x, y, z)
+        result = inside & (cells['reachable'] != 0)
+        return bool(result) if result.ndim == 0 else result
+
+    def pitch_range(self, x, y, z):
+        """ Returns the range of wrist pitches which can be used to reach a point.
+
+        :param float x: X coordinate of the gripper end
+        :param float y: Y coordinate of the gripper end
+        :param float z: Z coordinate of the gripper end
+        :return: the (min, max) pitches, or None if the point cannot be reached
+        :rtype: tuple
+        """
+        cell, inside = self._cells_at(x, y, z)
+        if not (inside and cell['reachable']):
+            return None
+        return int(cell['pitch_min']), int(cell['pitch_max'])
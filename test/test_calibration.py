@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from pybot.core import log
+from pybot.youpi2.kin import Kinematics
+from pybot.youpi2.model import YoupiArm
+from pybot.youpi2 import calibration
+
+__author__ = 'Eric Pascual'
+
+logger = log.getLogger()
+
+
+class CalibrationTestCase(unittest.TestCase):
+    # true dimensions of the simulated arm
+    TRUE_DIMENSIONS = {
+        'L_SEGMENT': 165.,
+        'L_GRIPPER': 146.5,
+        'Z_SHOULDER': 283.,
+        'X_OFFSET_FROM_ROTATION_AXIS': 102.,
+    }
+    # true angle = reported angle + error (base, shoulder, elbow, wrist)
+    ANGLE_ERRORS = np.array([1.5, -2., 1., 3.])
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'calibration.json')
+
+        true_kin = Kinematics(parent=logger)
+        for name, value in self.TRUE_DIMENSIONS.items():
+            setattr(true_kin, name, value)
+
+        rng = np.random.RandomState(42)
+        lo, hi = Kinematics.joint_limits()
+        self.poses = rng.uniform(lo, hi, (50, 4))
+        self.positions = true_kin.dk_batch(self.poses + self.ANGLE_ERRORS) + rng.normal(0, 0.05, (50, 3))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_fit(self):
+        result = calibration.fit(self.poses, self.positions)
+        for name, value in self.TRUE_DIMENSIONS.items():
+            self.assertAlmostEqual(result['kinematics'][name], value, delta=0.1)
+        for name, error in zip(calibration.FITTED_JOINTS, self.ANGLE_ERRORS):
+            nominal = YoupiArm.index_offsets.get(YoupiArm.motor_id(name), 0)
+            self.assertAlmostEqual(result['index_offsets'][name], nominal - error, delta=0.05)
+        self.assertLess(result['rms_error'], 0.2)
+        self.assertEqual(result['samples'], 50)
+
+    def test_not_enough_samples(self):
+        with self.assertRaises(ValueError):
+            calibration.fit(self.poses[:3], self.positions[:3])
+
+    def test_apply(self):
+        result = calibration.fit(self.poses, self.positions)
+        calibration.save_calibration(result, self.path)
+
+        kin = Kinematics(parent=logger, calibration=self.path)
+        for name in calibration.KINEMATIC_PARAMETERS:
+            self.assertAlmostEqual(getattr(kin, name), result['kinematics'][name])
+        self.assertEqual(Kinematics.L_SEGMENT, 162)
+
+        # the calibrated model matches the measures once the corrected index offsets are used
+        corrections = np.array([
+            YoupiArm.index_offsets.get(YoupiArm.motor_id(name), 0) - result['index_offsets'][name]
+            for name in calibration.FITTED_JOINTS
+        ])
+        errors = np.linalg.norm(kin.dk_batch(self.poses + corrections) - self.positions, axis=1)
+        self.assertLess(errors.max(), 0.5)
+
+    def test_default_calibration(self):
+        result = calibration.fit(self.poses, self.positions)
+        calibration.save_calibration(result, self.path)
+
+        default_path = calibration.DEFAULT_PATH
+        calibration.DEFAULT_PATH = self.path
+        try:
+            kin = Kinematics(parent=logger)
+            self.assertAlmostEqual(kin.L_SEGMENT, result['kinematics']['L_SEGMENT'])
+            self.assertEqual(Kinematics(parent=logger, calibration=False).L_SEGMENT, 162)
+
+            calibration.DEFAULT_PATH = os.path.join(self.tmp_dir, 'missing.json')
+            self.assertIsNone(calibration.default_calibration())
+            self.assertEqual(Kinematics(parent=logger).L_SEGMENT, 162)
+        finally:
+            calibration.DEFAULT_PATH = default_path
+
+
+if __name__ == '__main__':
+    unittest.main()
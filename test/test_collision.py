@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+
+import numpy as np
+
+from pybot.core import log
+from pybot.youpi2.kin import Kinematics
+from pybot.youpi2.collision import CollisionChecker, _segments_distance
+from pybot.youpi2 import trajectory
+
+__author__ = 'Eric Pascual'
+
+logger = log.getLogger()
+
+
+class SegmentsDistanceTestCase(unittest.TestCase):
+    def test_against_sampling(self):
+        rng = np.random.RandomState(0)
+        p1, q1, p2, q2 = rng.uniform(-100, 100, (4, 200, 3))
+        distances = _segments_distance(p1, q1, p2, q2)
+
+        u = np.linspace(0, 1, 201)[:, np.newaxis]
+        for i in range(len(distances)):
+            s1 = p1[i] + u * (q1[i] - p1[i])
+            s2 = p2[i] + u * (q2[i] - p2[i])
+            sampled = np.sqrt(((s1[:, np.newaxis] - s2[np.newaxis]) ** 2).sum(axis=2)).min()
+            self.assertLessEqual(distances[i], sampled + 1e-9)
+            self.assertAlmostEqual(distances[i], sampled, delta=1.)
+
+    def test_parallel(self):
+        d = _segments_distance(
+            np.array([[0., 0, 0]]), np.array([[10., 0, 0]]), np.array([[5., 3, 0]]), np.array([[20., 3, 0]])
+        )
+        self.assertAlmostEqual(d[0], 3)
+
+
+class CollisionCheckerTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.kin = Kinematics(parent=logger)
+        cls.checker = CollisionChecker(cls.kin)
+
+    def test_poses(self):
+        poses = [
+            [0, 0, 0, 0],                       # upright
+            self.kin.ik(100, 0, 0, 90),         # gripper end on the table
+            [0, 90, 90, 0],                     # gripper through the table
+            [0, 30, 120, 120],                  # gripper folded back onto the arm and the base
+        ]
+        flags = self.checker.check(np.array(poses)[:, :4])
+        self.assertListEqual(flags.tolist(), [
+            0,
+            0,
+            CollisionChecker.HIT_TABLE,
+            CollisionChecker.HIT_BASE | CollisionChecker.HIT_ARM,
+        ])
+        self.assertTrue(self.checker.is_free([0, 0, 0, 0]))
+
+    def test_first_collision(self):
+        path = np.linspace([0, 0, 0, 0], [0, 90, 90, 0], 91)
+        index = self.checker.first_collision(path)
+        self.assertIsNotNone(index)
+        self.assertFalse(self.checker.check(path[:index]).any())
+        self.assertIsNone(self.checker.first_collision(path[:index]))
+
+    def test_trajectory(self):
+        start, end = (150, 150, 50, 90), (150, -150, 50, 90)
+        self.assertEqual(len(list(trajectory.line(self.kin, start, end, step=10, collision_checker=self.checker))), 31)
+        # with the gripper pointing backwards, this one passes through the base
+        start, end = (0, 150, 100, 120), (0, -150, 100, 120)
+        self.assertEqual(len(list(trajectory.line(self.kin, start, end, step=10))), 31)
+        with self.assertRaises(ValueError):
+            list(trajectory.line(self.kin, start, end, step=10, collision_checker=self.checker))
+
+
+if __name__ == '__main__':
+    unittest.main()
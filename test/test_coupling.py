@@ -1,5 +1,7 @@
 import unittest
 
+import numpy as np
+
 from pybot.youpi2.model import YoupiArm
 
 
@@ -97,5 +99,29 @@ class GlobalToLocalTestCase(unittest.TestCase):
         self.assertEqual(_local, [0, 10, 10, 10, -20, 0])
 
 
+class BatchTestCase(unittest.TestCase):
+    def setUp(self):
+        self.joints = np.random.RandomState(0).uniform(-90, 90, (100, YoupiArm.MOTORS_COUNT))
+
+    def test_joint_to_motor(self):
+        motors = YoupiArm.joint_to_motor_batch(self.joints)
+        self.assertEqual(motors.shape, self.joints.shape)
+        for joints, expected in zip(self.joints, motors):
+            angles = dict(enumerate(joints))
+            YoupiArm.joint_to_motor(angles)
+            self.assertTrue(np.allclose([angles[m] for m in YoupiArm.MOTORS_ALL], expected))
+
+    def test_round_trip(self):
+        motors = YoupiArm.joint_to_motor_batch(self.joints)
+        self.assertTrue(np.allclose(YoupiArm.motor_to_joint_batch(motors), self.joints))
+        self.assertTrue(np.allclose(YoupiArm.global_to_local(motors[0].tolist()), self.joints[0]))
+
+    def test_single_pose(self):
+        self.assertListEqual(
+            YoupiArm.joint_to_motor_batch([0, 10, 0, 0, 0, 0]).tolist(),
+            [0, 10, 10, 10, -10, 0]
+        )
+
+
 if __name__ == '__main__':
     unittest.main()
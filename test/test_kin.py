@@ -1,9 +1,14 @@
 # -*- coding: utf-8 -*-
 
+import os
+import tempfile
 import unittest
 
+import numpy as np
+
 from pybot.core import log
 from pybot.youpi2.kin import Kinematics
+from pybot.youpi2.model import YoupiArm
 
 __author__ = 'Eric Pascual'
 
@@ -63,6 +68,169 @@ class IKTestCase(unittest.TestCase):
             self.assertAlmostEqual(angle, expected, places=1)
 
 
+class IKBatchTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.kin = Kinematics(parent=logger)
+
+    def test_01(self):
+        goals = np.array([
+            (2 * Kinematics.L_SEGMENT + Kinematics.L_GRIPPER - Kinematics.X_OFFSET_FROM_ROTATION_AXIS,
+             0, Kinematics.Z_SHOULDER, 0),
+            (Kinematics.L_SEGMENT - Kinematics.X_OFFSET_FROM_ROTATION_AXIS, 0, 0, 90),
+            (Kinematics.L_SEGMENT + Kinematics.L_GRIPPER - Kinematics.X_OFFSET_FROM_ROTATION_AXIS,
+             Kinematics.L_SEGMENT, Kinematics.Z_SHOULDER, 0),
+        ])
+        q, status = self.kin.ik_batch(*goals.T)
+        self.assertEqual(q.shape, (3, 4))
+        self.assertListEqual(status.tolist(), [Kinematics.IK_OK] * 3)
+        for pose, goal in zip(q, goals):
+            for angle, expected in zip(pose, self.kin.ik(*goal)):
+                self.assertAlmostEqual(angle, expected, places=6)
+
+    def test_02(self):
+        q, status = self.kin.ik_batch(
+            [1000, Kinematics.L_SEGMENT, -2 * Kinematics.L_SEGMENT - Kinematics.L_GRIPPER],
+            0,
+            [0, 0, Kinematics.Z_SHOULDER],
+            0
+        )
+        self.assertEqual(status[0], Kinematics.IK_OUT_OF_REACH)
+        self.assertTrue(np.isnan(q[0]).all())
+        self.assertEqual(status[1], Kinematics.IK_LIMIT_SHOULDER)
+        self.assertEqual(status[2], Kinematics.IK_LIMIT_BASE)
+
+
+class PitchRangeTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.kin = Kinematics(parent=logger)
+
+    def test_01(self):
+        pitches = np.arange(-180, 180, 0.5)
+        for goal in [(Kinematics.L_SEGMENT, 0, 0), (0, 100, 200), (-200, -150, 350), (1000, 0, 0)]:
+            ranges = self.kin.feasible_pitch_ranges(*goal)
+            _, status = self.kin.ik_batch(goal[0], goal[1], goal[2], pitches)
+            for pitch, valid in zip(pitches, status == Kinematics.IK_OK):
+                in_ranges = any(lo <= pitch <= hi for lo, hi in ranges)
+                near_boundary = any(abs(pitch - b) < 1e-3 for r in ranges for b in r)
+                self.assertTrue(in_ranges == valid or near_boundary, (goal, pitch))
+
+    def test_02(self):
+        goal = (Kinematics.L_SEGMENT - Kinematics.X_OFFSET_FROM_ROTATION_AXIS, 0, 0)
+        pitch, q = self.kin.ik_nearest_pitch(*goal, wrist_pitch=90)
+        self.assertEqual(pitch, 90)
+        self.assertListEqual(q, self.kin.ik(*goal, wrist_pitch=90))
+
+    def test_03(self):
+        goal = (Kinematics.L_SEGMENT, 0, 0)
+        with self.assertRaises(ValueError):
+            self.kin.ik(*goal, wrist_pitch=0)
+        pitch, q = self.kin.ik_nearest_pitch(*goal, wrist_pitch=0)
+        ranges = self.kin.feasible_pitch_ranges(*goal)
+        self.assertAlmostEqual(pitch, min((b for r in ranges for b in r), key=abs), places=3)
+        for v, expected in zip(self.kin.dk(q), goal):
+            self.assertAlmostEqual(v, expected, places=3)
+
+    def test_04(self):
+        with self.assertRaises(ValueError):
+            self.kin.ik_nearest_pitch(1000, 0, 0)
+
+    def test_05(self):
+        # the nearest pitch is at a feasible range boundary, where the cache quantization
+        # would make the IK fail
+        kin = Kinematics(parent=logger)
+        kin.enable_ik_cache()
+        goal = (Kinematics.L_SEGMENT, 0, 0)
+        pitch, q = kin.ik_nearest_pitch(*goal, wrist_pitch=0)
+        self.assertEqual((pitch, q), self.kin.ik_nearest_pitch(*goal, wrist_pitch=0))
+
+
+class IKSolutionsTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.kin = Kinematics(parent=logger)
+
+    def test_01(self):
+        goal = (100, 0, 550, 0)
+        solutions = self.kin.ik_solutions(*goal)
+        self.assertGreater(len(solutions), 1)
+        self.assertTrue(any(np.allclose(q, self.kin.ik(*goal)) for q in solutions))
+        for q in solutions:
+            for v, expected in zip(self.kin.dk(q), goal):
+                self.assertAlmostEqual(v, expected, places=6)
+            self.assertAlmostEqual(sum(q[1:]) - 90, goal[3], places=6)
+
+    def test_02(self):
+        self.assertListEqual(self.kin.ik_solutions(1000, 0, 0), [])
+        with self.assertRaises(ValueError):
+            self.kin.ik_min_travel(1000, 0, 0, [0] * 6)
+
+    def test_03(self):
+        solutions = self.kin.ik_solutions(150, 50, 100, 90, hand_angle=10)
+        self.assertTrue(solutions)
+        self.assertSetEqual({q[4] for q in solutions}, {-170, 10})
+
+        current = solutions[0][:4]
+        q = self.kin.ik_min_travel(150, 50, 100, current + [0, 0], 90, hand_angle=10)
+        self.assertEqual(q[4], 10)
+        q = self.kin.ik_min_travel(150, 50, 100, current + [-160, 0], 90, hand_angle=10)
+        self.assertEqual(q[4], -170)
+
+    def test_04(self):
+        solutions = self.kin.ik_solutions(150, 50, 100, 90)
+        for current in solutions:
+            self.assertEqual(self.kin.ik_min_travel(150, 50, 100, current + [0, 0], 90), current)
+            self.assertEqual(Kinematics.travel_time(current, current), 0)
+
+
+class IKCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.kin = Kinematics(parent=logger)
+        self.cache = self.kin.enable_ik_cache(size=2)
+        self.goal = (Kinematics.L_SEGMENT - Kinematics.X_OFFSET_FROM_ROTATION_AXIS, 0, 0, 90)
+
+    def test_01(self):
+        q = self.kin.ik(*self.goal)
+        self.assertEqual((self.cache.hits, self.cache.misses), (0, 1))
+        self.assertListEqual(self.kin.ik(self.goal[0] + 0.01, *self.goal[1:]), q)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+
+        self.kin.disable_ik_cache()
+        for angle, expected in zip(q, self.kin.ik(*self.goal)):
+            self.assertAlmostEqual(angle, expected, places=6)
+
+    def test_02(self):
+        for _ in range(2):
+            with self.assertRaises(ValueError):
+                self.kin.ik(Kinematics.L_SEGMENT, 0, 0, 0)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+
+    def test_03(self):
+        self.kin.ik(*self.goal)
+        self.kin.ik(self.goal[0], 0, 10, 90)
+        self.kin.ik(*self.goal)
+        self.kin.ik(self.goal[0], 0, 20, 90)
+        self.assertEqual(self.cache.evictions, 1)
+        self.kin.ik(*self.goal)
+        self.assertEqual(self.cache.hits, 2)
+
+    def test_04(self):
+        self.kin.ik(*self.goal)
+        self.kin.L_GRIPPER = Kinematics.L_GRIPPER + 1
+        self.kin.ik(*self.goal)
+        self.assertEqual(self.cache.invalidations, 1)
+
+        settings = YoupiArm.settings[YoupiArm.MOTOR_WRIST]
+        settings.MAX_POS_DEG += 1
+        try:
+            self.kin.ik(*self.goal)
+        finally:
+            del settings.MAX_POS_DEG
+        self.assertEqual(self.cache.invalidations, 2)
+        self.assertEqual(self.cache.hits, 0)
+
+
 class DKTestCase(unittest.TestCase):
     @classmethod
     def setUpClass(cls):
@@ -86,5 +254,85 @@ class DKTestCase(unittest.TestCase):
         ))
 
 
+class DKBatchTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.kin = Kinematics(parent=logger)
+        cls.poses = np.array([
+            (0, 0, 0, 0, 0, 0),
+            (0, 90, 0, 90, 0, 0),
+            (27.4, 38.5, 103.1, -51.5, 10, 0),
+            (-120, -30, 45, 80, 0, 0),
+        ])
+
+    def test_01(self):
+        xyz = self.kin.dk_batch(self.poses)
+        self.assertEqual(xyz.shape, (len(self.poses), 3))
+        for actual, pose in zip(xyz, self.poses):
+            for v, expected in zip(actual, self.kin.dk(pose)):
+                self.assertAlmostEqual(v, expected, places=6)
+
+    def test_02(self):
+        xyz, elbow, wrist = self.kin.dk_batch(self.poses, intermediate=True)
+        self.assertTrue(np.allclose(xyz, self.kin.dk_batch(self.poses)))
+        shoulder = (-Kinematics.X_OFFSET_FROM_ROTATION_AXIS, 0, Kinematics.Z_SHOULDER)
+        self.assertTrue(np.allclose(np.linalg.norm(elbow - shoulder, axis=1), Kinematics.L_SEGMENT))
+        self.assertTrue(np.allclose(np.linalg.norm(wrist - elbow, axis=1), Kinematics.L_SEGMENT))
+        self.assertTrue(np.allclose(np.linalg.norm(xyz - wrist, axis=1), Kinematics.L_GRIPPER))
+
+    def test_03(self):
+        fd, path = tempfile.mkstemp(suffix='.npy')
+        os.close(fd)
+        try:
+            np.save(path, self.poses)
+            self.assertTrue(np.allclose(self.kin.dk_batch(path), self.kin.dk_batch(self.poses)))
+        finally:
+            os.remove(path)
+
+    def test_04(self):
+        # float32 recording, processed in several chunks
+        kin = Kinematics(parent=logger)
+        kin.DK_BATCH_CHUNK_SIZE = 3
+        fd, path = tempfile.mkstemp(suffix='.npy')
+        os.close(fd)
+        try:
+            np.save(path, self.poses.astype(np.float32))
+            for actual, expected in zip(kin.dk_batch(path, intermediate=True),
+                                        self.kin.dk_batch(self.poses, intermediate=True)):
+                self.assertTrue(np.allclose(actual, expected, atol=1e-3))
+        finally:
+            os.remove(path)
+
+
+class JacobianTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.kin = Kinematics(parent=logger)
+
+    def forward(self, pose):
+        return np.array(self.kin.dk(pose) + (sum(pose[1:4]) - 90,))
+
+    def test_01(self):
+        for pose in [(0, 0, 0, 0), (10, 30, 60, 20), (-45, 80, -30, 45)]:
+            pose = np.array(pose, dtype=float)
+            numeric = np.array([
+                (self.forward(pose + dq) - self.forward(pose - dq)) / 2e-6
+                for dq in np.eye(4) * 1e-6
+            ]).T
+            self.assertTrue(np.allclose(self.kin.jacobian(pose), numeric, atol=1e-4))
+
+    def test_02(self):
+        pose = (10, 30, 60, 20)
+        velocity = (20, -5, 10, 2)
+        rates = self.kin.resolved_rate(pose, velocity)
+        self.assertTrue(np.allclose(self.kin.jacobian(pose).dot(rates), velocity))
+
+    def test_03(self):
+        # fully stretched arm : no vertical motion possible, and bounded rates
+        rates = self.kin.resolved_rate((0, 0, 0, 0), (0, 0, 20, 0))
+        self.assertTrue(np.isfinite(rates).all())
+        self.assertTrue(np.allclose(rates, 0))
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,642 @@
+# -*- coding: utf-8 -*-
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from pybot.core import log
+from pybot.dspin import defs
+from pybot.dspin.core import CommandTimeOut
+from pybot.dspin.defs import Register, Status
+from pybot.youpi2.model import OutOfBoundError, YoupiArmError
+from pybot.youpi2.sim import SimulatedYoupiArm, MAX_SPEED_REG_FACTOR, SPEED_REG_FACTOR
+from pybot.youpi2.state import load_state
+
+__author__ = 'Eric Pascual'
+
+logger = log.getLogger()
+
+
+class VirtualClock(object):
+    def __init__(self):
+        self.now = 0.
+
+    def __call__(self):
+        return self.now
+
+
+class ClockedArm(SimulatedYoupiArm):
+    """ Simulated arm which time is explicitly driven """
+    clock = VirtualClock()
+
+    def advance(self, duration):
+        self.clock.now += duration
+
+
+class SimulatedArmTestCase(unittest.TestCase):
+    def setUp(self):
+        self.arm = SimulatedYoupiArm(logger=logger, time_scale=20)
+        self.arm.initialize()
+
+    def test_moves(self):
+        arm = self.arm
+        arm.joints_move({arm.MOTOR_SHOULDER: 30})
+        self.assertAlmostEqual(arm.get_joint_positions()[arm.MOTOR_SHOULDER], 30, places=2)
+        self.assertEqual(arm.ABS_POS[arm.MOTOR_SHOULDER], arm.settings[arm.MOTOR_SHOULDER].degrees_to_steps(30))
+
+        arm.coupled_joints_goto({arm.MOTOR_SHOULDER: 0, arm.MOTOR_ELBOW: 20})
+        positions = arm.get_joint_positions()
+        self.assertAlmostEqual(positions[arm.MOTOR_SHOULDER], 0, places=2)
+        self.assertAlmostEqual(positions[arm.MOTOR_ELBOW], 20, places=2)
+
+    def test_completion_latency(self):
+        arm = self.arm
+        self.assertIsNone(arm.completion_latency())
+        arm.joints_move({arm.MOTOR_BASE: 10})
+        arm.joints_move({arm.MOTOR_BASE: -10})
+        count, mean, worst = arm.completion_latency()
+        self.assertEqual(count, 2)
+        self.assertLessEqual(mean, worst)
+        self.assertLess(worst, arm.BUSY_POLL_PERIOD * 4)
+
+    def test_gripper(self):
+        arm = self.arm
+        arm.calibrate_gripper()
+        self.assertFalse(arm.gripper_is_closed())
+        self.assertEqual(arm.read_register(Register.ABS_POS)[arm.MOTOR_GRIPPER], 0)
+
+        arm.grasp_object(2000)
+        arm.close_gripper()
+        self.assertTrue(arm.gripper_is_closed())
+        open_steps = arm.settings[arm.MOTOR_GRIPPER].open_steps
+        # the motor is stopped with a soft stop once the contact is detected
+        self.assertAlmostEqual(arm.ABS_POS[arm.MOTOR_GRIPPER], 2000 - open_steps, delta=10)
+
+        arm.open_gripper()
+        self.assertFalse(arm.gripper_is_closed())
+
+    def test_fast_gripper_close(self):
+        arm = ClockedArm(logger=logger)
+        arm.initialize()
+
+        def tick():
+            arm.advance(0.05)
+
+        def timed_close(**kwargs):
+            start = arm.clock.now
+            arm.close_gripper(wait_cb=tick, **kwargs)
+            return arm.clock.now - start
+
+        settings = arm.settings[arm.MOTOR_GRIPPER]
+        arm.calibrate_gripper(wait_cb=tick)
+        arm.grasp_object(int(20 * settings.steps_per_mm))
+
+        slow = timed_close()
+        self.assertTrue(arm.gripper_is_closed())
+        contact = arm.ABS_POS[arm.MOTOR_GRIPPER]
+        arm.open_gripper(wait_cb=tick)
+
+        fast = timed_close(object_width=20)
+        self.assertTrue(arm.gripper_is_closed())
+        self.assertAlmostEqual(arm.ABS_POS[arm.MOTOR_GRIPPER], contact, delta=10)
+        self.assertAlmostEqual(settings.position_to_width(contact), 20, delta=0.2)
+        self.assertLess(fast, slow * 0.8)
+
+        arm.open_gripper(wait_cb=tick)
+        with self.assertRaises(ValueError):
+            arm.close_gripper(wait=False, object_width=20)
+
+    def test_gripper_stall(self):
+        arm = self.arm
+        settings = arm.settings[arm.MOTOR_GRIPPER]
+        arm.calibrate_gripper()
+        # the motor stalls before the switch is actuated
+        stall = settings.width_to_position(30)
+        arm.position_limits[arm.MOTOR_GRIPPER] = (stall, float('inf'))
+
+        arm.close_gripper(object_width=28)
+        self.assertFalse(arm.is_busy)
+        self.assertFalse(arm.gripper_is_closed())
+        # the calibration leaves a small offset between the simulated and the reported positions
+        self.assertAlmostEqual(arm.ABS_POS[arm.MOTOR_GRIPPER], stall, delta=10)
+
+    def test_partial_gripper_opening(self):
+        arm = self.arm
+        settings = arm.settings[arm.MOTOR_GRIPPER]
+        with self.assertRaises(YoupiArmError):
+            arm.open_gripper_to(20)
+        arm.calibrate_gripper()
+        self.assertAlmostEqual(arm.gripper_width(), settings.open_width, delta=0.1)
+
+        arm.open_gripper_to(20)
+        self.assertEqual(arm.ABS_POS[arm.MOTOR_GRIPPER], settings.width_to_position(20))
+        self.assertAlmostEqual(arm.gripper_width(), 20, delta=0.1)
+
+        arm.grasp_object(int(10 * settings.steps_per_mm))
+        arm.close_gripper()
+        self.assertTrue(arm.gripper_is_closed())
+        width = arm.gripper_width()
+        self.assertAlmostEqual(width, 10, delta=0.5)
+
+        arm.open_gripper_by(5)
+        self.assertFalse(arm.gripper_is_closed())
+        self.assertAlmostEqual(arm.gripper_width(), width + 5, delta=0.1)
+
+        with self.assertRaises(OutOfBoundError):
+            arm.open_gripper_by(settings.open_width)
+        with self.assertRaises(OutOfBoundError):
+            arm.open_gripper_to(-1)
+
+    def test_derived_timeout(self):
+        arm, motor = self.arm, SimulatedYoupiArm.MOTOR_SHOULDER
+        timeouts = []
+        wait_motion = arm._wait_motion
+
+        def recording_wait(wait_cb=None, timeout=None):
+            timeouts.append(timeout)
+            wait_motion(wait_cb, timeout)
+
+        arm._wait_motion = recording_wait
+
+        arm.joints_move({motor: 10})
+        expected = arm.TimeOuts.from_duration(arm.joints_move_duration({motor: 10}))
+        self.assertEqual(timeouts, [expected])
+        self.assertLess(expected, arm.TimeOuts.DEFAULT)
+
+        arm.joints_move({motor: 10}, timeout=5)
+        self.assertEqual(timeouts[-1], 5)
+
+        # the fixed timeouts are upper bounds
+        self.assertEqual(arm.TimeOuts.from_duration(100, arm.TimeOuts.ROTATE_HAND), arm.TimeOuts.ROTATE_HAND)
+        arm.rotate_hand(10)
+        self.assertEqual(timeouts[-1], arm.TimeOuts.from_duration(
+            arm.joints_move_duration({arm.MOTOR_HAND_ROT: 10}, coupled=True)
+        ))
+        arm.calibrate_gripper()
+        arm.open_gripper_to(20)
+        arm.open_gripper()
+        self.assertLessEqual(timeouts[-1], arm.TimeOuts.OPEN_GRIPPER)
+
+        # the motor is blocked before reaching its goal
+        arm.position_limits[motor] = (0, arm.settings[motor].degrees_to_steps(25))
+        with self.assertRaises(CommandTimeOut):
+            arm.joints_move({motor: 10}, timeout=0.5)
+
+
+class CountingArm(SimulatedYoupiArm):
+    """ Simulated arm counting the ABS_POS registers reads """
+    abs_pos_reads = 0
+
+    def read_register(self, reg):
+        if reg == Register.ABS_POS:
+            self.abs_pos_reads += 1
+        return super(CountingArm, self).read_register(reg)
+
+
+class ShadowPositionsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.arm = CountingArm(logger=logger, time_scale=20)
+        self.arm.initialize()
+
+    def test_no_reads(self):
+        arm = self.arm
+        arm.get_joint_positions()
+        reads = arm.abs_pos_reads
+        arm.joints_move({arm.MOTOR_SHOULDER: 10})
+        arm.coupled_joints_goto({arm.MOTOR_ELBOW: 10})
+        arm.rotate_hand(5)
+        positions = arm.get_joint_positions()
+        self.assertEqual(arm.abs_pos_reads, reads)
+
+        self.assertEqual(arm.verify_positions(), [])
+        self.assertListEqual(arm.get_joint_positions(), positions)
+
+    def test_resync(self):
+        arm = self.arm
+        arm.joints_move({arm.MOTOR_SHOULDER: 10})
+        reads = arm.abs_pos_reads
+
+        # motions not waited for are tracked until completed
+        arm.joints_move({arm.MOTOR_SHOULDER: 10}, wait=False)
+        self.assertAlmostEqual(arm.get_joint_positions(goals=True)[arm.MOTOR_SHOULDER], 20, places=2)
+        self.assertEqual(arm.abs_pos_reads, reads)
+        self.assertLess(arm.get_joint_positions()[arm.MOTOR_SHOULDER], 20)
+        self.assertEqual(arm.abs_pos_reads, reads + 1)
+        arm.wait_for_completion()
+        self.assertAlmostEqual(arm.get_joint_positions()[arm.MOTOR_SHOULDER], 20, places=2)
+
+        # positions are re-read after a stop
+        arm.joints_move({arm.MOTOR_SHOULDER: -10}, wait=False)
+        arm.hard_stop()
+        reads = arm.abs_pos_reads
+        position = arm.get_joint_positions()[arm.MOTOR_SHOULDER]
+        self.assertEqual(arm.abs_pos_reads, reads + 1)
+        self.assertTrue(10 < position < 20)
+
+    def test_move_from_unknown_position(self):
+        arm = self.arm
+        motor = arm.MOTOR_SHOULDER
+        arm.go_until(*arm.expand_parameters({
+            motor: (defs.GoUntilAction.COPY, defs.Direction.FWD, 100)
+        }), wait=False)
+        arm.soft_stop([motor])
+        arm.move(*arm.expand_parameters({motor: (defs.Direction.FWD, 1000)}), wait=False)
+        self.assertNotIn(None, arm.get_motor_positions(goals=True))
+        arm.wait_for_completion()
+
+        position = arm.read_register(Register.ABS_POS)[motor]
+        self.assertEqual(arm.get_motor_positions(goals=True)[motor], arm.settings[motor].steps_to_degrees(position))
+        arm.joints_goto({motor: 0})
+        self.assertAlmostEqual(arm.get_joint_positions()[motor], 0, places=2)
+
+    def test_periodic_verification(self):
+        arm = self.arm
+        arm.position_verify_period = 0
+        arm.get_joint_positions()
+        # position changed behind our back
+        arm.write_register(Register.ABS_POS, [100] * arm.MOTORS_COUNT)
+        self.assertEqual(arm.get_motor_positions()[arm.MOTOR_BASE], arm.settings[arm.MOTOR_BASE].steps_to_degrees(100))
+
+        arm.position_verify_period = None
+        arm.write_register(Register.ABS_POS, [200] * arm.MOTORS_COUNT)
+        self.assertEqual(arm.get_motor_positions()[arm.MOTOR_BASE], arm.settings[arm.MOTOR_BASE].steps_to_degrees(100))
+        self.assertEqual(arm.verify_positions(), list(arm.MOTORS_ALL))
+
+
+class SimulatedSeekOriginTestCase(unittest.TestCase):
+    def test_seek_origin(self):
+        # start close to the index to keep the test short, since it must run in real time
+        # for the index positioning to be as accurate as on the real arm
+        # the index being at 6 degrees, both sides of the index switch are tested
+        for start in (5, 8):
+            arm = SimulatedYoupiArm(logger=logger, initial_positions=[0, start, 0, 0, 0, 0])
+            arm.initialize()
+            arm.seek_origin(arm.MOTOR_SHOULDER)
+            self.assertEqual(arm.ABS_POS[arm.MOTOR_SHOULDER], 0)
+            # physical position of the motor with respect to its mechanical zero
+            error = arm.settings[arm.MOTOR_SHOULDER].steps_to_degrees(arm._motors[arm.MOTOR_SHOULDER].position)
+            self.assertLess(abs(error), 0.5)
+
+    def test_concurrent_seek_origins(self):
+        # indexes at 0, 6, 3, 3 and -1 degrees, approached from both sides
+        starts = [2, 5, 5, 1, 0, 0]
+        positions = []
+        for concurrent in (False, True):
+            arm = SimulatedYoupiArm(logger=logger, initial_positions=starts)
+            arm.initialize()
+            arm.seek_origins(arm.JOINT_MOTORS, concurrent=concurrent)
+            for m in arm.JOINT_MOTORS:
+                self.assertEqual(arm.ABS_POS[m], 0)
+            positions.append([arm._motors[m].position for m in arm.JOINT_MOTORS])
+
+        # the index positions being fixed in the motor frames, the coupled joints do not
+        # need to be searched in sequence
+        for m, sequential, concurrent in zip(arm.JOINT_MOTORS, *positions):
+            self.assertLess(abs(arm.settings[m].steps_to_degrees(concurrent - sequential)), 0.1)
+            self.assertLess(abs(arm.settings[m].steps_to_degrees(concurrent)), 0.5)
+
+
+class PositionStateTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'state.json')
+
+        arm = SimulatedYoupiArm(logger=logger, time_scale=20, initial_positions=[-2, 0, 0, 0, 0, 0], state_path=self.path)
+        arm.initialize()
+        arm.seek_origin(arm.MOTOR_BASE)
+        arm.joints_goto({arm.MOTOR_BASE: 10})
+        arm.shutdown()
+        self.steps = arm.ABS_POS[arm.MOTOR_BASE]
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _restarted_arm(self, power_loss=False):
+        # the motor is still at the same place, but the chip has been reset
+        arm = SimulatedYoupiArm(logger=logger, time_scale=20, initial_positions=[10, 0, 0, 0, 0, 0], state_path=self.path)
+        if power_loss:
+            arm.power_cycle()
+        else:
+            arm.write_register(Register.ABS_POS, [0] * arm.MOTORS_COUNT)
+        arm.initialize()
+        return arm
+
+    def test_restore(self):
+        self.assertTrue(load_state(self.path)['clean_shutdown'])
+        arm = self._restarted_arm()
+        self.assertListEqual(arm.restored_motors, [arm.MOTOR_BASE])
+        self.assertEqual(arm.ABS_POS[arm.MOTOR_BASE], self.steps)
+        self.assertTrue(arm.verify_index(arm.MOTOR_BASE))
+        self.assertAlmostEqual(arm.get_joint_positions()[arm.MOTOR_BASE], 10, places=2)
+
+        # the state is not restored twice if no clean shutdown occurred
+        self.assertFalse(load_state(self.path)['clean_shutdown'])
+        arm = self._restarted_arm()
+        self.assertListEqual(arm.restored_motors, [])
+
+    def test_power_loss(self):
+        arm = self._restarted_arm(power_loss=True)
+        self.assertListEqual(arm.restored_motors, [])
+        self.assertEqual(arm.ABS_POS[arm.MOTOR_BASE], 0)
+        self.assertFalse(arm.verify_index(arm.MOTOR_BASE))
+
+
+class SimulatedProfileTestCase(unittest.TestCase):
+    def setUp(self):
+        self.arm = ClockedArm(logger=logger)
+        self.arm.initialize()
+
+    def test_trapezoidal_profile(self):
+        arm, motor = self.arm, ClockedArm.MOTOR_SHOULDER
+        settings = arm.settings[motor]
+        steps = settings.degrees_to_steps(30)
+        arm.joints_move({motor: 30}, wait=False)
+
+        status = arm.STATUS[motor]
+        self.assertFalse(status & Status.BUSY)      # BUSY flag is active low
+
+        speeds = []
+        for _ in range(300):
+            arm.advance(0.01)
+            speeds.append(arm.SPEED[motor] / SPEED_REG_FACTOR)
+            if arm.STATUS[motor] & Status.BUSY:
+                break
+        else:
+            self.fail('motion not complete')
+
+        self.assertEqual(arm.ABS_POS[motor], steps)
+        max_speed = arm.MAX_SPEED[motor] / MAX_SPEED_REG_FACTOR
+        self.assertAlmostEqual(max(speeds), max_speed, delta=1)
+        # accelerating from 0 to max speed with the ACC register setting
+        acc = settings.acc / 0.068719476736
+        full_steps = steps / float(settings.micro_steps)
+        expected = max_speed / acc + full_steps / max_speed
+        self.assertAlmostEqual(len(speeds) * 0.01, expected, delta=0.03)
+
+    def test_snapshot(self):
+        arm, motor = self.arm, ClockedArm.MOTOR_SHOULDER
+        arm.joints_move({motor: -30}, wait=False)
+        arm.advance(0.5)
+
+        snapshot = arm.snapshot()
+        self.assertEqual(snapshot.timestamp, arm.clock.now)
+        self.assertTrue(snapshot.busy[motor])
+        self.assertFalse(snapshot.busy[arm.MOTOR_BASE])
+        self.assertAlmostEqual(snapshot.positions[motor], arm.get_motor_positions()[motor], places=6)
+        self.assertLess(snapshot.positions[motor], 0)
+        settings = arm.settings[motor]
+        max_speed = settings.steps_to_degrees(arm.MAX_SPEED[motor] / MAX_SPEED_REG_FACTOR * settings.micro_steps)
+        self.assertAlmostEqual(snapshot.speeds[motor], -max_speed, delta=max_speed * 0.01)
+        self.assertListEqual(list(snapshot.faults), [0] * arm.MOTORS_COUNT)
+
+        # ABS_POS is a 22 bits two's complement value
+        snapshot = arm.decode_snapshot(0, [(1 << 22) - 1] * arm.MOTORS_COUNT, [0] * arm.MOTORS_COUNT, arm.STATUS)
+        self.assertEqual(snapshot.positions[motor], arm.settings[motor].steps_to_degrees(-1))
+
+    def _completion_times(self, motors):
+        arm, times = self.arm, {}
+        for i in range(1, 500):
+            self.arm.advance(0.01)
+            for m in motors:
+                if m not in times and arm.STATUS[m] & Status.BUSY:
+                    times[m] = i * 0.01
+            if len(times) == len(motors):
+                return times
+        self.fail('motion not complete')
+
+    def test_synchronized_moves(self):
+        arm = self.arm
+        goal = {arm.MOTOR_BASE: 20, arm.MOTOR_SHOULDER: 30, arm.MOTOR_ELBOW: 5}
+
+        arm.joints_goto(goal, wait=False)
+        times = self._completion_times(goal.keys())
+        self.assertGreater(max(times.values()) - min(times.values()), 0.1)
+
+        arm.joints_goto({m: 0 for m in goal}, wait=False, synchronized=True)
+        times = self._completion_times(goal.keys())
+        self.assertLessEqual(max(times.values()) - min(times.values()), 0.03)
+        positions = arm.get_joint_positions()
+        for m in goal:
+            self.assertAlmostEqual(positions[m], 0, places=2)
+
+        # nominal profiles are restored for the next moves
+        arm.joints_move({arm.MOTOR_ELBOW: 5}, wait=False)
+        self._completion_times([arm.MOTOR_ELBOW])
+        nominal = arm.nominal_profile_registers()
+        for m in goal:
+            if m == arm.MOTOR_ELBOW:
+                self.assertEqual(arm.MAX_SPEED[m], nominal['MAX_SPEED'][m])
+                self.assertEqual(arm.ACC[m], nominal['ACC'][m])
+            else:
+                self.assertNotEqual(arm.MAX_SPEED[m], nominal['MAX_SPEED'][m])
+
+    def test_move_duration(self):
+        arm = self.arm
+        # the elbow move is too short for reaching the maximum speed
+        goal = {arm.MOTOR_BASE: 20, arm.MOTOR_SHOULDER: 30, arm.MOTOR_ELBOW: 0.5}
+        for m, angle in goal.iteritems():
+            settings = arm.settings[m]
+            self.assertEqual(settings.move_duration(settings.degrees_to_steps(angle)),
+                             settings.move_duration(-settings.degrees_to_steps(angle)))
+
+        arm.joints_move(goal, wait=False)
+        times = self._completion_times(goal.keys())
+        for m, angle in goal.iteritems():
+            self.assertAlmostEqual(times[m], arm.joints_move_duration({m: angle}), delta=0.03)
+        self.assertEqual(arm.joints_move_duration(goal), max(arm.joints_move_duration({m: a}) for m, a in goal.iteritems()))
+
+        arm.joints_move(goal, wait=False, synchronized=True)
+        times = self._completion_times(goal.keys())
+        self.assertAlmostEqual(max(times.values()), arm.joints_move_duration(goal, synchronized=True), delta=0.03)
+
+        self.assertEqual(arm.move_duration({arm.MOTOR_BASE: 0}), 0)
+
+
+class RecordingArm(SimulatedYoupiArm):
+    """ Simulated arm recording the names of the written registers """
+    def __init__(self, *args, **kwargs):
+        super(RecordingArm, self).__init__(*args, **kwargs)
+        self.written = set()
+
+    def write_register(self, reg, values):
+        self.written.add(self._register_name(reg))
+        super(RecordingArm, self).write_register(reg, values)
+
+
+class MotionProfilesTestCase(unittest.TestCase):
+    CONFIG = {
+        'settings': {
+            'base': {'max_speed': 500},
+            'gripper': {'close_speed': 600},
+        },
+        'profiles': {
+            'fast': {
+                'base': {'max_speed': 800, 'acc': 0x200},
+                'shoulder': {'max_speed': 700},
+            },
+            'precise': {
+                'base': {'max_speed': 200, 'kval_run': 0x40},
+            },
+        },
+    }
+
+    def setUp(self):
+        self.arm = RecordingArm(logger=logger, time_scale=20)
+        self.arm.configure(self.CONFIG)
+        self.arm.initialize()
+        self.arm.written.clear()
+
+    def test_configure(self):
+        arm = self.arm
+        self.assertEqual(arm.settings[arm.MOTOR_BASE].max_speed, 500)
+        self.assertEqual(arm.settings[arm.MOTOR_GRIPPER].close_speed, 600)
+        self.assertEqual(arm.MAX_SPEED[arm.MOTOR_BASE], arm.nominal_profile_registers()['MAX_SPEED'][arm.MOTOR_BASE])
+        # the class level settings are not modified
+        self.assertEqual(SimulatedYoupiArm.settings[arm.MOTOR_BASE].max_speed, 600)
+
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp_dir, 'motors.json')
+            with open(path, 'w') as fp:
+                json.dump({'settings': {'elbow': {'dec': 0x100}}}, fp)
+            arm.configure(path)
+        finally:
+            shutil.rmtree(tmp_dir)
+        self.assertEqual(arm.written, {'DEC', 'MAX_SPEED'})
+        self.assertEqual(arm.DEC[arm.MOTOR_ELBOW], 0x100)
+        self.assertEqual(arm.settings[arm.MOTOR_BASE].max_speed, 600)
+        self.assertEqual(arm.profiles, {})
+
+    def test_use_profile(self):
+        arm = self.arm
+        slow = arm.joints_move_duration({arm.MOTOR_BASE: 90})
+
+        arm.use_profile('fast')
+        self.assertEqual(arm.profile, 'fast')
+        self.assertEqual(arm.written, {'MAX_SPEED', 'ACC'})
+        self.assertEqual(arm.ACC[arm.MOTOR_BASE], 0x200)
+        self.assertLess(arm.joints_move_duration({arm.MOTOR_BASE: 90}), slow)
+        arm.joints_move({arm.MOTOR_BASE: 20, arm.MOTOR_SHOULDER: 20})
+        self.assertEqual(list(arm.MAX_SPEED), arm.nominal_profile_registers()['MAX_SPEED'])
+
+        arm.written.clear()
+        arm.use_profile('precise')
+        self.assertEqual(arm.written, {'MAX_SPEED', 'ACC', 'KVAL_RUN'})
+        self.assertEqual(arm.ACC[arm.MOTOR_BASE], arm.settings[arm.MOTOR_BASE].acc)
+
+        arm.written.clear()
+        arm.use_profile(None)
+        self.assertIsNone(arm.profile)
+        self.assertEqual(arm.written, {'MAX_SPEED', 'KVAL_RUN'})
+        arm.written.clear()
+        arm.use_profile(None)
+        self.assertEqual(arm.written, set())
+
+    def test_synchronized_registers_restored(self):
+        arm = self.arm
+        arm.joints_move({arm.MOTOR_BASE: 20, arm.MOTOR_SHOULDER: 5}, synchronized=True)
+        arm.written.clear()
+        arm.use_profile(None)
+        self.assertIn('MAX_SPEED', arm.written)
+        nominal = arm.nominal_profile_registers()
+        for name in arm.PROFILE_REGISTERS:
+            self.assertEqual(list(getattr(arm, name)), nominal[name])
+
+    def test_derived_settings(self):
+        arm = RecordingArm(logger=logger)
+        open_steps = arm.settings[arm.MOTOR_GRIPPER].open_steps
+        arm.configure({'settings': {'gripper': {'turns': 14}}})
+        self.assertEqual(arm.settings[arm.MOTOR_GRIPPER].open_steps, open_steps // 2)
+        self.assertEqual(type(arm).settings[arm.MOTOR_GRIPPER].open_steps, open_steps)
+
+    def test_configured_snapshot(self):
+        arm = RecordingArm(logger=logger, time_scale=20)
+        arm.configure({'settings': {'base': {'micro_steps': 16}}})
+        arm.initialize()
+        arm.joints_move({arm.MOTOR_BASE: 10})
+        self.assertAlmostEqual(arm.snapshot().positions[arm.MOTOR_BASE], 10, places=1)
+        self.assertAlmostEqual(arm.get_joint_positions()[arm.MOTOR_BASE], 10, places=1)
+
+    def test_errors(self):
+        arm = self.arm
+        with self.assertRaises(ValueError):
+            arm.use_profile('unknown')
+        with self.assertRaises(ValueError):
+            arm.configure({'profiles': {'coarse': {'base': {'micro_steps': 16}}}})
+        with self.assertRaises(ValueError):
+            arm.configure({'settings': {'base': {'micro_steps': 16}}})
+        with self.assertRaises(ValueError):
+            arm.configure({'settings': {'base': {'degrees_to_steps': 1}}})
+        with self.assertRaises(ValueError):
+            arm.configure({'settings': {'thumb': {'max_speed': 100}}})
+        with self.assertRaises(ValueError):
+            arm.configure({'settings': {'gripper': {'open_steps': 1000}}})
+        self.assertEqual(sorted(arm.profiles), ['fast', 'precise'])
+
+        arm.joints_move({arm.MOTOR_BASE: 45}, wait=False)
+        with self.assertRaises(YoupiArmError):
+            arm.use_profile('fast')
+        self.assertIsNone(arm.profile)
+
+
+class WaypointsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.arm = ClockedArm(logger=logger)
+        self.arm.initialize()
+        self.elapsed = 0
+
+    def _tick(self):
+        self.arm.advance(0.01)
+        self.elapsed += 0.01
+
+    def _waypoints(self):
+        arm = self.arm
+        return [
+            {arm.MOTOR_BASE: 10, arm.MOTOR_SHOULDER: 20},
+            {arm.MOTOR_BASE: 30, arm.MOTOR_SHOULDER: 10, arm.MOTOR_ELBOW: 10},
+            {arm.MOTOR_BASE: 0, arm.MOTOR_SHOULDER: 0, arm.MOTOR_ELBOW: 0},
+        ]
+
+    def _check_positions(self, expected):
+        positions = self.arm.get_joint_positions()
+        for m, a in expected.iteritems():
+            self.assertAlmostEqual(positions[m], a, places=1)
+
+    def test_stop_at_waypoints(self):
+        arm = self.arm
+        count = arm.execute_waypoints(iter(self._waypoints()), wait_cb=self._tick)
+        self.assertEqual(count, 3)
+        self._check_positions(self._waypoints()[-1])
+        self.assertEqual(arm.completion_latency()[0], 3)
+
+    def test_timeout(self):
+        arm = self.arm
+        with self.assertRaises(CommandTimeOut) as cm:
+            arm.execute_waypoints(self._waypoints(), wait_cb=self._tick, timeout=0.05)
+        self.assertIn('waypoint 0', str(cm.exception))
+
+    def test_blend(self):
+        arm = self.arm
+        arm.execute_waypoints(self._waypoints(), wait_cb=self._tick)
+        stopping = self.elapsed
+
+        self.elapsed = 0
+        count = arm.execute_waypoints(self._waypoints(), blend=True, wait_cb=self._tick)
+        self.assertEqual(count, 3)
+        self._check_positions(self._waypoints()[-1])
+        self.assertLess(self.elapsed, stopping * 0.9)
+
+    def test_out_of_bounds(self):
+        arm = self.arm
+        waypoints = self._waypoints()[:2] + [{arm.MOTOR_SHOULDER: 500}]
+        for blend in (False, True):
+            arm.execute_waypoints([{arm.MOTOR_SHOULDER: 0}], wait_cb=self._tick)
+            with self.assertRaises(OutOfBoundError):
+                arm.execute_waypoints(waypoints, blend=blend, wait_cb=self._tick)
+            self._check_positions(waypoints[1])
+
+
+if __name__ == '__main__':
+    unittest.main()
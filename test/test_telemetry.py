@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+
+import csv
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+import numpy as np
+
+from pybot.core import log
+from pybot.youpi2.sim import SimulatedYoupiArm
+from pybot.youpi2.telemetry import TelemetryRecorder
+
+__author__ = 'Eric Pascual'
+
+logger = log.getLogger()
+
+
+class TelemetryRecorderTestCase(unittest.TestCase):
+    def setUp(self):
+        self.arm = SimulatedYoupiArm(logger=logger, time_scale=5)
+        self.arm.initialize()
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _record(self, recorder, action):
+        recorder.start()
+        try:
+            action()
+            # leave time for sampling the final state
+            time.sleep(0.05)
+        finally:
+            recorder.stop()
+
+    def test_recording(self):
+        arm = self.arm
+        recorder = TelemetryRecorder(arm, rate=200)
+        self._record(recorder, lambda: arm.joints_move({arm.MOTOR_BASE: 20}))
+
+        samples = recorder.window()
+        self.assertGreater(len(samples), 10)
+        self.assertEqual(len(samples), recorder.count)
+        self.assertTrue((np.diff(samples['timestamp']) > 0).all())
+
+        data = recorder.decode(samples)
+        positions = data['positions'][:, arm.MOTOR_BASE]
+        self.assertTrue((np.diff(positions) >= 0).all())
+        self.assertAlmostEqual(positions[-1], 20, places=2)
+        self.assertTrue(data['busy'][:, arm.MOTOR_BASE].any())
+        self.assertFalse(data['busy'][:, arm.MOTOR_SHOULDER].any())
+        self.assertGreater(data['speeds'][:, arm.MOTOR_BASE].max(), 0)
+        self.assertFalse(data['faults'].any())
+
+        snapshot = arm.snapshot()
+        self.assertEqual(tuple(data['positions'][-1]), snapshot.positions)
+
+    def test_ring_buffer(self):
+        recorder = TelemetryRecorder(self.arm, rate=500, capacity=20)
+        self._record(recorder, lambda: time.sleep(0.2))
+        self.assertGreater(recorder.count, recorder.capacity)
+
+        samples = recorder.window()
+        self.assertEqual(len(samples), recorder.capacity)
+        self.assertTrue((np.diff(samples['timestamp']) > 0).all())
+
+        start = samples['timestamp'][5]
+        self.assertEqual(len(recorder.window(start=start)), recorder.capacity - 5)
+        self.assertEqual(len(recorder.window(start=start, end=start)), 1)
+
+    def test_bus_busy(self):
+        recorder = TelemetryRecorder(self.arm, rate=200)
+
+        def hold_bus():
+            with self.arm.bus_lock:
+                time.sleep(0.1)
+
+        self._record(recorder, hold_bus)
+        self.assertGreater(recorder.skipped, 5)
+
+    def test_export(self):
+        arm = self.arm
+        recorder = TelemetryRecorder(arm, rate=200)
+        self._record(recorder, lambda: arm.joints_move({arm.MOTOR_SHOULDER: -10}))
+
+        path = os.path.join(self.tmp_dir, 'telemetry.npy')
+        count = recorder.save_npy(path)
+        loaded = np.load(path)
+        self.assertEqual(len(loaded), count)
+        self.assertTrue((loaded == recorder.window()).all())
+
+        path = os.path.join(self.tmp_dir, 'telemetry.csv')
+        count = recorder.save_csv(path)
+        with open(path) as fp:
+            rows = list(csv.reader(fp))
+        self.assertEqual(len(rows), count + 1)
+        self.assertEqual(rows[0][:4], ['timestamp', 'base_position', 'base_speed', 'base_status'])
+        self.assertAlmostEqual(float(rows[-1][1 + 3 * arm.MOTOR_SHOULDER]), -10, places=2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+
+import numpy as np
+
+from pybot.core import log
+from pybot.youpi2.kin import Kinematics
+from pybot.youpi2 import trajectory
+
+__author__ = 'Eric Pascual'
+
+logger = log.getLogger()
+
+
+class TrajectoryTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.kin = Kinematics(parent=logger)
+
+    def positions(self, poses):
+        # the goals used here being in the XZ plane, DK and IK agree on the Y sign
+        return np.array([self.kin.dk(q) for q in poses])
+
+    def test_line(self):
+        start, end = (100, 0, 50, 90), (200, 0, 150, 60)
+        poses = list(trajectory.line(self.kin, start, end, step=10))
+        self.assertEqual(len(poses), 16)
+        xyz = self.positions(poses)
+        self.assertTrue(np.allclose(xyz[0], start[:3]))
+        self.assertTrue(np.allclose(xyz[-1], end[:3]))
+        self.assertTrue(np.allclose(np.cross(xyz - start[:3], np.subtract(end[:3], start[:3])), 0, atol=1e-6))
+        pitches = [sum(q[1:]) - 90 for q in poses]
+        self.assertTrue(np.allclose(pitches, np.linspace(90, 60, 16)))
+
+    def test_temporal_resolution(self):
+        poses = list(trajectory.line(self.kin, (100, 0, 50), (200, 0, 50), speed=50, period=0.1))
+        self.assertEqual(len(poses), 21)
+        with self.assertRaises(ValueError):
+            next(trajectory.line(self.kin, (100, 0, 50), (200, 0, 50), step=1, speed=50, period=0.1))
+
+    def test_arc(self):
+        start, via, end = (150, 0, 50, 90), (100, 0, 100), (50, 0, 50, 90)
+        poses = list(trajectory.arc(self.kin, start, via, end, step=5))
+        xyz = self.positions(poses)
+        self.assertTrue(np.allclose(np.linalg.norm(xyz - (100, 0, 50), axis=1), 50))
+        self.assertTrue(np.allclose(xyz[[0, -1]], [start[:3], end[:3]]))
+        self.assertTrue((xyz[:, 2] >= 50 - 1e-6).all())
+
+    def test_aligned_arc(self):
+        with self.assertRaises(ValueError):
+            trajectory.Arc((0, 0, 0), (1, 0, 0), (2, 0, 0))
+
+    def test_polyline(self):
+        points = [(100, 0, 50), (200, 0, 50), (200, 0, 150)]
+        poses = list(trajectory.polyline(self.kin, iter(points), step=10))
+        self.assertEqual(len(poses), 21)
+        self.assertTrue(np.allclose(self.positions(poses)[[0, 10, 20]], points))
+
+    def test_fail_fast(self):
+        poses = trajectory.polyline(self.kin, [(100, 0, 50), (200, 0, 50), (1000, 0, 50)], step=10, chunk_size=4)
+        count = 0
+        with self.assertRaises(ValueError):
+            for _ in poses:
+                count += 1
+        # the chunk containing the first unreachable goal is not produced at all
+        self.assertLess(count, 11 + 4 * int(np.ceil((Kinematics.L_SEGMENT * 2 + Kinematics.L_GRIPPER) / 10)))
+        self.assertEqual(count % 4, 11 % 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
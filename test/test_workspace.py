@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from pybot.core import log
+from pybot.youpi2.kin import Kinematics
+from pybot.youpi2.workspace import WorkspaceIndex
+
+__author__ = 'Eric Pascual'
+
+logger = log.getLogger()
+
+
+class WorkspaceIndexTestCase(unittest.TestCase):
+    RESOLUTION = 40
+    PITCH_STEP = 15
+
+    @classmethod
+    def setUpClass(cls):
+        cls.kin = Kinematics(parent=logger)
+        cls.index = WorkspaceIndex.build(cls.kin, resolution=cls.RESOLUTION, pitch_step=cls.PITCH_STEP)
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'workspace.idx')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def cell_center(self, i, j, k):
+        return self.index.origin + (np.array((i, j, k)) + 0.5) * self.index.resolution
+
+    def test_reachability(self):
+        cells = self.index.cells
+        for ijk in [(0, 0, 0), tuple(s // 2 for s in cells.shape), (14, 11, 6), (20, 4, 3)]:
+            x, y, z = self.cell_center(*ijk)
+            reachable = False
+            for pitch in range(WorkspaceIndex.PITCH_MIN, WorkspaceIndex.PITCH_MAX, self.PITCH_STEP):
+                try:
+                    self.kin.ik(x, y, z, pitch)
+                except ValueError:
+                    pass
+                else:
+                    reachable = True
+                    pitch_range = self.index.pitch_range(x, y, z)
+                    self.assertTrue(pitch_range[0] <= pitch <= pitch_range[1])
+            self.assertEqual(self.index.is_reachable(x, y, z), reachable)
+
+    def test_out_of_grid(self):
+        self.assertFalse(self.index.is_reachable(0, 0, -10))
+        self.assertIsNone(self.index.pitch_range(10000, 0, 0))
+        self.assertListEqual(self.index.is_reachable([0, 10000], 0, 0).tolist(), [True, False])
+
+    def test_save_load(self):
+        self.index.save(self.path)
+        loaded = WorkspaceIndex.load(self.path)
+        self.assertEqual(loaded.shape, self.index.shape)
+        self.assertTupleEqual(loaded.signature, self.kin.model_signature())
+        self.assertTrue((loaded.cells == self.index.cells).all())
+
+    def test_open_rebuilds(self):
+        self.index.save(self.path)
+        self.assertTrue(
+            WorkspaceIndex.open(self.path, self.kin, resolution=self.RESOLUTION, pitch_step=self.PITCH_STEP)
+            .is_valid_for(self.kin, resolution=self.RESOLUTION, pitch_step=self.PITCH_STEP)
+        )
+
+        class LongerGripperKinematics(Kinematics):
+            L_GRIPPER = Kinematics.L_GRIPPER + 20
+
+        # the upper bounds grow while the lower ones are unchanged
+        bounds = np.array(WorkspaceIndex.default_bounds(self.kin), dtype=float)
+        bounds[:, 1] += 50
+        self.assertFalse(
+            self.index.is_valid_for(self.kin, bounds, resolution=self.RESOLUTION, pitch_step=self.PITCH_STEP)
+        )
+
+        kin = LongerGripperKinematics(parent=logger)
+        index = WorkspaceIndex.open(self.path, kin, resolution=self.RESOLUTION, pitch_step=self.PITCH_STEP)
+        self.assertTupleEqual(index.signature, kin.model_signature())
+        self.assertTupleEqual(WorkspaceIndex.load(self.path).signature, kin.model_signature())
+
+
+if __name__ == '__main__':
+    unittest.main()